@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Payload size, JSON parsing time, and formatting time of 'print' responses in
+the default format, the columnar format, and the columnar format with recurrent
+templates (see ``financeager.columnar``).
+
+    python benchmarks/columnar.py [--entries N] [--repeat N]
+"""
+import argparse
+import json
+import time
+
+from financeager.listing import prettify
+from financeager.period import TinyDbPeriod
+
+PERIOD = "2001"
+
+
+def populate(period, nr_entries):
+    for i in range(nr_entries):
+        period.add_entry(
+            name="entry {}".format(i % 50),
+            value=i - nr_entries // 2,
+            category="category {}".format(i % 10),
+            date="{:02d}-{:02d}".format(i % 12 + 1, i % 28 + 1))
+    for frequency in ("daily", "weekly", "monthly"):
+        period.add_entry(
+            table_name="recurrent",
+            name=frequency,
+            value=-1,
+            category="recurrent",
+            frequency=frequency,
+            start="01-01",
+            end="12-31")
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    period = TinyDbPeriod(name=PERIOD)
+    populate(period, args.entries)
+
+    print("{:>9} {:>10} {:>10} {:>10} {:>12}".format(
+        "format", "query/ms", "bytes", "parse/ms", "prettify/ms"))
+    for name, kwargs in [
+        ("json", {}),
+        ("columnar", dict(columnar=True)),
+        ("templates", dict(columnar=True, expand_recurrent=False)),
+    ]:
+        _, query_time = timed(lambda: period.get_entries(**kwargs), args.repeat)
+        body = json.dumps({"elements": period.get_entries(**kwargs)})
+        response, parse_time = timed(lambda: json.loads(body), args.repeat)
+        _, prettify_time = timed(lambda: prettify(response["elements"]),
+                                 args.repeat)
+        print("{:>9} {:10.1f} {:10d} {:10.1f} {:12.1f}".format(
+            name, 1000 * query_time, len(body), 1000 * parse_time,
+            1000 * prettify_time))
+
+    period.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""Bytes on the wire and end-to-end latency of 'print' requests with and
+without response compression. The flask app is served locally, and requests
+are sent through a TCP proxy throttling the link to the given bandwidth and
+round-trip time.
+
+    python benchmarks/compression.py [--entries N] [--bandwidth KBIT/S]
+                                     [--rtt MS] [--requests N]
+"""
+import argparse
+import socket
+import threading
+import time
+
+import requests
+
+from financeager.fflask import create_app
+from financeager.serving import ThreadingWSGIServer
+
+PERIOD = "2000"
+
+
+class ThrottlingProxy:
+    """TCP proxy forwarding connections to 'target' (host, port). Data sent to
+    the client is delayed according to 'bandwidth' (bytes per second) and
+    half the round-trip time 'rtt' (seconds), and counted.
+    """
+
+    def __init__(self, target, bandwidth, rtt):
+        self.target = target
+        self.bandwidth = bandwidth
+        self.rtt = rtt
+        self.bytes_received = 0
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.address = self.sock.getsockname()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.sock.accept()
+            upstream = socket.create_connection(self.target)
+            threading.Thread(
+                target=self._pipe, args=(client, upstream, False),
+                daemon=True).start()
+            threading.Thread(
+                target=self._pipe, args=(upstream, client, True),
+                daemon=True).start()
+
+    def _pipe(self, source, destination, throttle):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if throttle:
+                    self.bytes_received += len(data)
+                    time.sleep(len(data) / self.bandwidth)
+                time.sleep(self.rtt / 2)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            destination.close()
+
+
+def populate(url, nr_entries):
+    commands = []
+    for i in range(nr_entries):
+        commands.append({
+            "command": "add",
+            "name": "entry {}".format(i),
+            "value": i - nr_entries // 2,
+            "category": "category {}".format(i % 10),
+            "date": "{:02d}-{:02d}".format(i % 12 + 1, i % 28 + 1),
+            "period": PERIOD,
+        })
+    commands.append({
+        "command": "add",
+        "name": "rent",
+        "value": -500,
+        "table_name": "recurrent",
+        "frequency": "weekly",
+        "start": "01-01",
+        "period": PERIOD,
+    })
+    requests.post(url + "/periods/batch", json={"commands": commands})
+
+
+def measure(proxy, url, accept_encoding, nr_requests):
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = accept_encoding
+    proxy.bytes_received = 0
+
+    start = time.perf_counter()
+    for _ in range(nr_requests):
+        response = session.get(url)
+        response.json()
+    latency = (time.perf_counter() - start) / nr_requests
+    session.close()
+    return proxy.bytes_received / nr_requests, latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument(
+        "--bandwidth", type=float, default=8000, help="in kbit/s")
+    parser.add_argument("--rtt", type=float, default=20, help="in ms")
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    for level in (0, 1, 6, 9):
+        server = ThreadingWSGIServer(("127.0.0.1", 0))
+        server.set_app(create_app(config={"COMPRESSION_LEVEL": level}))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        server_url = "http://{}:{}".format(*server.server_address)
+        populate(server_url, args.entries)
+
+        proxy = ThrottlingProxy(server.server_address,
+                                args.bandwidth * 1000 / 8, args.rtt / 1000)
+        url = "http://{}:{}/periods/{}".format(*proxy.address, PERIOD)
+        for encoding in ("identity", "gzip", "deflate"):
+            if level == 0 and encoding != "identity":
+                continue
+            results[(level, encoding)] = measure(proxy, url, encoding,
+                                                 args.requests)
+
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    print("{:>5} {:>8} {:>12} {:>12}".format("level", "encoding", "bytes",
+                                             "latency/ms"))
+    for (level, encoding), (nr_bytes, latency) in results.items():
+        print("{:5d} {:>8} {:12.0f} {:12.1f}".format(level, encoding, nr_bytes,
+                                                     1000 * latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Startup cost of the command line interface. The CLI is run in a fresh
+interpreter with `-X importtime` for several command lines, and the total
+import time, the number of imported modules, and the heavy dependencies that
+were loaded are reported (median of several runs).
+
+    python benchmarks/importtime.py [--runs N] [--top N]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Dependencies that should only be imported by the backend that needs them
+HEAVY_PACKAGES = ("requests", "urllib3", "tinydb", "schematics", "dateutil",
+                  "flask", "flask_restful", "werkzeug")
+
+COMMAND_LINES = (
+    ("import", ["-c", "import financeager.cli"]),
+    ("--version", ["-m", "financeager.cli", "--version"]),
+    ("--help", ["-m", "financeager.cli", "--help"]),
+    ("print --help", ["-m", "financeager.cli", "print", "--help"]),
+)
+
+
+def import_times(arguments):
+    """Run the interpreter with the given arguments and return dict mapping
+    the names of imported modules to tuples of self and cumulative import time
+    (microseconds), and the names of the top-level imports.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+
+    modules = {}
+    top_level = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_time), int(cumulative))
+        if not name[1:].startswith(" "):
+            top_level.append(name.strip())
+    return modules, top_level
+
+
+def measure(arguments, nr_runs):
+    totals = []
+    for _ in range(nr_runs):
+        modules, top_level = import_times(arguments)
+        totals.append(sum(modules[name][1] for name in top_level))
+
+    heavy = sorted({
+        name.split(".")[0]
+        for name in modules if name.split(".")[0] in HEAVY_PACKAGES
+    })
+    return statistics.median(totals), len(modules), heavy, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="list the financeager modules with the largest cumulative import "
+        "time")
+    args = parser.parse_args()
+
+    print("{:>14} {:>10} {:>8}  {}".format("command line", "import/ms",
+                                           "modules", "heavy dependencies"))
+    for label, arguments in COMMAND_LINES:
+        total, nr_modules, heavy, modules = measure(arguments, args.runs)
+        print("{:>14} {:10.1f} {:8d}  {}".format(
+            label, total / 1000, nr_modules, ", ".join(heavy) or "-"))
+
+        own_modules = sorted(
+            (m for m in modules if m.startswith("financeager")),
+            key=lambda m: modules[m][1],
+            reverse=True)
+        for name in own_modules[:args.top]:
+            print("{:>14} {:10.1f}  {}".format("", modules[name][1] / 1000,
+                                               name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Multithreaded stress test of the financeager Server. A period is populated
+with standard and recurrent entries. Then read-heavy traffic (mostly 'print' and
+'get', occasionally 'add') is run from an increasing number of threads, and the
+total throughput is reported.
+
+    python benchmarks/server_threads.py [--data-dir DIR] [--requests N]
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+from financeager.server import Server
+
+PERIOD = "2000"
+
+
+def populate(server, nr_entries):
+    for i in range(nr_entries):
+        server.run(
+            "add",
+            name="entry {}".format(i),
+            value=i - nr_entries // 2,
+            category="category {}".format(i % 10),
+            date="{:02d}-{:02d}".format(i % 12 + 1, i % 28 + 1),
+            period=PERIOD)
+    server.run(
+        "add",
+        name="rent",
+        value=-500,
+        table_name="recurrent",
+        frequency="monthly",
+        start="01-01",
+        period=PERIOD)
+
+
+def traffic(server, nr_requests, nr_entries):
+    for i in range(nr_requests):
+        if i % 20 == 0:
+            server.run("add", name="coffee", value=-2, period=PERIOD)
+        elif i % 2:
+            server.run("print", period=PERIOD, filters={"category": "1"})
+        else:
+            server.run("get", eid=i % nr_entries + 1, period=PERIOD)
+
+
+def measure(server, nr_threads, nr_requests, nr_entries):
+    threads = [
+        threading.Thread(
+            target=traffic,
+            args=(server, nr_requests // nr_threads, nr_entries))
+        for _ in range(nr_threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return nr_requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="financeager-") as tmp_dir:
+        server = Server(data_dir=args.data_dir or tmp_dir)
+        populate(server, args.entries)
+
+        for nr_threads in (1, 2, 4, 8, 16):
+            throughput = measure(server, nr_threads, args.requests,
+                                 args.entries)
+            print("{:2d} threads: {:8.1f} requests/s".format(
+                nr_threads, throughput))
+
+        server.run("stop")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,9 @@ import sys
 from datetime import datetime as dt
 import csv
 
-from financeager.cli import run
-from financeager import PERIOD_DATE_FORMAT
+from financeager import PERIOD_DATE_FORMAT, CONFIG_FILEPATH, communication
+from financeager.config import Configuration
+from financeager.rules import Categorizer, Rule
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 data_file = sys.argv[1]
@@ -36,7 +37,14 @@ trigger_words = [
 # category if you don't want the default category to be assigned
 categories = {}
 
+# match all trigger words in a single pass over the name. Rules can also be
+# read from a file, see Categorizer.from_file
+categorizer = Categorizer(
+    Rule(pattern=word, name=word, category=categories.get(word, "groceries"))
+    for word in trigger_words)
+
 entries_rest = []
+commands = []
 
 for row in data:
     try:
@@ -50,21 +58,30 @@ for row in data:
     date = dt.strptime(row["Buchungstag"], "%d.%m.%y")
     month_day = date.strftime(PERIOD_DATE_FORMAT)
 
-    for word in trigger_words:
-        if word in name:
-            print("{} {}: {}".format(month_day, word, value))
-            run(command="add",
-                name=word,
+    rule = categorizer.match(name)
+    if rule is not None:
+        print("{} {}: {}".format(month_day, rule.name, value))
+        commands.append(
+            dict(
+                command="add",
+                name=rule.name,
                 value=value,
                 date=month_day,
                 period=date.year,
-                category=categories.get(word, "groceries"))
-            break
+                category=rule.category))
     else:
         entries_rest.append((month_day, name, value))
 
 f.close()
 
+# send all entries to the webservice in a single request
+configuration = Configuration(
+    filepath=CONFIG_FILEPATH if os.path.exists(CONFIG_FILEPATH) else None)
+proxy = communication.module("flask").proxy(
+    http_config=configuration.get_option("SERVICE:FLASK"))
+for response in communication.run_many(proxy, commands):
+    print(response)
+
 # show anything that was not added
 if entries_rest:
     print(80 * "=")
@@ -20,15 +20,40 @@ CONFIG_DIR = os.path.expanduser("~/.config/financeager")
 DATA_DIR = os.path.expanduser("~/.local/share/financeager")
 
 CONFIG_FILEPATH = os.path.join(CONFIG_DIR, "config")
-OFFLINE_FILEPATH = os.path.join(DATA_DIR, "offline.json")
+OFFLINE_FILEPATH = os.path.join(DATA_DIR, "offline.jsonl")
 
 # URL endpoints
 PERIODS_TAIL = "/periods"
 COPY_TAIL = PERIODS_TAIL + "/copy"
+BATCH_TAIL = PERIODS_TAIL + "/batch"
 
 # HTTP communication defaults
 DEFAULT_HOST = "http://127.0.0.1:5000"
 DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+
+# Seconds after which the daemon of the 'none' backend exits if no client is
+# connected
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Defaults for 'serve' options
+DEFAULT_SERVE_HOST = "127.0.0.1"
+DEFAULT_SERVE_PORT = 5000
+DEFAULT_BACKLOG = 128
+DEFAULT_KEEP_ALIVE = 5.0
+
+# Default number of threads running Server commands in the asyncio frontend
+DEFAULT_THREADS = 8
+
+# Default compression level (1: fastest, 9: smallest; 0 disables compression)
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Bodies smaller than this number of bytes are not compressed since the
+# overhead outweighs the savings
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+
+# Maximum number of bytes of a request body, before and after decompression
+DEFAULT_MAX_BODY_SIZE = 16 * 1024 * 1024
 
 
 def default_period_name():
@@ -77,3 +102,7 @@ def make_log_stream_handler_verbose():
     """Make handler show debug messages using more informative format."""
     _stream_handler.setLevel(DEBUG)
     _stream_handler.setFormatter(FORMATTER)
+
+
+# Imported last since the client depends on the constants above
+from .client import Client  # noqa
@@ -0,0 +1,460 @@
+"""Asyncio-based HTTP frontend providing the same REST API as the flask app (see
+``fflask`` and ``resources``). Connections are handled by coroutines, hence a
+single process can keep thousands of idle connections open. The blocking
+``Server`` commands are run in a bounded thread pool.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import http
+import json
+import os
+import signal
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from . import PERIODS_TAIL, COPY_TAIL, BATCH_TAIL, init_logger,\
+    setup_log_file_handler
+from . import (DEFAULT_THREADS, DEFAULT_KEEP_ALIVE, DEFAULT_COMPRESSION_LEVEL,
+               DEFAULT_COMPRESSION_MIN_SIZE, DEFAULT_MAX_BODY_SIZE)
+from .server import Server, check_filters
+from .compression import (compress_response, decompress, DecompressionError,
+                          BodyTooLargeError)
+from .exporting import MIMETYPES
+from .resources import (copy_parser, put_parser, update_parser, batch_parser,
+                        print_arguments, export_arguments, validator_headers,
+                        is_not_modified)
+
+logger = init_logger(__name__)
+
+# Limits for parsing the request head
+MAX_LINE_LENGTH = 65536
+MAX_HEADERS = 100
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncApp:
+    """Handler of HTTP/1.1 connections dispatching requests to the Server.
+
+    A connection is kept open until the client closes it, or no new request
+    arrives within 'keep_alive' seconds. Persistent connections are disabled if
+    'keep_alive' is zero.
+    Request bodies are decompressed according to their Content-Encoding, and
+    responses are compressed as negotiated (see ``compression``). Bodies of
+    more than 'max_body_size' bytes, before or after decompression, are
+    rejected.
+    """
+
+    def __init__(self,
+                 server,
+                 threads=DEFAULT_THREADS,
+                 keep_alive=DEFAULT_KEEP_ALIVE,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 compression_min_size=DEFAULT_COMPRESSION_MIN_SIZE,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE):
+        self.server = server
+        self.keep_alive = keep_alive
+        self.compression_level = compression_level
+        self.compression_min_size = compression_min_size
+        self.max_body_size = max_body_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="financeager")
+        # Futures of all open connections, resolved when the connection is
+        # closed, and writers of connections waiting for a request
+        self._connections = set()
+        self._idle_writers = set()
+        self._closing = False
+
+    async def serve(self, sock, stopped=None):
+        """Serve connections accepted from the listening socket until the
+        asyncio event 'stopped' is set. If not given, the event is set when
+        SIGTERM or SIGINT is received.
+        Idle connections are closed on shutdown; requests in process are
+        completed.
+        """
+        if stopped is None:
+            stopped = asyncio.Event()
+            loop = asyncio.get_event_loop()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(signum, stopped.set)
+
+        server = await asyncio.start_server(
+            self.handle_connection, sock=sock, limit=MAX_LINE_LENGTH)
+        await stopped.wait()
+
+        server.close()
+        self._closing = True
+        for writer in self._idle_writers:
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await server.wait_closed()
+
+    def close(self):
+        """Wait for pending Server commands and close the periods."""
+        self._executor.shutdown(wait=True)
+        self.server.run("stop")
+
+    async def handle_connection(self, reader, writer):
+        closed = asyncio.get_event_loop().create_future()
+        self._connections.add(closed)
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError):
+            pass
+        finally:
+            self._connections.discard(closed)
+            writer.close()
+            closed.set_result(None)
+
+    async def _handle_request(self, reader, writer):
+        """Read and respond to a single request.
+
+        :return: whether the connection is kept open
+        """
+        self._idle_writers.add(writer)
+        try:
+            request_line = await asyncio.wait_for(reader.readline(),
+                                                  self.keep_alive or None)
+        finally:
+            self._idle_writers.discard(writer)
+
+        if not request_line:
+            return False
+
+        try:
+            method, target, version, headers = await self._read_head(
+                request_line, reader)
+
+            if "transfer-encoding" in headers:
+                raise _HTTPError(501, "Transfer-Encoding not supported")
+            try:
+                length = int(headers.get("content-length") or 0)
+                if length < 0:
+                    raise ValueError
+            except ValueError:
+                raise _HTTPError(400, "Invalid Content-Length")
+            if length > self.max_body_size:
+                raise _HTTPError(
+                    413, "Body exceeds {} bytes".format(self.max_body_size))
+            body = await reader.readexactly(length)
+            try:
+                body = decompress(body, headers.get("content-encoding"),
+                                  self.max_body_size)
+            except DecompressionError as e:
+                raise _HTTPError(400, str(e))
+            except BodyTooLargeError as e:
+                raise _HTTPError(413, str(e))
+        except _HTTPError as e:
+            await self._respond(writer, e.status, _encode({"error": str(e)}),
+                                False)
+            return False
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+
+        status, response_body, response_headers = await self.dispatch(
+            method, target, headers, body)
+
+        if self.compression_level and \
+                len(response_body) >= self.compression_min_size:
+            # Compressing might be expensive for large responses
+            response_body, encoding = \
+                await asyncio.get_event_loop().run_in_executor(
+                    self._executor, compress_response, response_body,
+                    headers.get("accept-encoding"), self.compression_level,
+                    self.compression_min_size)
+            if encoding is not None:
+                response_headers = dict(
+                    response_headers, **{
+                        "Content-Encoding": encoding,
+                        "Vary": "Accept-Encoding"
+                    })
+
+        keep_alive = keep_alive and bool(self.keep_alive) and \
+            not self._closing
+        await self._respond(writer, status, response_body, keep_alive,
+                            response_headers)
+        return keep_alive
+
+    @staticmethod
+    async def _read_head(request_line, reader):
+        """Parse request line and read headers.
+
+        :return: tuple of method, request target, HTTP version, and dict of
+            headers with lower-case names
+        :raise: _HTTPError if the request head is malformed
+        """
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise _HTTPError(400, "Bad request line")
+        if not version.startswith("HTTP/1."):
+            raise _HTTPError(505, "HTTP version not supported")
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise _HTTPError(431, "Header line too long")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) == MAX_HEADERS:
+                raise _HTTPError(431, "Too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        return method, target, version, headers
+
+    @staticmethod
+    async def _respond(writer, status, body, keep_alive, headers=None):
+        head = [
+            "HTTP/1.1 {} {}".format(status,
+                                    http.HTTPStatus(status).phrase),
+        ]
+        headers = headers or {}
+        if status != 304:
+            if "Content-Type" not in headers:
+                head.append("Content-Type: application/json")
+            head.append("Content-Length: {}".format(len(body)))
+        for name, value in headers.items():
+            head.append("{}: {}".format(name, value))
+        if not keep_alive:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, headers, body):
+        """Route the request to the Server command corresponding to the
+        endpoint, and run it.
+
+        :param headers: dict of request headers with lower-case names
+        :return: tuple of status code, encoded response body, and dict of
+            response headers
+        """
+        url = urlsplit(target)
+        path = unquote(url.path)
+        logger.debug("Dispatching {} {} holding {}".format(
+            method, target, body))
+
+        try:
+            # Arguments may be given in the query string or in the JSON body,
+            # where the latter takes precedence
+            query_items = parse_qsl(url.query, keep_blank_values=True)
+            data = dict(query_items)
+            if body:
+                try:
+                    content = json.loads(body.decode())
+                    if method == "GET" and isinstance(content, str):
+                        # Filters of the print command are sent JSON-encoded
+                        # (see httprequests)
+                        content = json.loads(content)
+                except ValueError:
+                    raise _HTTPError(400, "Invalid JSON body")
+                if isinstance(content, dict):
+                    data.update(content)
+
+            return await self._route(method, path, data, query_items, headers)
+        except _HTTPError as e:
+            return e.status, _encode({"error": str(e)}), {}
+
+    async def _route(self, method, path, data, query_items, headers):
+        if path == PERIODS_TAIL:
+            _check_method(method, "POST")
+            return await self.run_safely("list")
+
+        if path == COPY_TAIL:
+            _check_method(method, "POST")
+            return await self.run_safely(
+                "copy", error_code=404, **_parse_arguments(copy_parser, data))
+
+        if path == BATCH_TAIL:
+            _check_method(method, "POST")
+            return await self.run_safely(
+                "batch", error_code=400, **_parse_arguments(batch_parser, data))
+
+        if not path.startswith(PERIODS_TAIL + "/"):
+            raise _HTTPError(404, "Not found")
+
+        segments = path[len(PERIODS_TAIL) + 1:].split("/")
+        if len(segments) == 1 and segments[0]:
+            period_name = segments[0]
+            _check_method(method, "GET", "POST")
+            if method == "GET":
+                kwargs = {k: v for k, v in data.items() if k == "filters"}
+                try:
+                    kwargs.update(print_arguments(query_items))
+                    check_filters(kwargs.get("filters"))
+                except ValueError as e:
+                    raise _HTTPError(400, str(e))
+                loop = asyncio.get_event_loop()
+                return await loop.run_in_executor(
+                    self._executor, self._print, period_name, kwargs,
+                    headers.get("if-none-match"),
+                    headers.get("if-modified-since"))
+            return await self.run_safely(
+                "add",
+                error_code=400,
+                period=period_name,
+                **_parse_arguments(put_parser, data))
+
+        if len(segments) == 2 and segments[0] and segments[1] == "export":
+            _check_method(method, "GET")
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, self._export,
+                                              segments[0], query_items)
+
+        if len(segments) == 3 and all(segments):
+            period_name, table_name, eid = segments
+            _check_method(method, "GET", "DELETE", "PATCH")
+            kwargs = dict(period=period_name, table_name=table_name, eid=eid)
+            if method == "GET":
+                return await self.run_safely("get", error_code=404, **kwargs)
+            if method == "DELETE":
+                return await self.run_safely("rm", error_code=404, **kwargs)
+            kwargs.update(_parse_arguments(update_parser, data))
+            return await self.run_safely("update", error_code=400, **kwargs)
+
+        raise _HTTPError(404, "Not found")
+
+    async def run_safely(self, command, error_code=500, **kwargs):
+        """Run command on the server in the thread pool. Analogous to
+        ``resources.LogResource.run_safely``.
+
+        :return: tuple of status code, encoded response body, and dict of
+            response headers
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._run_command,
+                                          command, error_code, kwargs)
+
+    def _run_command(self, command, error_code, kwargs):
+        # Executed in the thread pool, including the JSON encoding which might
+        # be expensive for large responses (see ``Server.run_serialized``)
+        try:
+            body, error = self.server.run_serialized(command, **kwargs)
+            return error_code if error else 200, body, {}
+        except Exception:
+            logger.exception("Unexpected error")
+            return 500, _encode({"error": "unexpected error"}), {}
+
+    def _export(self, period_name, query_items):
+        # Executed in the thread pool. Unlike ``resources.ExportResource``, the
+        # lines are collected since responses are sent with Content-Length
+        try:
+            kwargs = export_arguments(query_items)
+            lines = self.server.export(period=period_name, **kwargs)
+            body = "".join(lines).encode()
+        except ValueError as e:
+            return 400, _encode({"error": str(e)}), {}
+        except Exception:
+            logger.exception("Unexpected error")
+            return 500, _encode({"error": "unexpected error"}), {}
+        return 200, body, {
+            "Content-Type": MIMETYPES[kwargs.get("format", "csv")]
+        }
+
+    def _print(self, period_name, kwargs, if_none_match, if_modified_since):
+        # Executed in the thread pool. Conditional requests are answered
+        # analogous to ``resources.PeriodResource.get``
+        try:
+            etag, last_modified = self.server.period_validators(period_name)
+        except Exception:
+            logger.exception("Unexpected error")
+            return 500, _encode({"error": "unexpected error"}), {}
+
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(etag, last_modified, if_none_match,
+                           if_modified_since):
+            return 304, b"", headers
+
+        status, body, _ = self._run_command("print", 400,
+                                            dict(kwargs, period=period_name))
+        return status, body, headers if status == 200 else {}
+
+
+def _encode(content):
+    return json.dumps(content).encode()
+
+
+def _check_method(method, *allowed_methods):
+    if method not in allowed_methods:
+        raise _HTTPError(405, "Method not allowed")
+
+
+def _parse_arguments(parser, data):
+    """Validate and convert the request data according to the arguments of the
+    given ``reqparse.RequestParser``, such that commands receive the same
+    arguments as from the flask app.
+
+    :raise: _HTTPError if a required argument is missing or has invalid type
+    """
+    arguments = {}
+    for argument in parser.args:
+        value = data.get(argument.name)
+        if value is None:
+            if argument.required:
+                raise _HTTPError(
+                    400,
+                    "Missing required parameter '{}'".format(argument.name))
+        else:
+            try:
+                value = argument.type(value)
+            except (TypeError, ValueError):
+                raise _HTTPError(
+                    400, "Invalid value for parameter '{}': {}".format(
+                        argument.name, value))
+        arguments[argument.name] = value
+    return arguments
+
+
+def create_app(data_dir=None,
+               threads=DEFAULT_THREADS,
+               keep_alive=DEFAULT_KEEP_ALIVE,
+               compression_level=DEFAULT_COMPRESSION_LEVEL,
+               compression_min_size=DEFAULT_COMPRESSION_MIN_SIZE,
+               max_body_size=DEFAULT_MAX_BODY_SIZE):
+    """Create asyncio app holding an instance of 'server.Server'. 'data_dir' is
+    treated as in ``fflask.create_app``.
+    """
+    setup_log_file_handler()
+
+    data_dir = data_dir or os.environ.get("FINANCEAGER_DATA_DIR")
+    if data_dir is None:
+        logger.warning("'data_dir' not given. Application data is stored in "
+                       "memory and is lost when the app terminates.")
+    else:
+        os.makedirs(data_dir, exist_ok=True)
+
+    server = Server(data_dir=data_dir)
+    logger.debug(
+        "Started financeager server with data dir '{}'".format(data_dir))
+    return AsyncApp(
+        server,
+        threads=threads,
+        keep_alive=keep_alive,
+        compression_level=compression_level,
+        compression_min_size=compression_min_size,
+        max_body_size=max_body_size)
+
+
+def serve_socket(sock, data_dir=None, **kwargs):
+    """Serve the asyncio app on the listening socket until SIGTERM or SIGINT is
+    received. The periods are closed on shutdown. Kwargs are passed to
+    ``create_app``.
+    """
+    app = create_app(data_dir=data_dir, **kwargs)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app.serve(sock))
+    finally:
+        loop.close()
+        app.close()
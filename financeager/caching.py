@@ -0,0 +1,134 @@
+"""Caching utilities for the server-side read path."""
+from collections import OrderedDict
+import threading
+
+
+class ResultCache:
+    """Thread-safe LRU cache of command results with a bounded number of items.
+
+    Keys are tuples whose first item is the period name, such that all results
+    of a period can be invalidated at once. Hits and misses are counted.
+    """
+
+    def __init__(self, maxsize=128):
+        """:param maxsize: maximum number of cached results. Caching is
+            disabled if zero
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """Return the result cached under 'key' and mark it as most recently
+        used, or None if not cached.
+        """
+        with self._lock:
+            try:
+                result = self._items[key]
+            except KeyError:
+                self._misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def put(self, key, result):
+        """Cache the result under 'key'. The least recently used result is
+        evicted if the cache is full.
+        """
+        if not self.maxsize:
+            return
+
+        with self._lock:
+            self._items[key] = result
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, period_name):
+        """Remove all results of the given period."""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == period_name]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def info(self):
+        """Return dict of the metrics 'hits', 'misses', 'evictions', 'size',
+        and 'maxsize'.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+            }
+
+
+class _Call:
+    """Computation in flight, shared by all callers of the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalescing of concurrent identical computations. While a computation is
+    in flight, callers of the same key wait for it and share its result (or
+    exception) instead of computing it again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._computed = 0
+        self._shared = 0
+
+    def do(self, key, function):
+        """Return the result of calling 'function', or of the identical call
+        currently in flight.
+
+        :raise: the exception raised by 'function'
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._computed += 1
+            else:
+                self._shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def info(self):
+        """Return dict of the metrics 'computed' (number of computations) and
+        'shared' (number of calls that waited for a computation in flight).
+        """
+        with self._lock:
+            return {"computed": self._computed, "shared": self._shared}
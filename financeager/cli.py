@@ -2,14 +2,19 @@
 """Command line interface of financeager application."""
 
 import argparse
+from collections import OrderedDict
 import os
+import shlex
 import sys
+import time
 
 from financeager import offline, communication, __version__,\
-    init_logger, make_log_stream_handler_verbose, setup_log_file_handler
+    init_logger, make_log_stream_handler_verbose, setup_log_file_handler,\
+    DEFAULT_TABLE
 import financeager
 from .entries import CategoryEntry
 from .listing import Listing
+from .client import Client
 from .config import Configuration
 from .exceptions import PreprocessingError, InvalidRequest, CommunicationError,\
     OfflineRecoveryError, InvalidConfigError
@@ -42,47 +47,118 @@ def run(command=None, config_filepath=None, verbose=False, **cl_kwargs):
     "champagne", "value": "99"}. All kwargs are passed to 'communication.run()'.
     'config' specifies the path to a custom config file (optional). If 'verbose'
     is set, debug level log messages are printed to the terminal.
+    This is a thin wrapper around ``Client``, logging formatted responses. For
+    many operations, or structured results, use a ``Client`` directly.
 
     :return: UNIX return code (zero for success, non-zero otherwise)
     """
     if verbose:
         make_log_stream_handler_verbose()
 
-    exit_code = FAILURE
+    if command == "serve":
+        # Imported here to avoid loading flask for any other command
+        from .serving import serve
+        return serve(**cl_kwargs)
 
-    if config_filepath is None and os.path.exists(financeager.CONFIG_FILEPATH):
-        config_filepath = financeager.CONFIG_FILEPATH
     try:
-        configuration = Configuration(filepath=config_filepath)
+        configuration = _load_configuration(config_filepath)
     except InvalidConfigError as e:
         logger.error("Invalid configuration: {}".format(e))
         return FAILURE
 
-    backend_name = configuration.get_option("SERVICE", "name")
-    communication_module = communication.module(backend_name)
+    with Client(configuration) as client:
+        if command == "shell":
+            return shell(client)
+        return _run_command(client, command, **cl_kwargs)
+
+
+def shell(client):
+    """Read commands from stdin and run them on the given client, until 'exit'
+    or EOF. The commands follow the command line grammar without the program
+    name (e.g. 'add beer -2'). Since the client is kept across commands, the
+    databases of the 'none' backend remain open. The duration of each command
+    is shown.
+
+    :return: UNIX return code of the last command
+    """
+    exit_code = SUCCESS
+    prompt = "financeager> " if sys.stdin.isatty() else ""
+
+    while True:
+        try:
+            line = input(prompt)
+        except EOFError:
+            break
+
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            logger.error(e)
+            continue
+        if not args:
+            continue
+        if args[0] in ("exit", "quit"):
+            break
+
+        try:
+            cl_kwargs = _parse_command(args)
+        except SystemExit:
+            # Invalid arguments or help message
+            continue
+
+        command = cl_kwargs.pop("command")
+        cl_kwargs.pop("config_filepath", None)
+        if cl_kwargs.pop("verbose", False):
+            make_log_stream_handler_verbose()
+        if command in ("serve", "shell"):
+            logger.error("Command '{}' not available in shell.".format(command))
+            continue
+
+        start = time.perf_counter()
+        exit_code = _run_command(client, command, **cl_kwargs)
+        logger.info("({:.1f} ms)".format(1000 * (time.perf_counter() - start)))
+
+    return exit_code
+
+
+def _load_configuration(config_filepath=None):
+    """Load the configuration from the given file, or from the default config
+    file if existing.
+
+    :raises: InvalidConfigError
+    """
+    if config_filepath is None and os.path.exists(financeager.CONFIG_FILEPATH):
+        config_filepath = financeager.CONFIG_FILEPATH
+    return Configuration(filepath=config_filepath)
 
-    proxy_kwargs = {}
-    if backend_name == "flask":
-        init_logger("urllib3")
-        proxy_kwargs["http_config"] = configuration.get_option("SERVICE:FLASK")
-    else:  # 'none' is the only other option
-        proxy_kwargs["data_dir"] = financeager.DATA_DIR
+
+def _run_command(client, command, **cl_kwargs):
+    """Run the command on the client and log the formatted response. If the
+    command fails due to a communication error, it is stored offline.
+
+    :return: UNIX return code
+    """
+    if command == "import":
+        return _import(client, **cl_kwargs)
+    if command == "export":
+        return _export(client, **cl_kwargs)
+
+    exit_code = FAILURE
 
     # Indicate whether to store request offline, if failed
     store_offline = False
 
-    proxy = communication_module.proxy(**proxy_kwargs)
-
+    configuration = client.configuration
     try:
         logger.info(
             communication.run(
-                proxy,
+                client,
                 command,
                 default_category=configuration.get_option(
                     "FRONTEND", "default_category"),
                 date_format=configuration.get_option("FRONTEND", "date_format"),
                 **cl_kwargs))
-        if offline.recover(proxy):
+        if offline.recover(client):
             logger.info("Recovered offline backup.")
         exit_code = SUCCESS
     except OfflineRecoveryError:
@@ -100,14 +176,98 @@ def run(command=None, config_filepath=None, verbose=False, **cl_kwargs):
     if store_offline and offline.add(command, **cl_kwargs):
         logger.info("Stored '{}' request in offline backup.".format(command))
 
-    if backend_name == "none":
-        communication.run(proxy, "stop")
-
     return exit_code
 
 
+def _import(client, filepath, encoding="utf-8", rules=None, **options):
+    """Import the entries of the CSV file and log a summary, including skipped
+    rows and failed batches. Entries are categorized according to the
+    optional rules file. If reconciling, probable matches of existing entries
+    are listed (as well as duplicates, for a dry run).
+
+    :return: UNIX return code (non-zero if a batch failed)
+    """
+    try:
+        if rules is not None:
+            from .rules import Categorizer
+            options["categorizer"] = Categorizer.from_file(rules)
+        with open(filepath, encoding=encoding, newline="") as file:
+            stats = client.import_csv(file, **options)
+    except (OSError, UnicodeDecodeError, PreprocessingError, InvalidRequest,
+            CommunicationError) as e:
+        logger.error(e)
+        return FAILURE
+
+    for line, error in stats["skipped"]:
+        logger.error("Skipped line {}: {}".format(line, error))
+    for error in stats["failed"]:
+        logger.error("Failed: {}".format(error))
+
+    dry_run = options.get("dry_run", False)
+    matches = [("probable match", m) for m in stats.get("probable", [])]
+    if dry_run:
+        matches += [("duplicate", m) for m in stats["duplicates"]]
+    for kind, (line, table_name, eid, name) in sorted(
+            matches, key=lambda m: m[1][0]):
+        logger.info("Line {}: {} of {}element {} ({})".format(
+            line, kind, "" if table_name == DEFAULT_TABLE else table_name + " ",
+            eid, name))
+
+    if dry_run:
+        logger.info("Dry run: {} new, {} duplicate, {} probable match of {} "
+                    "rows.".format(stats["new"], len(stats["duplicates"]),
+                                   len(stats["probable"]), stats["rows"]))
+        return SUCCESS
+
+    periods = ", ".join(
+        "{} in {}".format(n, p) for p, n in sorted(stats["periods"].items()))
+    logger.info("Imported {} of {} rows{} ({:.0f} rows/s).".format(
+        stats["imported"], stats["rows"],
+        " ({})".format(periods) if periods else "", stats["rows_per_second"]))
+    if stats.get("duplicates"):
+        logger.info("Skipped {} duplicate(s).".format(len(stats["duplicates"])))
+    return FAILURE if stats["failed"] else SUCCESS
+
+
+def _export(client,
+            output=None,
+            filters=None,
+            recurrent_templates=False,
+            **options):
+    """Write the entries of the period to the output file (default: stdout) in
+    the given format. Only errors are logged when writing to stdout.
+
+    :return: UNIX return code
+    """
+    try:
+        if filters is not None:
+            data = {"filters": filters}
+            communication._preprocess(data)
+            options["filters"] = data["filters"]
+
+        kwargs = dict(options, expand_recurrent=not recurrent_templates)
+        if output is None:
+            client.export(sys.stdout, **kwargs)
+        else:
+            with open(output, "w", newline="") as file:
+                client.export(file, **kwargs)
+            logger.info("Exported to {}.".format(output))
+    except (OSError, PreprocessingError, InvalidRequest,
+            CommunicationError) as e:
+        logger.error(e)
+        return FAILURE
+    return SUCCESS
+
+
 def _parse_command(args=None):
-    """Parse the given list of args and return the result as dict."""
+    """Parse the given list of args (default: command line arguments) and
+    return the result as dict.
+
+    All subparsers are registered for the help message, but only the one of the
+    selected subcommand is populated with arguments.
+    """
+    if args is None:
+        args = sys.argv[1:]
 
     parser = argparse.ArgumentParser(
         description="An application (possibly running as Flask webservice) "
@@ -125,135 +285,315 @@ def _parse_command(args=None):
         dest="command",
         help="list of available subcommands")
 
-    add_parser = subparsers.add_parser(
-        "add", help="add an entry to the database")
+    # The top-level parser has no options taking values, hence the first
+    # positional argument is the subcommand
+    command = next((a for a in args if not a.startswith("-")), None)
+
+    for name, (help_text, add_arguments) in _SUBCOMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == command:
+            add_arguments(subparser)
+            _add_common_arguments(
+                subparser,
+                period=name not in ["list", "copy", "serve", "shell"])
+
+    return vars(parser.parse_args(args=args))
+
+
+def _add_common_arguments(subparser, period=True):
+    subparser.add_argument(
+        "-C",
+        "--config-filepath",
+        help="path to config file. Default: {}".format(
+            financeager.CONFIG_FILEPATH))
+    subparser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Be verbose about internal workings")
+
+    if period:
+        subparser.add_argument(
+            "-p", "--period", help="name of period to modify or query")
 
-    add_parser.add_argument("name", help="entry name")
-    add_parser.add_argument("value", type=float, help="entry value")
-    add_parser.add_argument(
-        "-c", "--category", default=None, help="entry category")
-    add_parser.add_argument("-d", "--date", default=None, help="entry date")
 
-    add_parser.add_argument(
+def _add_add_arguments(parser):
+    parser.add_argument("name", help="entry name")
+    parser.add_argument("value", type=float, help="entry value")
+    parser.add_argument("-c", "--category", default=None, help="entry category")
+    parser.add_argument("-d", "--date", default=None, help="entry date")
+
+    parser.add_argument(
         "-t",
         "--table-name",
         default=None,
         help="""table to add the entry to. With 'recurrent', specify at
 least a frequency, start date and end date are optional. Default:
 'standard'""")
-    add_parser.add_argument(
+    parser.add_argument(
         "-f",
         "--frequency",
         help="frequency of recurrent "
         "entry; one of yearly, half-yearly, quarterly, monthly, weekly, "
         "daily.")
-    add_parser.add_argument(
+    parser.add_argument(
         "-s", "--start", default=None, help="start date of recurrent entry")
-    add_parser.add_argument(
+    parser.add_argument(
         "-e", "--end", default=None, help="end date of recurrent entry")
 
-    get_parser = subparsers.add_parser(
-        "get", help="show information about single entry")
-    get_parser.add_argument("eid", help="entry ID")
-    get_parser.add_argument(
+
+def _add_get_arguments(parser):
+    parser.add_argument("eid", help="entry ID")
+    parser.add_argument(
         "-t",
         "--table-name",
         default=None,
         help="Table to get the entry from. Default: 'standard'.")
 
-    rm_parser = subparsers.add_parser(
-        "rm", help="remove an entry from the database")
-    rm_parser.add_argument("eid", help="entry ID")
-    rm_parser.add_argument(
+
+def _add_rm_arguments(parser):
+    parser.add_argument("eid", help="entry ID")
+    parser.add_argument(
         "-t",
         "--table-name",
         default=None,
         help="Table to remove the entry from. Default: 'standard'.")
 
-    update_parser = subparsers.add_parser(
-        "update", help="update one or more fields of an database entry")
-    update_parser.add_argument("eid", type=int, help="entry ID")
-    update_parser.add_argument(
+
+def _add_update_arguments(parser):
+    parser.add_argument("eid", type=int, help="entry ID")
+    parser.add_argument(
         "-t",
         "--table-name",
         help="Table containing the entry. Default: 'standard'")
-    update_parser.add_argument("-n", "--name", help="new name")
-    update_parser.add_argument("-v", "--value", type=float, help="new value")
-    update_parser.add_argument("-c", "--category", help="new category")
-    update_parser.add_argument(
+    parser.add_argument("-n", "--name", help="new name")
+    parser.add_argument("-v", "--value", type=float, help="new value")
+    parser.add_argument("-c", "--category", help="new category")
+    parser.add_argument(
         "-d", "--date", help="new date (for standard entries only)")
-    update_parser.add_argument(
+    parser.add_argument(
         "-f", "--frequency", help="new frequency (for recurrent entries only)")
-    update_parser.add_argument(
+    parser.add_argument(
         "-s", "--start", help="new start date (for recurrent entries only)")
-    update_parser.add_argument(
+    parser.add_argument(
         "-e", "--end", help="new end date (for recurrent entries only)")
 
-    copy_parser = subparsers.add_parser(
-        "copy", help="copy an entry from one period to another")
-    copy_parser.add_argument("eid", help="entry ID")
-    copy_parser.add_argument(
+
+def _add_copy_arguments(parser):
+    parser.add_argument("eid", help="entry ID")
+    parser.add_argument(
         "-s",
         "--source",
         default=None,
         dest="source_period",
         help="period to copy the entry from")
-    copy_parser.add_argument(
+    parser.add_argument(
         "-d",
         "--destination",
         default=None,
         dest="destination_period",
         help="period to copy the entry to")
-    copy_parser.add_argument(
+    parser.add_argument(
         "-t",
         "--table-name",
         default=None,
         help="Table to copy the entry from/to. Default: 'standard'.")
 
-    print_parser = subparsers.add_parser(
-        "print", help="show the period database")
-    print_parser.add_argument(
+
+def _add_print_arguments(parser):
+    parser.add_argument(
         "-f",
         "--filters",
         default=None,
         nargs="+",
         help="filter for name, "
         "date and/or category substring, e.g. name=beer category=groceries")
-    print_parser.add_argument(
+    parser.add_argument(
         "-s",
         "--stacked-layout",
         action="store_true",
         help="if true, display earnings and expenses in stacked layout, "
         "otherwise side-by-side")
-    print_parser.add_argument(
+    parser.add_argument(
         "--entry-sort",
         choices=["name", "value", "date", "eid"],
         default=CategoryEntry.BASE_ENTRY_SORT_KEY)
-    print_parser.add_argument(
+    parser.add_argument(
         "--category-sort",
         choices=["name", "value"],
         default=Listing.CATEGORY_ENTRY_SORT_KEY)
 
-    list_parser = subparsers.add_parser("list", help="list all databases")
 
-    # Add common options to subparsers
-    for subparser in subparsers.choices.values():
-        subparser.add_argument(
-            "-C",
-            "--config-filepath",
-            help="path to config file. Default: {}".format(
-                financeager.CONFIG_FILEPATH))
-        subparser.add_argument(
-            "--verbose",
-            action="store_true",
-            help="Be verbose about internal workings")
+def _add_import_arguments(parser):
+    from .importing import DEFAULT_BATCH_SIZE, DEFAULT_DATE_FORMAT
 
-        if subparser not in [list_parser, copy_parser]:
-            subparser.add_argument(
-                "-p", "--period", help="name of period to modify or query")
+    parser.add_argument("filepath", help="path of the CSV file")
+    parser.add_argument(
+        "--delimiter", default=",", help="field delimiter. Default: ','")
+    parser.add_argument(
+        "--encoding", default="utf-8", help="file encoding. Default: utf-8")
+    parser.add_argument(
+        "--name-column",
+        default="name",
+        help="header of the column holding entry names. Default: name")
+    parser.add_argument(
+        "--value-column",
+        default="value",
+        help="header of the column holding entry values. Default: value")
+    parser.add_argument(
+        "--date-column",
+        default="date",
+        help="header of the column holding entry dates. Default: date")
+    parser.add_argument(
+        "--category-column",
+        default=None,
+        help="header of the column holding entry categories (optional)")
+    parser.add_argument(
+        "--date-format",
+        default=DEFAULT_DATE_FORMAT,
+        help="format of the dates. If it contains the year, entries are "
+        "added to the period of their year, otherwise to the given period. "
+        "Default: {}".format(DEFAULT_DATE_FORMAT.replace("%", "%%")))
+    parser.add_argument(
+        "--rules",
+        metavar="FILEPATH",
+        help="file of rules assigning name and category to entries whose "
+        "name contains a pattern")
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="compare rows with existing entries of same date, value and name "
+        "(duplicates, not imported) or of same date and value (probable "
+        "matches, reported)")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report the result of reconciling without importing")
+    parser.add_argument(
+        "--decimal-comma",
+        action="store_true",
+        help="values use a decimal comma (and dots as thousands separator)")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="number of rows per request. Default: {}".format(
+            DEFAULT_BATCH_SIZE))
 
-    return vars(parser.parse_args(args=args))
 
+def _add_export_arguments(parser):
+    from .exporting import FORMATS
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="path of the file to write. Default: standard output")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="CSV or JSON Lines. Default: csv")
+    parser.add_argument(
+        "-f",
+        "--filters",
+        default=None,
+        nargs="+",
+        help="filter for name, "
+        "date and/or category substring, e.g. name=beer category=groceries")
+    parser.add_argument(
+        "--recurrent-templates",
+        action="store_true",
+        help="export recurrent entries once, with frequency, start and end, "
+        "instead of every occurrence")
+
+
+def _add_serve_arguments(parser):
+    parser.add_argument(
+        "--host",
+        default=financeager.DEFAULT_SERVE_HOST,
+        help="address to listen on. Default: {}".format(
+            financeager.DEFAULT_SERVE_HOST))
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=financeager.DEFAULT_SERVE_PORT,
+        help="port to listen on")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes to fork. Default: 1")
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=financeager.DEFAULT_BACKLOG,
+        help="maximum number of pending connections")
+    parser.add_argument(
+        "--keep-alive",
+        type=float,
+        default=financeager.DEFAULT_KEEP_ALIVE,
+        help="seconds to keep idle connections open; 0 disables persistent "
+        "connections")
+    parser.add_argument(
+        "--affinity",
+        action="store_true",
+        help="dispatch requests to the workers by period name such that each "
+        "period is held by a single worker")
+    parser.add_argument(
+        "--frontend",
+        choices=["wsgi", "asyncio"],
+        default="wsgi",
+        help="HTTP frontend of the workers: the threaded flask app, or an "
+        "asyncio app handling connections in a single thread. Default: wsgi")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=financeager.DEFAULT_THREADS,
+        help="number of threads running commands of the asyncio frontend. "
+        "Default: {}".format(financeager.DEFAULT_THREADS))
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        choices=range(10),
+        default=financeager.DEFAULT_COMPRESSION_LEVEL,
+        metavar="{0-9}",
+        help="gzip/deflate level of compressed responses; 0 disables "
+        "compression. Default: {}".format(
+            financeager.DEFAULT_COMPRESSION_LEVEL))
+    parser.add_argument(
+        "--compression-min-size",
+        type=int,
+        default=financeager.DEFAULT_COMPRESSION_MIN_SIZE,
+        help="minimum size in bytes of responses to compress. Default: "
+        "{}".format(financeager.DEFAULT_COMPRESSION_MIN_SIZE))
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="directory to store databases in. Default: value of environment "
+        "variable FINANCEAGER_DATA_DIR, or {}".format(financeager.DATA_DIR))
+
+
+# Subcommands mapped to their help and a function adding their arguments to
+# the subparser
+_SUBCOMMANDS = OrderedDict([
+    ("add", ("add an entry to the database", _add_add_arguments)),
+    ("get", ("show information about single entry", _add_get_arguments)),
+    ("rm", ("remove an entry from the database", _add_rm_arguments)),
+    ("update", ("update one or more fields of an database entry",
+                _add_update_arguments)),
+    ("copy", ("copy an entry from one period to another", _add_copy_arguments)),
+    ("print", ("show the period database", _add_print_arguments)),
+    ("list", ("list all databases", lambda parser: None)),
+    ("import", ("import entries from a CSV file (e.g. a bank statement)",
+                _add_import_arguments)),
+    ("export", ("export entries to a CSV or JSON Lines file",
+                _add_export_arguments)),
+    ("serve", ("run the flask webservice using a multi-worker server",
+               _add_serve_arguments)),
+    ("shell", ("run commands interactively, keeping the databases open",
+               lambda parser: None)),
+])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+"""Programmatic client session API."""
+import financeager
+from . import DEFAULT_TABLE, communication, columnar, init_logger
+from .config import Configuration
+
+logger = init_logger(__name__)
+
+
+class Client:
+    """Session of the backend specified by a ``Configuration``. The proxy is
+    created once and re-used by all requests; with the 'none' backend, the
+    databases remain open until the client is closed.
+
+    ``run()`` returns the server response as dict, and the other methods
+    return structured results (element IDs, lists of elements, aggregates)
+    instead of formatted text. The client can be used as context manager:
+
+        with Client(Configuration(filepath)) as client:
+            eid = client.add("beer", -2, category="groceries")
+            totals = client.totals()
+    """
+
+    def __init__(self, configuration=None, data_dir=None):
+        """:param configuration: default: the default configuration
+        :param data_dir: directory of the databases of the 'none' backend.
+            Default: financeager.DATA_DIR
+        """
+        self.configuration = configuration or Configuration()
+        self.backend_name = self.configuration.get_option("SERVICE", "name")
+
+        proxy_kwargs = {}
+        if self.backend_name == "flask":
+            init_logger("urllib3")
+            proxy_kwargs["http_config"] = self.configuration.get_option(
+                "SERVICE:FLASK")
+        else:  # 'none' is the only other option
+            proxy_kwargs["data_dir"] = data_dir or financeager.DATA_DIR
+            if self.configuration.getboolean("SERVICE:NONE", "daemon"):
+                self.backend_name = "daemon"
+                proxy_kwargs["idle_timeout"] = float(
+                    self.configuration.get_option("SERVICE:NONE",
+                                                  "idle_timeout"))
+
+        self.proxy = communication.module(
+            self.backend_name).proxy(**proxy_kwargs)
+
+        # Tuple of the most recently formatted elements of a 'print' response,
+        # the formatting options, and the result (see ``communication.run``)
+        self.last_formatted_elements = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the databases of the 'none' backend, or the connection to the
+        daemon.
+        """
+        if self.backend_name in ("none", "daemon"):
+            self.proxy.run("stop")
+
+    def run(self, command, **kwargs):
+        """Run a command on the proxy. The kwargs are passed on unprocessed.
+
+        :raises: CommunicationError, InvalidRequest
+        :return: dict
+        """
+        return self.proxy.run(command, **kwargs)
+
+    def run_many(self, commands):
+        """Run several commands in a single batch (see ``run()``).
+
+        :return: list of dict. The response of a failed command holds the key
+            'error'
+        """
+        return self.proxy.run_many(commands)
+
+    def add(self, name, value, period=None, table_name=None, **fields):
+        """Add an entry. 'fields' are category and date (standard entries), or
+        category, frequency, start and end (recurrent entries).
+
+        :return: int, ID of the new entry
+        """
+        return self.run(
+            "add",
+            name=name,
+            value=value,
+            period=period,
+            table_name=table_name,
+            **fields)["id"]
+
+    def get(self, eid, period=None, table_name=None):
+        """:return: dict holding the fields of the entry"""
+        return dict(
+            self.run("get", eid=eid, period=period,
+                     table_name=table_name)["element"])
+
+    def update(self, eid, period=None, table_name=None, **fields):
+        """:return: int, ID of the updated entry"""
+        return self.run(
+            "update", eid=eid, period=period, table_name=table_name,
+            **fields)["id"]
+
+    def rm(self, eid, period=None, table_name=None):
+        """:return: int, ID of the removed entry"""
+        return self.run(
+            "rm", eid=eid, period=period, table_name=table_name)["id"]
+
+    def copy(self,
+             eid,
+             source_period=None,
+             destination_period=None,
+             table_name=None):
+        """:return: int, ID of the entry in the destination period"""
+        return self.run(
+            "copy",
+            eid=eid,
+            source_period=source_period,
+            destination_period=destination_period,
+            table_name=table_name)["id"]
+
+    def periods(self):
+        """:return: list of period names"""
+        return self.run("list")["periods"]
+
+    def import_csv(self, file, **options):
+        """Import the entries of a CSV file object. See
+        ``importing.import_csv`` for the options and the returned statistics.
+
+        :return: dict
+        """
+        # Imported here since rarely used
+        from .importing import import_csv
+        return import_csv(self.proxy, file, **options)
+
+    def export(self,
+               file,
+               period=None,
+               format="csv",
+               filters=None,
+               expand_recurrent=True):
+        """Write the entries of the period that match the filters to the text
+        file object, in CSV or JSON Lines format (see ``Server.export``). The
+        entries are streamed from the backend, hence memory usage does not
+        depend on their number.
+        """
+        chunks = self.proxy.export(
+            period=period,
+            format=format,
+            filters=filters,
+            expand_recurrent=expand_recurrent)
+        for chunk in chunks:
+            file.write(chunk)
+
+    def entries(self, period=None, filters=None):
+        """Return the entries of the period that match the filters (dict
+        mapping field names to patterns, see ``TinyDbPeriod.get_entries``).
+        Each entry is a dict holding name, value, category, date, the element
+        ID ('eid'), and the 'table_name'. Recurrent entries are expanded; their
+        occurrences share the ID of the recurrent element.
+
+        :return: list of dict
+        """
+        elements = self.run("print", period=period, filters=filters)["elements"]
+        return [
+            dict(element, eid=int(eid), table_name=table_name)
+            for table_name, eid, element in iter_elements(elements)
+        ]
+
+    def totals(self, period=None, filters=None):
+        """Aggregate the values of the entries returned by ``entries()``.
+        Entries without category are accounted to the default category of the
+        configuration.
+
+        :return: dict holding the sums of 'earnings' (positive values),
+            'expenses' (negative values), and the 'balance', and the dict
+            'categories' mapping category names to the sum of their values
+        """
+        default_category = self.configuration.get_option(
+            "FRONTEND", "default_category")
+        totals = {
+            "earnings": 0.0,
+            "expenses": 0.0,
+            "balance": 0.0,
+            "categories": {}
+        }
+
+        for entry in self.entries(period=period, filters=filters):
+            value = entry["value"]
+            totals["earnings" if value > 0 else "expenses"] += value
+            totals["balance"] += value
+            category = entry["category"] or default_category
+            totals["categories"][category] = \
+                totals["categories"].get(category, 0.0) + value
+        return totals
+
+
+def iter_elements(elements):
+    """Generate tuples of table name, element ID, and element from elements as
+    returned by the 'print' command, in either format.
+    """
+    if columnar.is_columnar(elements):
+        yield from columnar.iter_elements(elements)
+        return
+
+    for eid, element in elements[DEFAULT_TABLE].items():
+        yield DEFAULT_TABLE, eid, element
+    for eid, occurrences in elements["recurrent"].items():
+        for element in occurrences:
+            yield "recurrent", eid, element
@@ -0,0 +1,211 @@
+"""Compact columnar encoding of the elements returned by the 'print' command.
+
+Instead of a dict per element, the fields of the standard elements are held in
+column arrays. Names and categories refer to a common string table. Recurrent
+elements are sent once, along with the dates of their matching occurrences;
+the occurrence names are derived from the dates.
+
+    {
+        "format": "columnar",
+        "year": 2019,
+        "strings": ["rent", "housing", ...],
+        "standard": {
+            "eid": [1, ...], "name": [0, ...], "value": [-500.0, ...],
+            "category": [1 or None, ...], "date": ["01-01", ...]
+        },
+        "recurrent": {
+            "eid": [...], "name": [...], "value": [...], "category": [...],
+            "frequency": ["monthly", ...], "dates": [["01-01", ...], ...]
+        }
+    }
+
+Alternatively, the recurrent elements are sent as templates holding 'start'
+and 'end' instead of 'dates' (see ``encode_templates``). The occurrences are
+then generated and filtered by the recipient, only when iterated.
+"""
+from datetime import datetime as dt
+
+from . import DEFAULT_TABLE
+
+FORMAT = "columnar"
+
+_FIELDS = ("eid", "name", "value", "category")
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings = []
+        self._indices = {}
+
+    def index(self, string):
+        if string is None:
+            return None
+        index = self._indices.get(string)
+        if index is None:
+            index = self._indices[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+def _encode_standard(elements, strings):
+    standard = {field: [] for field in _FIELDS + ("date",)}
+    for eid, element in elements[DEFAULT_TABLE].items():
+        standard["eid"].append(eid)
+        standard["name"].append(strings.index(element["name"]))
+        standard["value"].append(element["value"])
+        standard["category"].append(strings.index(element["category"]))
+        standard["date"].append(element["date"])
+    return standard
+
+
+def _encode_recurrent(eids, recurrent_elements, strings, fields):
+    recurrent = {field: [] for field in _FIELDS + ("frequency",) + fields}
+    for eid in eids:
+        element = recurrent_elements[eid]
+        recurrent["eid"].append(eid)
+        recurrent["name"].append(strings.index(element["name"]))
+        recurrent["value"].append(element["value"])
+        recurrent["category"].append(strings.index(element["category"]))
+        recurrent["frequency"].append(element["frequency"])
+        for field in fields:
+            recurrent[field].append(element[field])
+    return recurrent
+
+
+def encode(elements, recurrent_elements, year):
+    """Encode elements as returned by ``TinyDbPeriod.get_entries``.
+
+    :param recurrent_elements: dict mapping element IDs to the recurrent
+        elements that generated the entries of elements["recurrent"]
+    :param year: year of the period, required to derive the occurrence names
+    :return: dict
+    """
+    strings = _StringTable()
+    standard = _encode_standard(elements, strings)
+    recurrent = _encode_recurrent(elements["recurrent"], recurrent_elements,
+                                  strings, ())
+    recurrent["dates"] = [[o["date"] for o in occurrences]
+                          for occurrences in elements["recurrent"].values()]
+
+    return {
+        "format": FORMAT,
+        "year": year,
+        "strings": strings.strings,
+        DEFAULT_TABLE: standard,
+        "recurrent": recurrent,
+    }
+
+
+def encode_templates(elements, recurrent_elements, year, filters=None):
+    """Encode standard elements as returned by ``TinyDbPeriod.get_entries``,
+    and all given recurrent elements as templates. The filters and the current
+    date are included such that the recipient generates the same occurrences
+    as ``TinyDbPeriod.get_entries``.
+
+    :param recurrent_elements: dict mapping element IDs to recurrent elements
+    :return: dict
+    """
+    strings = _StringTable()
+    standard = _encode_standard(elements, strings)
+    recurrent = _encode_recurrent(recurrent_elements, recurrent_elements,
+                                  strings, ("start", "end"))
+
+    return {
+        "format": FORMAT,
+        "year": year,
+        "strings": strings.strings,
+        "filters": filters or {},
+        "until": dt.now().strftime("%Y-%m-%d"),
+        DEFAULT_TABLE: standard,
+        "recurrent": recurrent,
+    }
+
+
+def is_columnar(elements):
+    return elements.get("format") == FORMAT
+
+
+def iter_elements(payload):
+    """Generate tuples of table name, element ID, and element (dict holding
+    name, value, category, date) from the encoded payload. Occurrences of
+    recurrent elements share the element ID. Recurrent templates are expanded
+    lazily, using the same routine as ``TinyDbPeriod``.
+    """
+    # Imported here to avoid loading the database dependencies on the client
+    # unless a payload is decoded
+    from .period import recurrent_element_name
+
+    strings = payload["strings"]
+
+    def string(index):
+        return None if index is None else strings[index]
+
+    standard = payload[DEFAULT_TABLE]
+    for eid, name, value, category, date in zip(
+            standard["eid"], standard["name"], standard["value"],
+            standard["category"], standard["date"]):
+        yield DEFAULT_TABLE, eid, dict(
+            name=string(name),
+            value=value,
+            category=string(category),
+            date=date)
+
+    recurrent = payload["recurrent"]
+    year = payload["year"]
+    if "dates" not in recurrent:
+        yield from _iter_templates(payload, string)
+        return
+
+    for eid, name, value, category, frequency, dates in zip(
+            recurrent["eid"], recurrent["name"], recurrent["value"],
+            recurrent["category"], recurrent["frequency"], recurrent["dates"]):
+        name = string(name)
+        category = string(category)
+        for date in dates:
+            yield "recurrent", eid, dict(
+                name=recurrent_element_name(
+                    name, frequency, dt(year, int(date[:2]), int(date[3:]))),
+                value=value,
+                category=category,
+                date=date)
+
+
+def _iter_templates(payload, string):
+    from . import period
+
+    recurrent = payload["recurrent"]
+    condition = period.TinyDbPeriod._create_query_condition(
+        **payload["filters"])
+    until = dt.strptime(payload["until"], "%Y-%m-%d")
+
+    for eid, name, value, category, frequency, start, end in zip(
+            recurrent["eid"], recurrent["name"], recurrent["value"],
+            recurrent["category"], recurrent["frequency"], recurrent["start"],
+            recurrent["end"]):
+        template = dict(
+            name=string(name),
+            value=value,
+            category=string(category),
+            frequency=frequency,
+            start=start,
+            end=end)
+        for element in period.expand_recurrent_element(
+                template, payload["year"], until=until):
+            if condition is None or condition(element):
+                yield "recurrent", eid, dict(element)
+
+
+def decode(payload):
+    """Decode the payload into the structure returned by
+    ``TinyDbPeriod.get_entries`` (with element IDs as strings, as after JSON
+    decoding).
+
+    :return: dict
+    """
+    elements = {DEFAULT_TABLE: {}, "recurrent": {}}
+    for table_name, eid, element in iter_elements(payload):
+        if table_name == DEFAULT_TABLE:
+            elements[DEFAULT_TABLE][str(eid)] = element
+        else:
+            elements["recurrent"].setdefault(str(eid), []).append(element)
+    return elements
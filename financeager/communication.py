@@ -1,9 +1,8 @@
 """Backend-agnostic communication-related routines (preprocessing of requests,
 formatting of responses)."""
 from datetime import datetime
+import importlib
 
-import financeager.httprequests
-import financeager.localserver
 from . import PERIOD_DATE_FORMAT
 from .listing import prettify, Listing
 from .entries import prettify as prettify_element
@@ -13,13 +12,17 @@ from .exceptions import PreprocessingError
 
 def module(name):
     """Return the client module corresponding to the backend specified by 'name'
-    ('flask' or 'none').
+    ('flask' or 'none', or 'daemon' for the 'none' backend running in a
+    background daemon). The module is imported on first use, such that only the
+    dependencies of the selected backend are loaded.
     """
     frontend_modules = {
         "flask": "httprequests",
         "none": "localserver",
+        "daemon": "daemon",
     }
-    return getattr(financeager, frontend_modules[name])
+    return importlib.import_module("{}.{}".format(__package__,
+                                                  frontend_modules[name]))
 
 
 def run(proxy,
@@ -34,6 +37,11 @@ def run(proxy,
     on. The server response is formatted and returned. If the response does not
     contain any of the fields 'elements', 'element', or 'periods', the empty
     string is returned.
+    If the proxy has the attribute 'last_formatted_elements' (e.g.
+    ``client.Client``), the most recently formatted elements of a 'print'
+    response are memoized in it, such that formatting is skipped if the
+    identical response object is returned again (e.g. by the HTTP client for
+    unchanged entries, see httprequests).
 
     :raises: CommunicationError, InvalidRequest
     :return: str
@@ -41,6 +49,74 @@ def run(proxy,
     _preprocess(kwargs, date_format)
     response = proxy.run(command, **kwargs)
 
+    return _format_response(
+        response,
+        command,
+        proxy=proxy,
+        default_category=default_category,
+        stacked_layout=stacked_layout,
+        entry_sort=entry_sort,
+        category_sort=category_sort,
+        **kwargs)
+
+
+def run_many(proxy,
+             commands,
+             default_category=CategoryEntry.DEFAULT_NAME,
+             date_format=None,
+             stacked_layout=False,
+             entry_sort=CategoryEntry.BASE_ENTRY_SORT_KEY,
+             category_sort=Listing.CATEGORY_ENTRY_SORT_KEY):
+    """Run several commands on the given proxy in a single batch. 'commands' is
+    a list of dicts, each holding the command name (key 'command') and its
+    kwargs. The kwargs are preprocessed as in ``run()``. The server responses
+    are formatted and returned in order. The response of a failed command is
+    formatted as error message.
+
+    :raises: CommunicationError, InvalidRequest, PreprocessingError
+    :return: list of str
+    """
+    commands = [dict(c) for c in commands]
+    for command in commands:
+        _preprocess(command, date_format)
+
+    responses = proxy.run_many(commands)
+
+    formatted_responses = []
+    for command, response in zip(commands, responses):
+        if "error" in response:
+            formatted_responses.append("Invalid request: {}".format(
+                response["error"]))
+            continue
+
+        kwargs = dict(command)
+        formatted_responses.append(
+            _format_response(
+                response,
+                kwargs.pop("command"),
+                proxy=proxy,
+                default_category=default_category,
+                stacked_layout=stacked_layout,
+                entry_sort=entry_sort,
+                category_sort=category_sort,
+                **kwargs))
+    return formatted_responses
+
+
+def _format_response(response,
+                     command,
+                     proxy=None,
+                     default_category=CategoryEntry.DEFAULT_NAME,
+                     stacked_layout=False,
+                     entry_sort=CategoryEntry.BASE_ENTRY_SORT_KEY,
+                     category_sort=Listing.CATEGORY_ENTRY_SORT_KEY,
+                     **kwargs):
+    """Format the server response to the given command. 'kwargs' are the
+    command kwargs. 'proxy' optionally memoizes formatted elements (see
+    ``run``).
+
+    :return: str
+    """
     eid = response.get("id")
     if eid is not None:
         verb = {
@@ -53,10 +129,20 @@ def run(proxy,
 
     elements = response.get("elements")
     if elements is not None:
+        options = (default_category, stacked_layout, entry_sort, category_sort)
+        # Read once since the memo might be replaced by another thread
+        last = getattr(proxy, "last_formatted_elements", None)
+        if last is not None and last[0] is elements and last[1] == options:
+            return last[2]
+
         CategoryEntry.BASE_ENTRY_SORT_KEY = entry_sort
         CategoryEntry.DEFAULT_NAME = default_category
         Listing.CATEGORY_ENTRY_SORT_KEY = category_sort
-        return prettify(elements, stacked_layout)
+        formatted_elements = prettify(elements, stacked_layout)
+        if hasattr(proxy, "last_formatted_elements"):
+            proxy.last_formatted_elements = (elements, options,
+                                             formatted_elements)
+        return formatted_elements
 
     element = response.get("element")
     if element is not None:
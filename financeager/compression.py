@@ -0,0 +1,265 @@
+"""Negotiation and application of HTTP content codings (gzip, deflate) for
+responses and request bodies."""
+import gzip
+import io
+import json
+import zlib
+
+from . import (DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE,
+               DEFAULT_MAX_BODY_SIZE)
+
+# Supported content codings, in the order of preference
+ENCODINGS = ("gzip", "deflate")
+
+
+class DecompressionError(Exception):
+    pass
+
+
+class BodyTooLargeError(Exception):
+    pass
+
+
+def negotiate(accept_encoding):
+    """Select a supported content coding from the value of an Accept-Encoding
+    header. Codings with a quality value of zero are not acceptable.
+
+    :return: str or None if no supported coding is acceptable
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *parameters = item.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    candidates = [(qualities.get(c, qualities.get("*", 0.0)), -i, c)
+                  for i, c in enumerate(ENCODINGS)]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+def compress(body, encoding, level=DEFAULT_COMPRESSION_LEVEL):
+    """Compress bytes with the given content coding."""
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level)
+    if encoding == "deflate":
+        return zlib.compress(body, level)
+    raise ValueError("Unsupported encoding '{}'".format(encoding))
+
+
+def compress_stream(chunks, encoding, level=DEFAULT_COMPRESSION_LEVEL):
+    """Compress an iterable of bytes with the given content coding, generating
+    the compressed chunks incrementally.
+    """
+    if encoding == "gzip":
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == "deflate":
+        wbits = zlib.MAX_WBITS
+    else:
+        raise ValueError("Unsupported encoding '{}'".format(encoding))
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _decompress(body, wbits, max_size):
+    """Decompress a single zlib, gzip or raw deflate stream (according to
+    'wbits'), producing at most 'max_size' bytes (unlimited if None).
+    """
+    decompressor = zlib.decompressobj(wbits)
+    # Request one more byte than allowed to detect exceeding the limit
+    result = decompressor.decompress(body,
+                                     0 if max_size is None else max_size + 1)
+    if max_size is not None and len(result) > max_size:
+        raise BodyTooLargeError(
+            "Decompressed body exceeds {} bytes".format(max_size))
+    if not decompressor.eof:
+        raise EOFError("Compressed stream is incomplete")
+    if decompressor.unused_data:
+        raise EOFError("Trailing data after compressed stream")
+    return result
+
+
+def decompress(body, encoding, max_size=None):
+    """Decompress bytes encoded with the given content coding. An empty or
+    'identity' coding leaves the body unchanged. The decompressed body is
+    limited to 'max_size' bytes (unlimited if None).
+
+    :raise: DecompressionError if the coding is unsupported or the body is
+        corrupt
+    :raise: BodyTooLargeError if the decompressed body exceeds 'max_size'
+    """
+    encoding = (encoding or "identity").strip().lower()
+    try:
+        if encoding == "identity":
+            return body
+        if encoding == "gzip":
+            return _decompress(body, 16 + zlib.MAX_WBITS, max_size)
+        if encoding == "deflate":
+            try:
+                return _decompress(body, zlib.MAX_WBITS, max_size)
+            except zlib.error:
+                # Raw deflate stream without zlib header
+                return _decompress(body, -zlib.MAX_WBITS, max_size)
+    except (EOFError, zlib.error) as e:
+        raise DecompressionError("Invalid {} body: {}".format(encoding, e))
+    raise DecompressionError("Unsupported encoding '{}'".format(encoding))
+
+
+def compress_response(body,
+                      accept_encoding,
+                      level=DEFAULT_COMPRESSION_LEVEL,
+                      min_size=DEFAULT_COMPRESSION_MIN_SIZE):
+    """Compress a response body according to the Accept-Encoding header of the
+    request, if the body is large enough and compression is enabled (non-zero
+    'level').
+
+    :return: tuple of the (compressed) body and the content coding, or None if
+        the body was not compressed
+    """
+    if not level or len(body) < min_size:
+        return body, None
+
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return body, None
+    return compress(body, encoding, level), encoding
+
+
+class CompressionMiddleware:
+    """WSGI middleware decompressing request bodies according to their
+    Content-Encoding header, and compressing response bodies according to the
+    Accept-Encoding header of the request (see ``compress_response``).
+    Responses that already have a Content-Encoding are passed on unchanged.
+    Responses without Content-Length (i.e. streamed responses) are compressed
+    incrementally instead of being collected.
+    Requests with a body of more than 'max_body_size' bytes, before or after
+    decompression, are rejected (413 Request Entity Too Large).
+    """
+
+    def __init__(self,
+                 app,
+                 level=DEFAULT_COMPRESSION_LEVEL,
+                 min_size=DEFAULT_COMPRESSION_MIN_SIZE,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.max_body_size = max_body_size
+
+    def __call__(self, environ, start_response):
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length > self.max_body_size:
+            return _error(start_response, "413 Request Entity Too Large",
+                          "Body exceeds {} bytes".format(self.max_body_size))
+
+        if environ.get("HTTP_CONTENT_ENCODING"):
+            body = environ["wsgi.input"].read(length)
+            try:
+                body = decompress(body, environ["HTTP_CONTENT_ENCODING"],
+                                  self.max_body_size)
+            except DecompressionError as e:
+                return _error(start_response, "400 Bad Request", str(e))
+            except BodyTooLargeError as e:
+                return _error(start_response, "413 Request Entity Too Large",
+                              str(e))
+
+            environ = dict(environ)
+            del environ["HTTP_CONTENT_ENCODING"]
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+
+        if not self.level:
+            return self.app(environ, start_response)
+
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = headers
+            response["exc_info"] = exc_info
+            return chunks.append
+
+        chunks = []
+        result = self.app(environ, capture)
+
+        # The response is streamed if the app started it without
+        # Content-Length (apps starting the response lazily are collected)
+        started_headers = response.get("headers", [("Content-Length", "")])
+        if "content-length" not in {n.lower() for n, _ in started_headers}:
+            return self._stream(environ, start_response, response, chunks,
+                                result)
+
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        body = b"".join(chunks)
+
+        headers = response["headers"]
+        header_names = {name.lower() for name, _ in headers}
+        if "content-encoding" not in header_names and \
+                environ["REQUEST_METHOD"] != "HEAD":
+            body, encoding = compress_response(
+                body, environ.get("HTTP_ACCEPT_ENCODING"), self.level,
+                self.min_size)
+            if encoding is not None:
+                headers = [(name, value) for name, value in headers
+                           if name.lower() != "content-length"]
+                headers.extend([("Content-Encoding", encoding),
+                                ("Content-Length", str(len(body))),
+                                ("Vary", "Accept-Encoding")])
+
+        start_response(response["status"], headers, response["exc_info"])
+        return [body]
+
+    def _stream(self, environ, start_response, response, chunks, result):
+        headers = response["headers"]
+        encoding = None
+        # Responses without body (e.g. 304 Not Modified) are not encoded
+        if "content-encoding" not in {name.lower() for name, _ in headers} \
+                and environ["REQUEST_METHOD"] != "HEAD" \
+                and response["status"][:3] not in ("204", "304"):
+            encoding = negotiate(environ.get("HTTP_ACCEPT_ENCODING"))
+
+        if encoding is not None:
+            headers = headers + [("Content-Encoding", encoding),
+                                 ("Vary", "Accept-Encoding")]
+        start_response(response["status"], headers, response["exc_info"])
+
+        def body():
+            try:
+                # Chunks written via the legacy 'write' callable come first
+                yield from chunks
+                yield from result
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        if encoding is None:
+            return body()
+        return compress_stream(body(), encoding, self.level)
+
+
+def _error(start_response, status, message):
+    """Start a JSON error response and return its body."""
+    error = json.dumps({"error": message}).encode()
+    start_response(status, [("Content-Type", "application/json"),
+                            ("Content-Length", str(len(error)))])
+    return [error]
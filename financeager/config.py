@@ -3,7 +3,8 @@ from configparser import ConfigParser, NoSectionError, NoOptionError
 
 from .entries import CategoryEntry, BaseEntry
 from .exceptions import InvalidConfigError
-from . import DEFAULT_HOST, DEFAULT_TIMEOUT, init_logger
+from . import DEFAULT_HOST, DEFAULT_TIMEOUT, DEFAULT_POOL_SIZE, init_logger,\
+    DEFAULT_IDLE_TIMEOUT
 
 logger = init_logger(__name__)
 
@@ -38,6 +39,15 @@ class Configuration:
             "timeout": DEFAULT_TIMEOUT,
             "username": "",
             "password": "",
+            "pool_size": DEFAULT_POOL_SIZE,
+            "keep_alive": "true",
+            "compress_requests": "false",
+            "columnar": "false",
+            "recurrent_templates": "false",
+        }
+        self._parser["SERVICE:NONE"] = {
+            "daemon": "false",
+            "idle_timeout": DEFAULT_IDLE_TIMEOUT,
         }
 
     def _load_custom_config(self):
@@ -95,3 +105,40 @@ class Configuration:
             float(self.get_option("SERVICE:FLASK", "timeout"))
         except ValueError:
             raise InvalidConfigError("Timeout is not a number!")
+
+        try:
+            if self.getint("SERVICE:FLASK", "pool_size") < 1:
+                raise ValueError
+        except ValueError:
+            raise InvalidConfigError("Pool size is not a positive integer!")
+
+        try:
+            self.getboolean("SERVICE:FLASK", "keep_alive")
+        except ValueError:
+            raise InvalidConfigError("Keep-alive is not a boolean!")
+
+        try:
+            self.getboolean("SERVICE:FLASK", "compress_requests")
+        except ValueError:
+            raise InvalidConfigError("Compress-requests is not a boolean!")
+
+        try:
+            self.getboolean("SERVICE:FLASK", "columnar")
+        except ValueError:
+            raise InvalidConfigError("Columnar is not a boolean!")
+
+        try:
+            self.getboolean("SERVICE:FLASK", "recurrent_templates")
+        except ValueError:
+            raise InvalidConfigError("Recurrent-templates is not a boolean!")
+
+        try:
+            self.getboolean("SERVICE:NONE", "daemon")
+        except ValueError:
+            raise InvalidConfigError("Daemon is not a boolean!")
+
+        try:
+            if float(self.get_option("SERVICE:NONE", "idle_timeout")) <= 0:
+                raise ValueError
+        except ValueError:
+            raise InvalidConfigError("Idle timeout is not a positive number!")
@@ -0,0 +1,369 @@
+"""Background daemon for the 'none' backend. The daemon holds the ``Server``
+state (open periods, caches) in memory and answers requests of CLI processes
+over a Unix domain socket in the data directory. It is started on demand by
+the first client, and exits when no client has been connected for the idle
+timeout.
+
+Requests and responses are newline-delimited JSON objects. A request holds the
+command name and its kwargs; a response holds the server response under the
+key 'response', or an error message under the key 'failure' if an unexpected
+error occurred. The response to the 'export' command is preceded by objects
+holding chunks of the exported text under the key 'chunk'.
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from . import init_logger, DEFAULT_IDLE_TIMEOUT
+from .exceptions import InvalidRequest, CommunicationError
+from .locking import FileLock
+
+logger = init_logger(__name__)
+
+# Seconds to wait for a daemon started on demand to accept connections
+START_TIMEOUT = 5
+
+# Minimum number of characters of exported text sent per chunk
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+SOCKET_FILENAME = "daemon.sock"
+LOCK_FILENAME = "daemon.lock"
+
+
+def socket_path(data_dir):
+    return os.path.join(data_dir, SOCKET_FILENAME)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connection_opened()
+        try:
+            for line in self.rfile:
+                for frame in self.server.dispatch(line):
+                    self.wfile.write(frame + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. an export in progress
+            logger.debug("Connection closed by client")
+        finally:
+            self.server.connection_closed()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server running the commands of its clients on the
+    'backend' ``Server``. Each client connection is handled in a separate
+    thread.
+    """
+
+    daemon_threads = False
+
+    def __init__(self, path, backend, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        super().__init__(path, _RequestHandler)
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.timeout = min(1.0, idle_timeout)
+        self.stopped = False
+        self._connections = 0
+        self._last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+    def connection_opened(self):
+        with self._lock:
+            self._connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self._connections -= 1
+            self._last_activity = time.monotonic()
+
+    def idle(self):
+        """Whether no client has been connected for the idle timeout."""
+        with self._lock:
+            return self._connections == 0 and \
+                time.monotonic() - self._last_activity >= self.idle_timeout
+
+    def dispatch(self, line):
+        """Run the command of the encoded request line and generate the encoded
+        response (preceded by the chunks of exported text if the command is
+        'export'). The JSON encoding of the server is re-used (see
+        ``Server.run_serialized``).
+        """
+        try:
+            request = json.loads(line.decode())
+            command = request["command"]
+            kwargs = request.get("kwargs", {})
+            if command == "export":
+                yield from self._export(**kwargs)
+                return
+            body, _ = self.backend.run_serialized(command, **kwargs)
+            yield b'{"response": %s}' % body
+        except Exception as e:
+            logger.exception("Unexpected error")
+            yield json.dumps({"failure": str(e)}).encode()
+
+    def _export(self, **kwargs):
+        # The exported lines are collected into chunks to reduce the number of
+        # objects to encode and decode
+        try:
+            lines = self.backend.export(**kwargs)
+        except ValueError as e:
+            yield json.dumps({"response": {"error": str(e)}}).encode()
+            return
+
+        chunk = []
+        size = 0
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_SIZE:
+                yield json.dumps({"chunk": "".join(chunk)}).encode()
+                chunk = []
+                size = 0
+        if chunk:
+            yield json.dumps({"chunk": "".join(chunk)}).encode()
+        yield b'{"response": {}}'
+
+    def serve_until_idle(self):
+        while not self.stopped and not self.idle():
+            self.handle_request()
+
+
+def serve(data_dir, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Run the daemon on the socket in the given data directory until it is
+    idle, or SIGTERM or SIGINT is received. If another daemon is already
+    listening on the socket, return immediately. The periods are closed on
+    shutdown.
+    """
+    # Imported here since clients only require the proxy
+    from .server import Server
+
+    path = socket_path(data_dir)
+    lock = FileLock(os.path.join(data_dir, LOCK_FILENAME))
+
+    # Serialize checking for a running daemon and binding the socket
+    try:
+        with lock.exclusive():
+            if _is_listening(path):
+                logger.info("Daemon already running on {}".format(path))
+                return
+            if os.path.exists(path):
+                os.remove(path)
+            daemon = DaemonServer(
+                path, Server(data_dir=data_dir), idle_timeout=idle_timeout)
+    finally:
+        lock.close()
+
+    def stop(*_):
+        daemon.stopped = True
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+    logger.info("Daemon listening on {}".format(path))
+    try:
+        daemon.serve_until_idle()
+    finally:
+        # Refuse new connections before closing the periods
+        os.remove(path)
+        daemon.server_close()
+        daemon.backend.run("stop")
+        logger.info("Daemon stopped")
+
+
+def _is_listening(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def start(data_dir, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Start a daemon in a detached background process."""
+    command = [
+        sys.executable, "-m", __name__, "--data-dir", data_dir,
+        "--idle-timeout",
+        str(idle_timeout)
+    ]
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
+
+class DaemonProxy:
+    """Client of the daemon serving the given data directory, analogous to
+    ``localserver.LocalServer``. The daemon is started if not running yet.
+    """
+
+    def __init__(self, data_dir, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.data_dir = data_dir
+        self.idle_timeout = idle_timeout
+        self._sock = None
+        self._file = None
+
+    def run(self, command, **kwargs):
+        """Run command on the daemon. The 'stop' command closes the connection
+        but leaves the daemon running.
+
+        :raises: InvalidRequest on invalid request
+                 CommunicationError if the daemon is not reachable, or on
+                 unexpected server error
+        """
+        if command == "stop":
+            self.close()
+            return {}
+
+        line = json.dumps({"command": command, "kwargs": kwargs}).encode()
+        return self._response(self._request(line))
+
+    def run_many(self, commands):
+        """Run several commands in a single batch (see
+        ``LocalServer.run_many``).
+        """
+        return self.run("batch", commands=commands)["results"]
+
+    def export(self, **kwargs):
+        """Request the export of entries (see ``Server.export``). The exported
+        text is received in chunks while iterating.
+
+        :return: iterator over chunks (str) of the exported text
+        :raises: see ``run``
+        """
+        line = json.dumps({"command": "export", "kwargs": kwargs}).encode()
+        reply = self._request(line)
+        if "chunk" not in reply:
+            self._response(reply)
+            return iter(())
+        return self._iter_chunks(reply)
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def _iter_chunks(self, reply):
+        complete = False
+        try:
+            while "chunk" in reply:
+                yield reply["chunk"]
+                reply = self._read_reply()
+            complete = True
+        except OSError:
+            raise CommunicationError("Connection to daemon lost")
+        finally:
+            # Discard the connection if the remaining chunks were not read
+            if not complete:
+                self.close()
+        self._response(reply)
+
+    def _request(self, line):
+        """Send the encoded request line and return the first decoded reply.
+
+        :raises: CommunicationError if the connection is lost
+        """
+        fresh_connection = self._sock is None
+        try:
+            return self._exchange(line)
+        except OSError:
+            self.close()
+            if not fresh_connection:
+                raise CommunicationError("Connection to daemon lost")
+
+        # The daemon might have shut down due to idleness right after
+        # accepting the connection, before processing the request
+        try:
+            return self._exchange(line)
+        except OSError:
+            self.close()
+            raise CommunicationError("Connection to daemon lost")
+
+    @staticmethod
+    def _response(reply):
+        if "failure" in reply:
+            logger.error("Unexpected error in daemon: {}".format(
+                reply["failure"]))
+            raise CommunicationError("Unexpected error")
+
+        response = reply["response"]
+        if "error" in response:
+            raise InvalidRequest("Invalid request: {}".format(
+                response["error"]))
+        return response
+
+    def _exchange(self, line):
+        if self._sock is None:
+            self._connect()
+        self._sock.sendall(line + b"\n")
+        return self._read_reply()
+
+    def _read_reply(self):
+        reply = self._file.readline()
+        if not reply:
+            raise ConnectionResetError("Connection closed by daemon")
+        return json.loads(reply.decode())
+
+    def _connect(self):
+        """Connect to the daemon, starting it if required.
+
+        :raises: CommunicationError if the daemon is not reachable
+        """
+        path = socket_path(self.data_dir)
+        started = False
+        deadline = time.monotonic() + START_TIMEOUT
+
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                break
+            except OSError:
+                sock.close()
+                if not started:
+                    logger.debug("Starting daemon on {}".format(path))
+                    os.makedirs(self.data_dir, exist_ok=True)
+                    start(self.data_dir, idle_timeout=self.idle_timeout)
+                    started = True
+                elif time.monotonic() > deadline:
+                    raise CommunicationError(
+                        "Daemon on {} not reachable".format(path))
+                time.sleep(0.01)
+
+        self._sock = sock
+        self._file = sock.makefile("rb")
+
+
+def proxy(**kwargs):
+    return DaemonProxy(**kwargs)
+
+
+def main():
+    import argparse
+
+    from . import setup_log_file_handler
+
+    parser = argparse.ArgumentParser(
+        description="Run the financeager daemon for the 'none' backend.")
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument(
+        "--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT)
+    args = parser.parse_args()
+
+    setup_log_file_handler()
+    serve(args.data_dir, idle_timeout=args.idle_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Streaming export of entries in CSV or JSON Lines format."""
+import csv
+import io
+import json
+
+FORMATS = ("csv", "jsonl")
+
+# Media types of the formats
+MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# Exported fields of entries, and additionally of recurrent elements that are
+# not expanded
+FIELDS = ("table_name", "eid", "name", "value", "category", "date")
+RECURRENT_FIELDS = FIELDS + ("frequency", "start", "end")
+
+
+def check_format(format):
+    """:raise: ValueError if the format is not supported"""
+    if format not in FORMATS:
+        raise ValueError("Unknown export format '{}'".format(format))
+
+
+def export_lines(entries, format="csv", expand_recurrent=True):
+    """Generate the lines (str, including line break) encoding the entries
+    one by one. CSV output starts with a header line. Missing fields are
+    exported as empty CSV fields, or omitted from JSON objects.
+
+    :param entries: iterable of tuples of table name, element ID, and element
+        (see ``TinyDbPeriod.iter_entries``)
+    :param expand_recurrent: whether the entries hold occurrences of recurrent
+        elements, or the recurrent elements (determining the CSV columns)
+    :raise: ValueError if the format is not supported
+    """
+    check_format(format)
+    fields = FIELDS if expand_recurrent else RECURRENT_FIELDS
+
+    if format == "jsonl":
+        for table_name, eid, element in entries:
+            record = dict(element, table_name=table_name, eid=eid)
+            yield json.dumps({f: record[f]
+                              for f in fields if f in record}) + "\n"
+        return
+
+    # The writer fills the buffer with one line at a time
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def line(row):
+        writer.writerow(row)
+        content = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return content
+
+    yield line(fields)
+    for table_name, eid, element in entries:
+        record = dict(element, table_name=table_name, eid=eid)
+        yield line(record.get(f) for f in fields)
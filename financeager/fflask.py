@@ -4,11 +4,14 @@ import os
 from flask import Flask
 from flask_restful import Api
 
-from . import PERIODS_TAIL, COPY_TAIL, init_logger, setup_log_file_handler,\
-    make_log_stream_handler_verbose
+from . import PERIODS_TAIL, COPY_TAIL, BATCH_TAIL, init_logger,\
+    setup_log_file_handler, make_log_stream_handler_verbose
+from . import (DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE,
+               DEFAULT_MAX_BODY_SIZE)
 from .server import Server
+from .compression import CompressionMiddleware
 from .resources import (PeriodsResource, PeriodResource, EntryResource,
-                        CopyResource)
+                        CopyResource, BatchResource, ExportResource)
 
 logger = init_logger(__name__)
 
@@ -23,6 +26,9 @@ def create_app(data_dir=None, config=None):
     is not given, the application data is stored in memory and will be lost when
     the app terminates.
     'config' is a dict of configuration variables that flask understands.
+    Additionally, 'COMPRESSION_LEVEL' and 'COMPRESSION_MIN_SIZE' configure the
+    compression of responses, and 'MAX_BODY_SIZE' limits the size of request
+    bodies (see ``compression.CompressionMiddleware``).
     """
     setup_log_file_handler()
 
@@ -31,6 +37,9 @@ def create_app(data_dir=None, config=None):
     init_logger("werkzeug")
 
     app = Flask(__name__)
+    app.config.setdefault("COMPRESSION_LEVEL", DEFAULT_COMPRESSION_LEVEL)
+    app.config.setdefault("COMPRESSION_MIN_SIZE", DEFAULT_COMPRESSION_MIN_SIZE)
+    app.config.setdefault("MAX_BODY_SIZE", DEFAULT_MAX_BODY_SIZE)
     app.config.update(config or {})
     if app.debug:
         make_log_stream_handler_verbose()
@@ -50,18 +59,31 @@ def create_app(data_dir=None, config=None):
     server = Server(data_dir=data_dir)
     logger.debug(
         "Started financeager server with data dir '{}'".format(data_dir))
+    # Provide access to the server, e.g. for closing the periods on shutdown
+    app.extensions["financeager"] = server
 
     api = Api(app)
     api.add_resource(
         PeriodsResource, PERIODS_TAIL, resource_class_args=(server,))
     api.add_resource(CopyResource, COPY_TAIL, resource_class_args=(server,))
+    api.add_resource(BatchResource, BATCH_TAIL, resource_class_args=(server,))
     api.add_resource(
         PeriodResource,
         "{}/<period_name>".format(PERIODS_TAIL),
         resource_class_args=(server,))
+    api.add_resource(
+        ExportResource,
+        "{}/<period_name>/export".format(PERIODS_TAIL),
+        resource_class_args=(server,))
     api.add_resource(
         EntryResource,
         "{}/<period_name>/<table_name>/<eid>".format(PERIODS_TAIL),
         resource_class_args=(server,))
 
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        level=app.config["COMPRESSION_LEVEL"],
+        min_size=app.config["COMPRESSION_MIN_SIZE"],
+        max_body_size=app.config["MAX_BODY_SIZE"])
+
     return app
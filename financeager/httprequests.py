@@ -1,24 +1,89 @@
 """Construction and handling of HTTP requests to communicate with webservice."""
+from collections import OrderedDict
+from configparser import ConfigParser
 import http
 import json
+import threading
 
 import requests
 
 from . import default_period_name, DEFAULT_TABLE, DEFAULT_HOST, DEFAULT_TIMEOUT
-from . import COPY_TAIL, PERIODS_TAIL
+from . import (COPY_TAIL, PERIODS_TAIL, BATCH_TAIL, DEFAULT_POOL_SIZE,
+               DEFAULT_COMPRESSION_MIN_SIZE)
+from .compression import compress
 from .exceptions import CommunicationError, InvalidRequest
 
+# Sessions shared by all proxies of the process, keyed by pool size and
+# keep-alive setting. Reusing a session reuses its pooled connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Last responses to 'print' requests along with their entity tags, keyed by URL
+# and query parameters. Shared by all proxies of the process
+PRINT_CACHE_SIZE = 32
+_print_cache = OrderedDict()
+_print_cache_lock = threading.Lock()
+
+# Number of bytes read at once from streamed export responses
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _get_session(pool_size, keep_alive):
+    """Return the session with the given settings. It is created with a
+    connection pool of 'pool_size' connections per host if not present yet.
+    If 'keep_alive' is False, connections are closed after each request.
+    """
+    key = (pool_size, keep_alive)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            _sessions[key] = session
+    return session
+
+
+def _boolean(value):
+    """Convert config value (bool or str such as 'true', 'off') to bool."""
+    if isinstance(value, str):
+        return ConfigParser.BOOLEAN_STATES[value.lower()]
+    return value
+
 
 class _Proxy:
     """Converts CL verbs to HTTP request, sends to webservice and returns
-    response."""
+    response. Requests are sent via a session shared within the process, hence
+    connections to the webservice are reused.
+    Responses to 'print' are cached. Repeated requests are conditional; if the
+    server answers that the entries are not modified, the identical response
+    object as before is returned.
+    """
 
     def __init__(self, http_config=None):
         """http_config: dict specifying host and (optionally) username/password
-        for basic auth
+        for basic auth, size of the connection pool, whether to keep
+        connections alive, whether to compress the bodies of batch requests,
+        and whether to request 'print' responses in columnar format, optionally
+        with unexpanded recurrent entries (see ``columnar``; the response
+        elements are passed on encoded)
         """
         self.http_config = http_config or {}
 
+        keep_alive = _boolean(self.http_config.get("keep_alive", True))
+        self._compress_requests = _boolean(
+            self.http_config.get("compress_requests", False))
+        self._columnar = _boolean(self.http_config.get("columnar", False))
+        self._recurrent_templates = _boolean(
+            self.http_config.get("recurrent_templates", False))
+        self._session = _get_session(
+            int(self.http_config.get("pool_size", DEFAULT_POOL_SIZE)),
+            keep_alive)
+
     def run(self, command, **data):
         """Run the specified command. If no http_config given, it is read from
         the user config. The data kwargs are passed to the HTTP request.
@@ -40,69 +105,194 @@ class _Proxy:
                                     data.get("table_name") or DEFAULT_TABLE,
                                     data.get("eid"))
 
-        username = self.http_config.get("username")
-        password = self.http_config.get("password")
-        auth = None
-        if username and password:
-            auth = (username, password)
-
-        kwargs = dict(auth=auth, timeout=DEFAULT_TIMEOUT)
+        kwargs = self._request_kwargs()
 
         if command == "print":
-            # Correctly send filters; allowing for server-side deserialization
-            kwargs["json"] = json.dumps(data)
+            # Send filters as query parameters, allowing for HTTP caching. An
+            # empty pattern indicates None
+            filters = data.get("filters") or {}
+            kwargs["params"] = {
+                k: "" if v is None else v
+                for k, v in filters.items()
+            }
+            if self._recurrent_templates:
+                kwargs["params"]["format"] = "templates"
+            elif self._columnar:
+                kwargs["params"]["format"] = "columnar"
+            kwargs["cache_key"] = (period_url,
+                                   tuple(sorted(kwargs["params"].items())))
         else:
             kwargs["json"] = data or None
 
         if command == "print":
             url = period_url
-            function = requests.get
+            function = self._session.get
         elif command == "rm":
             url = eid_url
-            function = requests.delete
+            function = self._session.delete
         elif command == "add":
             url = period_url
-            function = requests.post
+            function = self._session.post
         elif command == "list":
             url = base_url
-            function = requests.post
+            function = self._session.post
         elif command == "copy":
             url = copy_url
-            function = requests.post
+            function = self._session.post
         elif command == "get":
             url = eid_url
-            function = requests.get
+            function = self._session.get
         elif command == "update":
             url = eid_url
-            function = requests.patch
+            function = self._session.patch
         else:
             raise ValueError("Unknown command: {}".format(command))
 
+        return self._send(function, url, **kwargs)
+
+    def run_many(self, commands):
+        """Run several commands in a single request to the webservice. Each
+        command is a dict holding the command name (key 'command') and its data
+        kwargs. 'period' is substituted, if None. The commands modifying a
+        period are executed in a transaction (see ``Server``).
+
+        :return: list of dicts, the responses to the commands in order. The
+            response of a failed command holds the key 'error'
+        :raise: CommunicationError on e.g. timeouts or server-side errors,
+            InvalidRequest on invalid requests
+        """
+        commands = [
+            dict(c, period=c.get("period") or default_period_name())
+            if c.get("command") not in ("list", "copy") else c for c in commands
+        ]
+
+        url = "{}{}".format(
+            self.http_config.get("host", DEFAULT_HOST), BATCH_TAIL)
+        kwargs = self._request_kwargs()
+
+        body = json.dumps({"commands": commands}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self._compress_requests and \
+                len(body) >= DEFAULT_COMPRESSION_MIN_SIZE:
+            body = compress(body, "gzip")
+            headers["Content-Encoding"] = "gzip"
+
+        response = self._send(
+            self._session.post, url, data=body, headers=headers, **kwargs)
+        return response["results"]
+
+    def export(self,
+               period=None,
+               format="csv",
+               filters=None,
+               expand_recurrent=True):
+        """Request the export of the entries of the period (see
+        ``Server.export``). The response is streamed.
+
+        :return: iterator over chunks (str) of the exported text
+        :raise: CommunicationError on e.g. timeouts or server-side errors,
+            InvalidRequest on invalid requests
+        """
+        period = period or default_period_name()
+        url = "{}{}/{}/export".format(
+            self.http_config.get("host", DEFAULT_HOST), PERIODS_TAIL, period)
+
+        params = {k: "" if v is None else v for k, v in (filters or {}).items()}
+        params["format"] = format
+        if not expand_recurrent:
+            params["recurrent"] = "templates"
+
+        try:
+            response = self._session.get(
+                url, params=params, stream=True, **self._request_kwargs())
+        except requests.RequestException as e:
+            raise CommunicationError("Error sending request: {}".format(e))
+
+        if not response.ok:
+            _raise_error(response)
+
+        return self._iter_text(response)
+
+    @staticmethod
+    def _iter_text(response):
+        # The server encodes the lines as UTF-8
+        response.encoding = "utf-8"
+        try:
+            yield from response.iter_content(
+                EXPORT_CHUNK_SIZE, decode_unicode=True)
+        except requests.RequestException as e:
+            raise CommunicationError("Error receiving response: {}".format(e))
+        finally:
+            response.close()
+
+    def _request_kwargs(self):
+        username = self.http_config.get("username")
+        password = self.http_config.get("password")
+        auth = None
+        if username and password:
+            auth = (username, password)
+
+        return dict(auth=auth, timeout=DEFAULT_TIMEOUT)
+
+    @staticmethod
+    def _send(function, url, cache_key=None, **kwargs):
+        """Send request using the given function of the session and return the
+        decoded JSON response. If 'cache_key' is given, the response is cached
+        under the key and the request is sent conditionally.
+
+        :raise: CommunicationError, InvalidRequest
+        """
+        cached = None
+        if cache_key is not None:
+            with _print_cache_lock:
+                cached = _print_cache.get(cache_key)
+            if cached is not None:
+                kwargs["headers"] = {"If-None-Match": cached[0]}
+
         try:
             response = function(url, **kwargs)
         except requests.RequestException as e:
             raise CommunicationError("Error sending request: {}".format(e))
 
+        if cached is not None and \
+                response.status_code == http.HTTPStatus.NOT_MODIFIED:
+            return cached[1]
+
         if response.ok:
-            return response.json()
+            content = response.json()
+            if cache_key is not None and "ETag" in response.headers:
+                etag = response.headers["ETag"]
+                with _print_cache_lock:
+                    _print_cache[cache_key] = (etag, content)
+                    _print_cache.move_to_end(cache_key)
+                    if len(_print_cache) > PRINT_CACHE_SIZE:
+                        _print_cache.popitem(last=False)
+            return content
         else:
-            try:
-                # Get further information about error (see Server.run)
-                error = response.json()["error"]
-            except (json.JSONDecodeError, KeyError):
-                error = "-"
-
-            status_code = response.status_code
-            if 400 <= status_code < 500:
-                error_class = InvalidRequest
-            else:
-                error_class = CommunicationError
-
-            message = "Error handling request. " +\
-                "Server returned '{} ({}): {}'".format(
-                    http.HTTPStatus(status_code).phrase, status_code, error)
-
-            raise error_class(message)
+            _raise_error(response)
+
+
+def _raise_error(response):
+    """Raise InvalidRequest if the status of the failed response indicates a
+    client error, and CommunicationError otherwise.
+    """
+    try:
+        # Get further information about error (see Server.run)
+        error = response.json()["error"]
+    except (json.JSONDecodeError, KeyError):
+        error = "-"
+
+    status_code = response.status_code
+    if 400 <= status_code < 500:
+        error_class = InvalidRequest
+    else:
+        error_class = CommunicationError
+
+    message = "Error handling request. " +\
+        "Server returned '{} ({}): {}'".format(
+            http.HTTPStatus(status_code).phrase, status_code, error)
+
+    raise error_class(message)
 
 
 def proxy(**kwargs):
@@ -0,0 +1,268 @@
+"""Streaming import of entries from CSV files (e.g. bank statements)."""
+from collections import defaultdict
+import csv
+from datetime import datetime as dt
+import re
+import time
+
+from . import PERIOD_DATE_FORMAT, default_period_name
+from .client import iter_elements
+from .exceptions import PreprocessingError
+
+# Number of rows sent to the backend per request
+DEFAULT_BATCH_SIZE = 1000
+
+DEFAULT_DATE_FORMAT = "%Y-%m-%d"
+
+# Classification of imported rows by reconciliation (see ``EntryIndex``)
+NEW = "new"
+DUPLICATE = "duplicate"
+PROBABLE = "probable"
+
+
+def normalize_name(name):
+    """Return the lowercase words of the name separated by single spaces, such
+    that e.g. 'LIDL  Fil.12' and 'lidl fil 12' are equal.
+    """
+    return " ".join(re.findall(r"\w+", name.lower()))
+
+
+class EntryIndex:
+    """Hash index of the entries of a period, for reconciling imported rows
+    with existing entries in constant time per row. Entries are keyed by date,
+    value, and normalized name (exact match), and by date and value (probable
+    match, e.g. if the name was edited after a previous import).
+    """
+
+    def __init__(self, elements=()):
+        """:param elements: iterable of tuples of table name, element ID, and
+            element (dict holding name, value, date), e.g. from
+            ``client.iter_elements``
+        """
+        # Keys mapped to lists of tuples of table name, element ID, and name
+        self._exact = defaultdict(list)
+        self._probable = defaultdict(list)
+        for table_name, eid, element in elements:
+            key = (element["date"], round(element["value"], 2))
+            item = (table_name, int(eid), element["name"])
+            self._exact[key + (normalize_name(element["name"]),)].append(item)
+            self._probable[key].append(item)
+
+    def classify(self, entry):
+        """Classify the entry (dict holding name, value, date) as NEW,
+        DUPLICATE of an existing entry, or PROBABLE match of an existing entry
+        with the same date and value but another name. Every existing entry is
+        matched at most once, such that e.g. two identical purchases on the
+        same day are not both considered duplicates of one entry.
+
+        :return: tuple of classification and the matched tuple of table name,
+            element ID, and name (None if NEW)
+        """
+        key = (entry["date"], round(entry["value"], 2))
+        exact_key = key + (normalize_name(entry["name"]),)
+
+        if self._exact.get(exact_key):
+            item = self._exact[exact_key].pop()
+            self._probable[key].remove(item)
+            return DUPLICATE, item
+
+        if self._probable.get(key):
+            item = self._probable[key].pop()
+            self._exact[key + (normalize_name(item[2]),)].remove(item)
+            return PROBABLE, item
+
+        return NEW, None
+
+
+def _parse_row(row,
+               name_column="name",
+               value_column="value",
+               date_column="date",
+               category_column=None,
+               date_format=DEFAULT_DATE_FORMAT,
+               decimal_comma=False,
+               period=None,
+               categorizer=None):
+    """Convert a CSV row (dict) into the fields of a standard entry. The
+    period is derived from the year of the date if the date format contains
+    it, otherwise 'period' is used.
+    If the name matches a rule of the 'categorizer' (``rules.Categorizer``),
+    name and category are assigned by the rule. An explicitly given category
+    takes precedence; the rule category takes precedence over the category
+    derived from previous entries of the same name when adding the entry.
+
+    :raise: ValueError if a field is invalid
+    :return: tuple of period name and dict of entry fields
+    """
+
+    def field(column):
+        # Missing trailing fields are None
+        return (row[column] or "").strip()
+
+    name = field(name_column)
+    if not name:
+        raise ValueError("Empty name")
+
+    value = field(value_column)
+    if decimal_comma:
+        value = value.replace(".", "").replace(",", ".")
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError("Invalid value '{}'".format(field(value_column)))
+
+    try:
+        date = dt.strptime(field(date_column), date_format)
+        # Dates are stored without year, hence leap days are not supported
+        dt.strptime(date.strftime(PERIOD_DATE_FORMAT), PERIOD_DATE_FORMAT)
+    except ValueError:
+        raise ValueError("Invalid date '{}'".format(field(date_column)))
+
+    if "%Y" in date_format or "%y" in date_format:
+        period = str(date.year)
+    date = date.strftime(PERIOD_DATE_FORMAT)
+
+    entry = {"name": name, "value": value, "date": date}
+    if category_column is not None:
+        entry["category"] = field(category_column) or None
+
+    rule = categorizer.match(name) if categorizer is not None else None
+    if rule is not None:
+        entry["name"] = rule.name
+        if entry.get("category") is None:
+            entry["category"] = rule.category
+    return period, entry
+
+
+def import_csv(proxy,
+               file,
+               delimiter=",",
+               batch_size=DEFAULT_BATCH_SIZE,
+               name_column="name",
+               value_column="value",
+               date_column="date",
+               category_column=None,
+               reconcile=False,
+               dry_run=False,
+               **options):
+    """Stream the rows of the CSV file (with header line) to the backend. The
+    columns holding the entry fields are given by the '*_column' arguments.
+    Further options (date_format, decimal_comma, period, categorizer) are
+    passed to the conversion of each row (see ``_parse_row``). Invalid rows
+    are skipped.
+
+    The entries are sent in batches of 'batch_size' rows via
+    ``proxy.run_many``. Each batch holds one bulk 'add_many' command per
+    period, such that multi-year statements are split by period. The entries
+    are validated by the backend; if one is invalid, no entry of that period
+    in the batch is added.
+
+    If 'reconcile' is set, the rows are compared with the existing entries of
+    their period (see ``EntryIndex``) before being sent. Duplicates are not
+    imported; probable matches are imported but reported. If 'dry_run' is set,
+    the rows are reconciled but nothing is imported.
+
+    :raise: PreprocessingError if a column is missing in the header,
+        CommunicationError
+    :return: dict holding the number of 'rows' read and 'imported', the
+        number of imported rows per period ('periods'), a list of tuples of
+        line number and error message of 'skipped' rows, a list of error
+        messages of 'failed' batches, the number of rows in failed batches
+        ('failed_rows'), and the throughput ('rows_per_second'). If reconciling,
+        additionally the number of 'new' rows, and lists of tuples of line
+        number and matched table name, element ID and name of 'duplicates'
+        and 'probable' matches
+    """
+    reader = csv.DictReader(file, delimiter=delimiter)
+    columns = [name_column, value_column, date_column]
+    if category_column is not None:
+        columns.append(category_column)
+    missing_columns = [c for c in columns if c not in (reader.fieldnames or [])]
+    if missing_columns:
+        raise PreprocessingError("Column(s) not found in CSV header: {}".format(
+            ", ".join(missing_columns)))
+
+    stats = {
+        "rows": 0,
+        "imported": 0,
+        "periods": {},
+        "skipped": [],
+        "failed": [],
+        "failed_rows": 0,
+    }
+    options["period"] = options.get("period") or default_period_name()
+    start = time.perf_counter()
+
+    reconcile = reconcile or dry_run
+    if reconcile:
+        stats.update(new=0, duplicates=[], probable=[])
+        indices = {}
+
+    batch = {}
+    batch_length = 0
+    for row in reader:
+        stats["rows"] += 1
+        try:
+            period, entry = _parse_row(
+                row,
+                name_column=name_column,
+                value_column=value_column,
+                date_column=date_column,
+                category_column=category_column,
+                **options)
+        except ValueError as e:
+            stats["skipped"].append((reader.line_num, str(e)))
+            continue
+
+        if reconcile:
+            index = indices.get(period)
+            if index is None:
+                elements = proxy.run("print", period=period)["elements"]
+                index = indices[period] = EntryIndex(iter_elements(elements))
+
+            classification, item = index.classify(entry)
+            if classification == DUPLICATE:
+                stats["duplicates"].append((reader.line_num,) + item)
+                continue
+            if classification == PROBABLE:
+                stats["probable"].append((reader.line_num,) + item)
+            else:
+                stats["new"] += 1
+            if dry_run:
+                continue
+
+        lines, entries = batch.setdefault(period, ([], []))
+        lines.append(reader.line_num)
+        entries.append(entry)
+        batch_length += 1
+        if batch_length >= batch_size:
+            _send_batch(proxy, batch, stats)
+            batch = {}
+            batch_length = 0
+
+    if batch:
+        _send_batch(proxy, batch, stats)
+
+    duration = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / duration if duration else 0.0
+    return stats
+
+
+def _send_batch(proxy, batch, stats):
+    periods = list(batch)
+    responses = proxy.run_many([{
+        "command": "add_many",
+        "period": period,
+        "entries": batch[period][1]
+    } for period in periods])
+
+    for period, response in zip(periods, responses):
+        if "error" in response:
+            lines = batch[period][0]
+            stats["failed"].append("Period {}, lines {}-{}: {}".format(
+                period, lines[0], lines[-1], response["error"]))
+            stats["failed_rows"] += len(lines)
+            continue
+        stats["imported"] += len(response["ids"])
+        stats["periods"][period] = \
+            stats["periods"].get(period, 0) + len(response["ids"])
@@ -1,5 +1,5 @@
 """Tabular, frontend-representation of financeager period."""
-from . import DEFAULT_TABLE
+from . import DEFAULT_TABLE, columnar
 from .entries import BaseEntry, CategoryEntry
 
 
@@ -104,9 +104,9 @@ class Listing:
 
 
 def prettify(elements, stacked_layout=False):
-    """Sort the given elements (type acc. to Period._search_all_tables) by
-    positive and negative value and return pretty string build from the
-    corresponding Listings.
+    """Sort the given elements (type acc. to Period._search_all_tables, or
+    encoded in columnar format) by positive and negative value and return
+    pretty string build from the corresponding Listings.
 
     :param stacked_layout: If True, listings are displayed one by one
     """
@@ -125,15 +125,24 @@ def prettify(elements, stacked_layout=False):
         else:
             expenses.append(flat_element)
 
-    # process standard elements
-    for eid, element in elements[DEFAULT_TABLE].items():
-        _sort(eid, element)
-
-    # process recurrent elements, i.e. for each eid iterate list
-    for eid, recurrent_elements in elements["recurrent"].items():
-        for element in recurrent_elements:
+    if columnar.is_columnar(elements):
+        # the decoded elements are not shared, hence they are not copied
+        for _, eid, element in columnar.iter_elements(elements):
+            element["eid"] = eid
+            if element["value"] > 0:
+                earnings.append(element)
+            else:
+                expenses.append(element)
+    else:
+        # process standard elements
+        for eid, element in elements[DEFAULT_TABLE].items():
             _sort(eid, element)
 
+        # process recurrent elements, i.e. for each eid iterate list
+        for eid, recurrent_elements in elements["recurrent"].items():
+            for element in recurrent_elements:
+                _sort(eid, element)
+
     if not earnings and not expenses:
         return ""
 
@@ -31,6 +31,27 @@ class LocalServer(Server):
 
         return response
 
+    def run_many(self, commands):
+        """Run several commands in a single batch. Each command is a dict
+        holding the command name (key 'command') and its kwargs.
+
+        :return: list of responses in the order of the commands. The response
+            of a failed command holds the key 'error'
+        :raises: CommunicationError on unexpected server error
+        """
+        return self.run("batch", commands=commands)["results"]
+
+    def export(self, **kwargs):
+        """Return an iterator over the lines of exported entries (see
+        ``Server.export``).
+
+        :raises: InvalidRequest on invalid format or filter pattern
+        """
+        try:
+            return super().export(**kwargs)
+        except ValueError as e:
+            raise InvalidRequest("Invalid request: {}".format(e))
+
 
 def proxy(**kwargs):
     return LocalServer(**kwargs)
@@ -0,0 +1,100 @@
+"""Synchronization primitives used by the backend."""
+from contextlib import contextmanager
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on non-Unix platforms; only threads are synchronized
+    fcntl = None
+
+
+class FileLock:
+    """Advisory lock shared between processes, based on fcntl.flock().
+
+    The lock file also stores a generation counter that is incremented by
+    writers. Comparing it with a previously read value is a cheap way to detect
+    modifications of the guarded data by other processes.
+
+    Since flock() locks are held per open file, threads of the same process
+    are additionally serialized by a reentrant lock. Nested acquisition is
+    permitted. If 'filepath' is None, only threads are synchronized.
+    """
+
+    # Width of the zero-padded generation counter in the lock file. A fixed
+    # width makes updates a single in-place write
+    GENERATION_WIDTH = 20
+
+    def __init__(self, filepath=None):
+        self._thread_lock = threading.RLock()
+        self._operation = None
+        self._fd = None
+
+        if filepath is not None:
+            self._fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def shared(self):
+        """Context manager holding the lock for reading."""
+        with self._locked(fcntl.LOCK_SH if fcntl else None):
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        """Context manager holding the lock for writing."""
+        with self._locked(fcntl.LOCK_EX if fcntl else None):
+            yield
+
+    @contextmanager
+    def _locked(self, operation):
+        with self._thread_lock:
+            previous_operation = self._operation
+            # Acquire the file lock if not held yet, or upgrade a shared lock
+            acquire = self._fd is not None and operation is not None
+            if acquire and previous_operation is not None:
+                acquire = previous_operation == fcntl.LOCK_SH and \
+                    operation == fcntl.LOCK_EX
+            if acquire:
+                fcntl.flock(self._fd, operation)
+                self._operation = operation
+
+            try:
+                yield
+            finally:
+                if self._operation != previous_operation:
+                    # Release, or downgrade to the shared lock held before
+                    fcntl.flock(self._fd, previous_operation or fcntl.LOCK_UN)
+                    self._operation = previous_operation
+
+    @property
+    def generation(self):
+        """Current value of the generation counter. Reading does not require
+        holding the lock.
+        """
+        if self._fd is None:
+            return 0
+
+        content = os.pread(self._fd, self.GENERATION_WIDTH, 0)
+        try:
+            return int(content)
+        except ValueError:
+            # Empty (new) lock file
+            return 0
+
+    def increment_generation(self):
+        """Increment the generation counter and return the new value. The lock
+        must be held exclusively.
+        """
+        if self._fd is None:
+            return 0
+
+        generation = self.generation + 1
+        os.pwrite(self._fd, "{:0{}d}".format(generation,
+                                             self.GENERATION_WIDTH).encode(), 0)
+        return generation
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
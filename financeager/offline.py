@@ -1,47 +1,135 @@
 """Module for storing client requests when server not available, and recovering
 of such.
+
+Requests are appended as JSON lines to a journal file. A cursor file next to it
+holds the byte offset of the first request that has not been recovered yet.
+Hence storing a request does not rewrite the journal, requests are recovered in
+the order they were stored, and an aborted recovery continues with the request
+that failed.
 """
 
-import os.path
 import json
+import os.path
 
 from . import OFFLINE_FILEPATH, init_logger
 from .communication import run
 from .exceptions import OfflineRecoveryError
+from .locking import FileLock
 
 logger = init_logger(__name__)
 
+CURSOR_SUFFIX = ".cursor"
+LOCK_SUFFIX = ".lock"
 
-def _load(filepath):
-    if os.path.exists(filepath):
-        with open(filepath, "r") as file:
-            content = json.load(file)
-            logger.debug("Loaded {}".format(content))
-    else:
-        content = []
 
-    return content
+def _legacy_filepath(filepath):
+    """Path of the JSON list file written by previous versions instead of the
+    journal (same path with extension '.json'), or None.
+    """
+    root, extension = os.path.splitext(filepath)
+    return root + ".json" if extension == ".jsonl" else None
+
+
+def _read_cursor(filepath):
+    try:
+        with open(filepath + CURSOR_SUFFIX, "r") as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_cursor(filepath, offset):
+    # Replace the file such that the cursor is never partially written
+    cursor_filepath = filepath + CURSOR_SUFFIX
+    with open(cursor_filepath + ".tmp", "w") as file:
+        file.write(str(offset))
+    os.replace(cursor_filepath + ".tmp", cursor_filepath)
+
+
+def _remove(filepath):
+    for path in [filepath, filepath + CURSOR_SUFFIX]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _append(filepath, content):
+    """Append the list of requests to the journal in a single write."""
+    if not os.path.exists(filepath):
+        # Cursor of a removed journal
+        _remove(filepath)
+
+    lines = "".join(json.dumps(data) + "\n" for data in content)
+    with open(filepath, "a+b") as file:
+        size = file.seek(0, os.SEEK_END)
+        if size:
+            # Start a new line if the last one is incomplete, e.g. due to an
+            # interrupted append
+            file.seek(size - 1)
+            if file.read(1) != b"\n":
+                lines = "\n" + lines
+        logger.debug("Appending {}".format(content))
+        file.write(lines.encode())
+
+
+def _migrate(filepath):
+    """Move the requests of a JSON list file of previous versions to the
+    journal.
+    """
+    legacy_filepath = _legacy_filepath(filepath)
+    if legacy_filepath is None or not os.path.exists(legacy_filepath):
+        return
 
+    with open(legacy_filepath, "r") as file:
+        content = json.load(file)
+    _append(filepath, content)
+    os.remove(legacy_filepath)
 
-def _write(content, filepath):
-    with open(filepath, "w") as file:
-        logger.debug("Writing {}".format(content))
-        json.dump(content, file)
+
+def _iter_pending(filepath):
+    """Generate the requests of the journal that have not been recovered yet,
+    as tuples of the byte offset of the next request and the request (dict).
+    Invalid lines are logged and skipped.
+    """
+    if not os.path.exists(filepath):
+        return
+
+    offset = _read_cursor(filepath)
+    with open(filepath, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            try:
+                data = json.loads(line.decode())
+                if not isinstance(data, dict):
+                    raise ValueError("Not an object")
+            except ValueError as e:
+                # E.g. a line torn by an interrupted append
+                logger.error("Skipping invalid line of offline backup "
+                             "({}): {!r}".format(e, line))
+                continue
+            yield offset, data
 
 
-def _recover_data(proxy, content):
-    """Recover the data items in the content list by running the commands via
-    the proxy. If a CommunicationError occurs during recovery, the data being
-    currently processed is returned.
-    The content list is modified in-place.
+def _load(filepath):
+    """Return the list of requests that have not been recovered yet."""
+    content = [data for _, data in _iter_pending(filepath)]
+    logger.debug("Loaded {}".format(content))
+    return content
+
+
+def _recover_data(proxy, filepath):
+    """Recover the pending requests of the journal in order by running the
+    commands via the proxy. The cursor is advanced after each recovered
+    request. If an error occurs during recovery, the data being currently
+    processed is returned, and remains pending.
     """
-    while len(content):
-        data = content.pop()
+    for offset, data in _iter_pending(filepath):
         try:
             logger.info(run(proxy, **data))
         except Exception as e:
             logger.exception(e)
             return data
+        _write_cursor(filepath, offset)
 
 
 def add(command, offline_filepath=None, **cl_kwargs):
@@ -57,11 +145,15 @@ def add(command, offline_filepath=None, **cl_kwargs):
         return False
 
     offline_filepath = offline_filepath or OFFLINE_FILEPATH
-    content = _load(offline_filepath)
 
     cl_kwargs["command"] = command
-    content.append(cl_kwargs)
-    _write(content, offline_filepath)
+    lock = FileLock(offline_filepath + LOCK_SUFFIX)
+    try:
+        with lock.exclusive():
+            _migrate(offline_filepath)
+            _append(offline_filepath, [cl_kwargs])
+    finally:
+        lock.close()
 
     return True
 
@@ -78,17 +170,30 @@ def recover(proxy, offline_filepath=None):
 
     offline_filepath = offline_filepath or OFFLINE_FILEPATH
 
-    content = _load(offline_filepath)
-    if not content:
+    legacy_filepath = _legacy_filepath(offline_filepath)
+    if not os.path.exists(offline_filepath) and not (
+            legacy_filepath is not None and os.path.exists(legacy_filepath)):
         return False
 
-    failed_recovery_data = _recover_data(proxy, content)
-
-    if failed_recovery_data is None:
-        os.remove(offline_filepath)
-    else:
-        content.append(failed_recovery_data)
-        _write(content, offline_filepath)
+    lock = FileLock(offline_filepath + LOCK_SUFFIX)
+    try:
+        with lock.exclusive():
+            _migrate(offline_filepath)
+            if not os.path.exists(offline_filepath):
+                # Recovered by another process meanwhile
+                return False
+            if _read_cursor(offline_filepath) >= \
+                    os.path.getsize(offline_filepath):
+                _remove(offline_filepath)
+                return False
+
+            failed_recovery_data = _recover_data(proxy, offline_filepath)
+            if failed_recovery_data is None:
+                _remove(offline_filepath)
+    finally:
+        lock.close()
+
+    if failed_recovery_data is not None:
         raise OfflineRecoveryError()
 
     return True
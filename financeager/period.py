@@ -1,10 +1,15 @@
 """Defines Period database object holding per-year financial data."""
 
+import json
 import os.path
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, namedtuple
+from contextlib import contextmanager
+import copy
 from dateutil import rrule
 from datetime import datetime as dt
 import re
+import time
+from types import MappingProxyType
 
 from tinydb import TinyDB, Query, storages
 from tinydb.database import Element
@@ -13,12 +18,18 @@ from schematics.types import StringType, FloatType, DateType
 from schematics.exceptions import DataError, ValidationError
 
 from . import PERIOD_DATE_FORMAT, default_period_name, DEFAULT_TABLE
+from .locking import FileLock
 
 # format for ValidationModel.to_primitive() call
 DateType.SERIALIZED_FORMAT = PERIOD_DATE_FORMAT
 
 _DEFAULT_CATEGORY = None
 
+# Minimum number of entries added at once to be validated in parallel, and
+# number of entries per validation task (see ``TinyDbPeriod.add_entries``)
+PARALLEL_VALIDATION_MIN_ENTRIES = 2000
+PARALLEL_VALIDATION_CHUNK_SIZE = 500
+
 
 class BaseValidationModel(SchematicsModel):
     name = StringType(min_length=1, required=True)
@@ -58,10 +69,106 @@ class Period:
         return int(self._name)
 
 
+def recurrent_element_name(name, frequency, date):
+    """Return the name of the element generated from a recurrent element at
+    the given date, i.e. the name with a date description appended according to
+    the frequency.
+
+    :type date: datetime.datetime
+    """
+    frequency = frequency.upper()
+    if frequency in ("MONTHLY", "BIMONTHLY", "QUARTER-YEARLY", "HALF-YEARLY"):
+        return "{}, {}".format(name, date.strftime("%B").lower())
+    if frequency == "WEEKLY":
+        return "{}, week {}".format(name, date.strftime("%W").lower())
+    if frequency == "DAILY":
+        return "{}, day {}".format(name, date.strftime("%-j").lower())
+    return name
+
+
+def _validate_chunk(table_name, entries):
+    """Validate and convert the given entries for the table. This is run by
+    worker processes (see ``TinyDbPeriod.add_entries``), hence the result
+    is returned instead of raising an exception.
+
+    :return: tuple of the list of converted fields of the valid entries up to
+        the first invalid one, and a tuple of the index and error message of
+        the first invalid entry (None if all entries are valid)
+    """
+    all_fields = []
+    for index, entry in enumerate(entries):
+        try:
+            all_fields.append(
+                TinyDbPeriod._validate_and_convert(dict(entry), table_name))
+        except PeriodException as e:
+            return all_fields, (index, str(e))
+    return all_fields, None
+
+
+def expand_recurrent_element(element, year, until=None):
+    """Generate elements (holding name, value, category, date) from the
+    information of the recurrent element being passed (holding name, value,
+    category, frequency, start, end). Elements after 'until' (datetime, default:
+    now) are not generated since they lie in the future.
+    """
+
+    # parse dates to datetime objects
+    start = dt.strptime("{}-{}".format(year, element["start"]),
+                        "%Y-" + PERIOD_DATE_FORMAT)
+    end = dt.strptime("{}-{}".format(year, element["end"]),
+                      "%Y-" + PERIOD_DATE_FORMAT)
+
+    until = until or dt.now()
+    if end > until:
+        # don't show entries that are in the future
+        end = until
+
+    interval = 1
+    frequency = element["frequency"].upper()
+    if frequency == "BIMONTHLY":
+        frequency = "MONTHLY"
+        interval = 2
+    elif frequency == "QUARTER-YEARLY":
+        frequency = "MONTHLY"
+        interval = 3
+    elif frequency == "HALF-YEARLY":
+        frequency = "MONTHLY"
+        interval = 6
+
+    rule = rrule.rrule(
+        getattr(rrule, frequency), dtstart=start, until=end, interval=interval)
+
+    for date in rule:
+        yield Element(
+            dict(
+                name=recurrent_element_name(element["name"], frequency, date),
+                value=element["value"],
+                category=element["category"],
+                date=date.strftime(PERIOD_DATE_FORMAT)))
+
+
 class PeriodException(Exception):
     pass
 
 
+class PeriodTransaction:
+    """Handle of a transaction of a TinyDbPeriod (see
+    ``TinyDbPeriod.transaction``)."""
+
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        """Mark the transaction to be rolled back when it ends."""
+        self.aborted = True
+
+
+# Immutable, versioned state of a TinyDbPeriod. 'tables' maps table names to
+# read-only dicts of elements (keyed by element ID). 'modified' is the time of
+# the last modification in seconds since the epoch
+PeriodSnapshot = namedtuple("PeriodSnapshot", ["version", "tables", "modified"])
+
+
 class TinyDbPeriod(Period):
     def __init__(self, name=None, data_dir=None, **kwargs):
         """Create a period with a TinyDB database backend, identified by 'name'.
@@ -70,6 +177,16 @@ class TinyDbPeriod(Period):
         stored in memory.
         Keyword args are passed to the TinyDB constructor. See the respective
         docs for detailed information.
+
+        Reading methods operate on an immutable snapshot of the database
+        content. Modifying methods publish a new snapshot version after having
+        written to the database, hence reading never blocks and is safe to run
+        concurrently with modifications. Concurrent modifications however have
+        to be serialized by the caller (see ``Server``).
+
+        With JSON storage, several processes can share the data directory.
+        Writing to the database file is guarded by a file lock, and the
+        period content is reloaded if another process modified the file.
         """
 
         super().__init__(name=name)
@@ -79,12 +196,172 @@ class TinyDbPeriod(Period):
         if data_dir is None:
             args = []
             kwargs["storage"] = storages.MemoryStorage
+            self._file_lock = FileLock()
         else:
             args = [os.path.join(data_dir, "{}.json".format(self.name))]
             kwargs["storage"] = storages.JSONStorage
+            self._file_lock = FileLock("{}.lock".format(args[0]))
+
+        self._db_args = args
+        self._db_kwargs = kwargs
+        # JSON fragments of standard elements (see ``serialize_entries``)
+        self._fragments = {}
+
+        with self._file_lock.shared():
+            self._generation = self._file_lock.generation
+            self._db = TinyDB(*args, **kwargs)
+            self._snapshot = self._read_snapshot()
+            self._create_category_cache()
+
+    @property
+    def version(self):
+        """Version of the period content, incremented on every modification."""
+        return self._snapshot.version
+
+    @property
+    def modified(self):
+        """Time of the last modification of the period content in seconds
+        since the epoch."""
+        return self._snapshot.modified
+
+    @property
+    def generation(self):
+        """Generation of the period content according to the file lock (see
+        ``locking.FileLock``). It is identical in all processes sharing the
+        data directory. None if the period is held in memory.
+        """
+        return self._generation if self._db_args else None
+
+    def _read_snapshot(self, version=0):
+        """Create a snapshot of the current database content."""
+        tables = {DEFAULT_TABLE: {}, "recurrent": {}}
+        # Avoid accessing non-existing tables since this creates them. The
+        # storage content is None if nothing has been written yet
+        stored_table_names = set(self._db._storage.read() or {})
+        for table_name in stored_table_names & set(tables):
+            tables[table_name] = {
+                e.eid: e
+                for e in self._db.table(table_name).all()
+            }
+        for table_name, table in tables.items():
+            tables[table_name] = MappingProxyType(table)
+
+        try:
+            modified = os.path.getmtime(self._db_args[0])
+        except (IndexError, OSError):
+            # Memory storage, or database file not created yet
+            modified = time.time()
+
+        return PeriodSnapshot(
+            version=version, tables=MappingProxyType(tables), modified=modified)
 
-        self._db = TinyDB(*args, **kwargs)
+    def refresh(self):
+        """Reload the period content if the database file has been modified by
+        another process. Checking is cheap and does not require locking.
+        """
+        if self._file_lock.generation != self._generation:
+            with self._file_lock.shared():
+                self._reload_if_stale()
+
+    def _reload_if_stale(self):
+        """Reload database, snapshot and category cache if the generation of
+        the file lock differs from the one last seen. The file lock must be
+        held.
+        """
+        generation = self._file_lock.generation
+        if generation == self._generation:
+            return
+
+        # Re-opening is required to update TinyDB's internal element ID counters
+        self._db.close()
+        self._db = TinyDB(*self._db_args, **self._db_kwargs)
+        self._snapshot = self._read_snapshot(version=self.version + 1)
+        self._fragments.clear()
         self._create_category_cache()
+        self._generation = generation
+
+    @contextmanager
+    def _exclusive_access(self):
+        """Context manager holding the file lock for modifying the database.
+        Stale content is reloaded beforehand. If the modification succeeds, the
+        generation counter is incremented to notify other processes.
+        """
+        with self._file_lock.exclusive():
+            self._reload_if_stale()
+            yield
+            self._generation = self._file_lock.increment_generation()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager for modifying the period atomically. The file lock
+        is held exclusively throughout. The context provides a
+        ``PeriodTransaction``. If an exception is raised within the context, or
+        the transaction is aborted, the database content, the category cache,
+        and the snapshot are restored to their state on entering the context,
+        and a new snapshot version is published.
+        """
+        with self._exclusive_access():
+            data = self._db._storage.read()
+            if isinstance(self._db._storage, storages.MemoryStorage):
+                # Only memory storage returns its content (modified in place)
+                # instead of a fresh copy
+                data = copy.deepcopy(data)
+            tables = self._snapshot.tables
+            category_cache = copy.deepcopy(self._category_cache)
+            transaction = PeriodTransaction()
+
+            try:
+                yield transaction
+            except Exception:
+                transaction.abort()
+                raise
+            finally:
+                if transaction.aborted:
+                    self._db._storage.write(data or {})
+                    # Re-create table objects to reset TinyDB's internal element
+                    # ID counters, analogous to the TinyDB constructor
+                    self._db._table_cache.clear()
+                    self._db._table = self._db.table(DEFAULT_TABLE)
+                    self._category_cache = category_cache
+                    self._snapshot = PeriodSnapshot(
+                        version=self.version + 1,
+                        tables=tables,
+                        modified=time.time())
+                    self._generation = self._file_lock.increment_generation()
+
+    def _publish(self, table_name, eid, element=None):
+        """Publish a new snapshot version in which the element of the given
+        table and ID is replaced by 'element', or removed if 'element' is None.
+        Only the affected table is copied. Readers holding the previous snapshot
+        are not affected.
+        """
+        if table_name == DEFAULT_TABLE:
+            self._fragments.pop(eid, None)
+        table = dict(self._snapshot.tables[table_name])
+        if element is None:
+            table.pop(eid, None)
+        else:
+            table[eid] = element
+        self._publish_table(table_name, table)
+
+    def _publish_many(self, table_name, elements):
+        """Publish a new snapshot version in which the given elements are added
+        to, or replaced in the given table (see ``_publish``).
+        """
+        table = dict(self._snapshot.tables[table_name])
+        for element in elements:
+            if table_name == DEFAULT_TABLE:
+                self._fragments.pop(element.eid, None)
+            table[element.eid] = element
+        self._publish_table(table_name, table)
+
+    def _publish_table(self, table_name, table):
+        tables = dict(self._snapshot.tables)
+        tables[table_name] = MappingProxyType(table)
+        self._snapshot = PeriodSnapshot(
+            version=self._snapshot.version + 1,
+            tables=MappingProxyType(tables),
+            modified=time.time())
 
     def _create_category_cache(self):
         """The category cache assigns a counter for each element name in the
@@ -92,7 +369,7 @@ class TinyDbPeriod(Period):
         categories the element was labeled with. This allows deriving the
         category of an element if not explicitly given."""
         self._category_cache = defaultdict(Counter)
-        for element in self._db.all():
+        for element in self._snapshot.tables[DEFAULT_TABLE].values():
             self._category_cache[element["name"]].update([element["category"]])
 
     def _preprocess_entry(self, raw_data=None, table_name=None, partial=False):
@@ -108,14 +385,8 @@ class TinyDbPeriod(Period):
         """
 
         table_name = table_name or DEFAULT_TABLE
-        if table_name not in ["recurrent", DEFAULT_TABLE]:
-            raise PeriodException("Unknown table name: {}".format(table_name))
-
-        self._remove_redundant_fields(table_name, raw_data)
-
-        validated_fields = self._validate_entry(
-            raw_data=raw_data, table_name=table_name, partial=partial)
-        converted_fields = self._convert_fields(**validated_fields)
+        converted_fields = self._validate_and_convert(
+            raw_data, table_name, partial=partial)
 
         if not partial:
             converted_fields = self._substitute_none_fields(
@@ -123,6 +394,20 @@ class TinyDbPeriod(Period):
 
         return converted_fields
 
+    @classmethod
+    def _validate_and_convert(cls, raw_data, table_name, partial=False):
+        """Perform the preprocessing steps that are independent of the period
+        content (validation, conversion). See ``_preprocess_entry``.
+        """
+        if table_name not in ["recurrent", DEFAULT_TABLE]:
+            raise PeriodException("Unknown table name: {}".format(table_name))
+
+        cls._remove_redundant_fields(table_name, raw_data)
+
+        validated_fields = cls._validate_entry(
+            raw_data=raw_data, table_name=table_name, partial=partial)
+        return cls._convert_fields(**validated_fields)
+
     @staticmethod
     def _remove_redundant_fields(table_name, raw_data):
         """The raw data (e.g. parsed from the command line) might contain fields
@@ -297,14 +582,104 @@ class TinyDbPeriod(Period):
         """
 
         table_name = table_name or DEFAULT_TABLE
-        fields = self._preprocess_entry(raw_data=kwargs, table_name=table_name)
 
-        self._update_category_cache(**fields)
+        with self._exclusive_access():
+            fields = self._preprocess_entry(
+                raw_data=kwargs, table_name=table_name)
 
-        element_id = self._db.table(table_name).insert(fields)
+            self._update_category_cache(**fields)
+
+            element_id = self._db.table(table_name).insert(fields)
+            self._publish(table_name, element_id, Element(fields, element_id))
 
         return element_id
 
+    def add_entries(self, entries, table_name=None, executor=None):
+        """Add several entries to the same table at once. Each entry is a dict
+        of the kwargs of ``add_entry``. All entries are preprocessed before the
+        database is written in a single operation, and a single snapshot
+        version is published. If any entry is invalid, none is added.
+
+        The entries are validated by ``convert_entries`` (passing 'executor'),
+        and added by ``add_converted_entries``.
+
+        :raise: PeriodException if validation of an entry failed (indicating
+            its index) or table name unknown
+        :return: list of TinyDB IDs of the new entries, in order
+        """
+        converted_entries = self.convert_entries(
+            entries, table_name=table_name, executor=executor)
+        return self.add_converted_entries(
+            converted_entries, table_name=table_name)
+
+    @staticmethod
+    def convert_entries(entries, table_name=None, executor=None):
+        """Validate and convert several entries for the given table. Each entry
+        is a dict of the kwargs of ``add_entry``. The period is not accessed,
+        hence no locking is required.
+
+        If an 'executor' (e.g. ``concurrent.futures.ProcessPoolExecutor``) is
+        given and there are at least PARALLEL_VALIDATION_MIN_ENTRIES entries,
+        the entries are validated and converted in chunks by the executor.
+        Validation errors are the same as when validating sequentially (the
+        first invalid entry is reported).
+
+        :raise: PeriodException if validation of an entry failed (indicating
+            its index) or table name unknown
+        :return: list of dicts of the converted fields, in order
+        """
+        table_name = table_name or DEFAULT_TABLE
+        entries = list(entries)
+
+        if executor is not None and \
+                len(entries) >= PARALLEL_VALIDATION_MIN_ENTRIES:
+            size = PARALLEL_VALIDATION_CHUNK_SIZE
+            chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+            results = executor.map(_validate_chunk, [table_name] * len(chunks),
+                                   chunks)
+        else:
+            results = [_validate_chunk(table_name, entries)]
+
+        converted_entries = []
+        for fields, error in results:
+            if error is not None:
+                index, message = error
+                raise PeriodException("Entry {}: {}".format(
+                    len(converted_entries) + index, message))
+            converted_entries.extend(fields)
+        return converted_entries
+
+    def add_converted_entries(self, converted_entries, table_name=None):
+        """Add entries returned by ``convert_entries`` to the table. The
+        substitution of missing fields and the database write are performed
+        in order, in a single operation.
+
+        :return: list of TinyDB IDs of the new entries, in order
+        """
+        table_name = table_name or DEFAULT_TABLE
+
+        with self._exclusive_access():
+            all_fields = []
+            try:
+                for fields in converted_entries:
+                    fields = self._substitute_none_fields(
+                        table_name=table_name, **fields)
+                    # Entries derive their category from the previous ones,
+                    # as if added one by one
+                    self._update_category_cache(**fields)
+                    all_fields.append(fields)
+            except Exception:
+                for fields in all_fields:
+                    self._update_category_cache(removing=True, **fields)
+                raise
+
+            element_ids = self._db.table(table_name).insert_multiple(all_fields)
+            self._publish_many(
+                table_name,
+                [Element(f, eid) for f, eid in zip(all_fields, element_ids)])
+
+        return element_ids
+
     def get_entry(self, eid, table_name=None):
         """
         Get entry specified by ``eid`` in the table ``table_name`` (defaults to
@@ -313,15 +688,17 @@ class TinyDbPeriod(Period):
         :type eid: int or str
 
         :raise: PeriodException if element not found
-        :return: found element (tinydb.Element)
+        :return: copy of found element (tinydb.Element)
         """
 
         table_name = table_name or DEFAULT_TABLE
-        element = self._db.table(table_name).get(eid=int(eid))
+        self.refresh()
+        table = self._snapshot.tables.get(table_name, {})
+        element = table.get(int(eid))
         if element is None:
             raise PeriodException("Element not found.")
 
-        return element
+        return Element(element, element.eid)
 
     def update_entry(self, eid, table_name=None, **kwargs):
         """Update one or more fields of a single entry of the Period.
@@ -337,19 +714,30 @@ class TinyDbPeriod(Period):
         """
 
         table_name = table_name or DEFAULT_TABLE
-        fields = self._preprocess_entry(
-            raw_data=kwargs, table_name=table_name, partial=True)
 
-        self._update_category_cache(eid=eid, table_name=table_name, **fields)
+        with self._exclusive_access():
+            fields = self._preprocess_entry(
+                raw_data=kwargs, table_name=table_name, partial=True)
+
+            self._update_category_cache(
+                eid=eid, table_name=table_name, **fields)
+
+            element_id = self._db.table(table_name).update(
+                fields, eids=[int(eid)])[0]
 
-        element_id = self._db.table(table_name).update(
-            fields, eids=[int(eid)])[0]
+            element = Element(self._snapshot.tables[table_name][element_id],
+                              element_id)
+            element.update(fields)
+            self._publish(table_name, element_id, element)
 
         return element_id
 
-    def _search_all_tables(self, query_impl=None):
-        """Search both the standard table and the recurrent table for elements
-        that satisfy the given condition.
+    def _search_all_tables(self,
+                           snapshot,
+                           query_impl=None,
+                           expand_recurrent=True):
+        """Search both the standard table and the recurrent table of the given
+        snapshot for elements that satisfy the given condition.
 
         The elements' `eid` attribute is used as key in the returned subdicts
         because it is lost in the client-server communication protocol (on
@@ -357,27 +745,28 @@ class TinyDbPeriod(Period):
         JSON response returned drops the Element.eid attribute s.t. it's not
         available when calling prettify on the client side).
 
+        :type snapshot: PeriodSnapshot
         :param query_impl: condition for the search. If none (default), all
             elements are returned.
         :type query_impl: tinydb.queries.QueryImpl
+        :param expand_recurrent: if False, the recurrent table is not searched
 
         :return: dict
         """
 
         elements = {DEFAULT_TABLE: {}, "recurrent": defaultdict(list)}
 
-        if query_impl is None:
-            matching_standard_elements = self._db.all()
-        else:
-            matching_standard_elements = self._db.search(query_impl)
+        for element in snapshot.tables[DEFAULT_TABLE].values():
+            if query_impl is None or query_impl(element):
+                elements[DEFAULT_TABLE][element.eid] = element
 
-        for element in matching_standard_elements:
-            elements[DEFAULT_TABLE][element.eid] = element
+        if not expand_recurrent:
+            return elements
 
         # all recurrent elements are generated, and the ones matching the
         # query are appended to a list that is stored under their generating
         # element's eid in the 'recurrent' subdictionary
-        for element in self._db.table("recurrent").all():
+        for element in snapshot.tables["recurrent"].values():
             for e in self._create_recurrent_elements(element):
                 matching_recurrent_element = None
 
@@ -395,54 +784,10 @@ class TinyDbPeriod(Period):
 
     def _create_recurrent_elements(self, element):
         """Generate elements (holding name, value, category, date) from the
-        information of the recurrent element being passed.
+        information of the recurrent element being passed (see
+        ``expand_recurrent_element``).
         """
-
-        # parse dates to datetime objects
-        start = dt.strptime(element["start"],
-                            PERIOD_DATE_FORMAT).replace(year=self.year)
-        end = dt.strptime(element["end"],
-                          PERIOD_DATE_FORMAT).replace(year=self.year)
-
-        now = dt.now()
-        if end > now:
-            # don't show entries that are in the future
-            end = now
-
-        interval = 1
-        frequency = element["frequency"].upper()
-        if frequency == "BIMONTHLY":
-            frequency = "MONTHLY"
-            interval = 2
-        elif frequency == "QUARTER-YEARLY":
-            frequency = "MONTHLY"
-            interval = 3
-        elif frequency == "HALF-YEARLY":
-            frequency = "MONTHLY"
-            interval = 6
-
-        rule = rrule.rrule(
-            getattr(rrule, frequency),
-            dtstart=start,
-            until=end,
-            interval=interval)
-
-        for date in rule:
-            # add date description to name
-            name = element["name"]
-            if frequency == "MONTHLY":
-                name = "{}, {}".format(name, date.strftime("%B").lower())
-            elif frequency == "WEEKLY":
-                name = "{}, week {}".format(name, date.strftime("%W").lower())
-            elif frequency == "DAILY":
-                name = "{}, day {}".format(name, date.strftime("%-j").lower())
-
-            yield Element(
-                dict(
-                    name=name,
-                    value=element["value"],
-                    category=element["category"],
-                    date=date.strftime(PERIOD_DATE_FORMAT)))
+        return expand_recurrent_element(element, self.year)
 
     def remove_entry(self, eid, table_name=None):
         """Remove an entry from the Period database given its ID. The category
@@ -459,11 +804,14 @@ class TinyDbPeriod(Period):
         """
 
         table_name = table_name or DEFAULT_TABLE
-        # might raise PeriodException if ID not existing
-        entry = self.get_entry(eid=int(eid), table_name=table_name)
 
-        self._db.table(table_name).remove(eids=[entry.eid])
-        self._update_category_cache(removing=True, **entry)
+        with self._exclusive_access():
+            # might raise PeriodException if ID not existing
+            entry = self.get_entry(eid=int(eid), table_name=table_name)
+
+            self._db.table(table_name).remove(eids=[entry.eid])
+            self._publish(table_name, entry.eid)
+            self._update_category_cache(removing=True, **entry)
 
         return entry.eid
 
@@ -517,10 +865,14 @@ class TinyDbPeriod(Period):
 
         return condition
 
-    def get_entries(self, filters=None):
+    def get_entries(self, filters=None, columnar=False, expand_recurrent=True):
         """Get dict of standard and recurrent entries that match the items of
         the filters dict, if specified. Constructs a condition from the given
         filters and uses it to query all tables.
+        If 'columnar' is set, the entries are encoded in the compact format of
+        ``columnar.encode``. If additionally 'expand_recurrent' is False, the
+        recurrent entries are not generated; instead all recurrent elements are
+        encoded along with the filters, and expanded by the recipient.
 
         :return: dict{
                     DEFAULT_TABLE:  dict{ int: tinydb.Element },
@@ -528,13 +880,99 @@ class TinyDbPeriod(Period):
                     }
         """
 
+        self.refresh()
+        snapshot = self._snapshot
         filters = filters or {}
         condition = self._create_query_condition(**filters)
-        return self._search_all_tables(condition)
+        expand_recurrent = expand_recurrent or not columnar
+        elements = self._search_all_tables(snapshot, condition,
+                                           expand_recurrent)
+
+        if columnar:
+            # Imported here to avoid circular import
+            from . import columnar as columnar_format
+            recurrent_elements = snapshot.tables["recurrent"]
+            # The year is only required to derive the names of recurrent
+            # entries, and undefined for non-numeric period names
+            year = self.year if recurrent_elements else None
+            if expand_recurrent:
+                return columnar_format.encode(elements, recurrent_elements,
+                                              year)
+            return columnar_format.encode_templates(
+                elements, recurrent_elements, year, filters)
+        return elements
+
+    def iter_entries(self, filters=None, expand_recurrent=True):
+        """Generate the entries that match the filters (see ``get_entries``)
+        one by one, as tuples of table name, element ID, and element, without
+        collecting them. The standard entries precede the recurrent entries.
+        If 'expand_recurrent' is False, the recurrent elements (holding
+        frequency, start and end instead of date) are generated instead of
+        their occurrences.
+        The entries are read from the snapshot at the time of the call, hence
+        modifications of the period do not affect the iteration.
+
+        :return: iterator
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        condition = self._create_query_condition(**(filters or {}))
+
+        def matches(element):
+            return condition is None or condition(element)
+
+        def generate():
+            for eid, element in snapshot.tables[DEFAULT_TABLE].items():
+                if matches(element):
+                    yield DEFAULT_TABLE, eid, element
+
+            for eid, element in snapshot.tables["recurrent"].items():
+                if not expand_recurrent:
+                    if matches(element):
+                        yield "recurrent", eid, element
+                    continue
+                for e in self._create_recurrent_elements(element):
+                    if matches(e):
+                        yield "recurrent", eid, e
+
+        return generate()
+
+    def serialize_entries(self, elements):
+        """Encode entries as returned by ``get_entries`` (not columnar) as JSON.
+        The JSON fragment of each standard element is cached until the element
+        is modified, hence only new and modified elements are encoded. The
+        occurrences of recurrent elements are generated per query and encoded
+        along.
+
+        :return: bytes
+        """
+        standard = b", ".join(
+            b'"%d": %s' % (eid, self._fragment(element))
+            for eid, element in elements[DEFAULT_TABLE].items())
+        recurrent = json.dumps(
+            {str(eid): o
+             for eid, o in elements["recurrent"].items()}).encode()
+        return b'{"%s": {%s}, "recurrent": %s}' % (DEFAULT_TABLE.encode(),
+                                                   standard, recurrent)
+
+    def _fragment(self, element):
+        """Return the JSON fragment of the given standard element, encoding
+        and caching it if not cached yet. Elements that are not part of the
+        current snapshot are encoded without being cached.
+        """
+        cached = self._fragments.get(element.eid)
+        if cached is not None and cached[0] is element:
+            return cached[1]
+
+        fragment = json.dumps(element).encode()
+        if self._snapshot.tables[DEFAULT_TABLE].get(element.eid) is element:
+            self._fragments[element.eid] = (element, fragment)
+        return fragment
 
     def close(self):
-        """Close underlying database."""
+        """Close underlying database and lock file."""
         self._db.close()
+        self._file_lock.close()
 
 
 TinyDB.DEFAULT_TABLE = DEFAULT_TABLE
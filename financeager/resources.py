@@ -1,10 +1,14 @@
 """Webservice resources as end points of financeager REST API."""
+import calendar
 import json
 
 import flask
 from flask_restful import Resource, reqparse
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
 
 from . import init_logger
+from .exporting import MIMETYPES
+from .server import check_filters
 
 logger = init_logger(__name__)
 
@@ -27,6 +31,9 @@ put_parser.add_argument("table_name")
 print_parser = reqparse.RequestParser()
 print_parser.add_argument("filters")
 
+batch_parser = reqparse.RequestParser()
+batch_parser.add_argument("commands", required=True, type=list, location="json")
+
 update_parser = reqparse.RequestParser()
 update_parser.add_argument("name")
 update_parser.add_argument("value", type=float)
@@ -37,6 +44,89 @@ update_parser.add_argument("start")
 update_parser.add_argument("end")
 
 
+def print_arguments(query_items):
+    """Convert the items of a query string into arguments of the 'print'
+    command. The parameter 'format' selects the response encoding: 'json',
+    'columnar', or 'templates' (columnar with unexpanded recurrent entries, see
+    ``columnar``); all other items are filters. An empty
+    pattern is converted to None (i.e., filtering for the default category, or
+    not filtering the field at all).
+
+    :param query_items: iterable of key-value pairs
+    :return: dict
+    :raise: ValueError if the format is unknown
+    """
+    arguments = {}
+    filters = {}
+    for key, value in query_items:
+        if key == "format":
+            if value not in ("json", "columnar", "templates"):
+                raise ValueError("Unknown format '{}'".format(value))
+            arguments["columnar"] = value != "json"
+            arguments["expand_recurrent"] = value != "templates"
+        else:
+            filters[key] = value or None
+    if filters:
+        arguments["filters"] = filters
+    return arguments
+
+
+def export_arguments(query_items):
+    """Convert the items of the query string of an export request into
+    arguments of ``Server.export``. The parameter 'format' selects 'csv'
+    (default) or 'jsonl'; 'recurrent=templates' selects exporting recurrent
+    elements instead of their occurrences. All other items are filters (see
+    ``print_arguments``).
+
+    :param query_items: iterable of key-value pairs
+    :return: dict
+    :raise: ValueError if the value of 'recurrent' is unknown
+    """
+    arguments = {}
+    filters = {}
+    for key, value in query_items:
+        if key == "format":
+            arguments["format"] = value
+        elif key == "recurrent":
+            if value not in ("occurrences", "templates"):
+                raise ValueError("Unknown recurrent mode '{}'".format(value))
+            arguments["expand_recurrent"] = value == "occurrences"
+        else:
+            filters[key] = value or None
+    if filters:
+        arguments["filters"] = filters
+    return arguments
+
+
+def validator_headers(etag, last_modified):
+    """Return dict of ETag and Last-Modified headers (see
+    ``Server.period_validators``)."""
+    return {
+        "ETag": quote_etag(etag),
+        "Last-Modified": http_date(last_modified),
+    }
+
+
+def is_not_modified(etag,
+                    last_modified,
+                    if_none_match=None,
+                    if_modified_since=None):
+    """Evaluate the conditional request headers given as raw values. If
+    If-None-Match is given, If-Modified-Since is ignored.
+
+    :return: True if the representation of the client is up to date
+    """
+    if if_none_match is not None:
+        return parse_etags(if_none_match).contains_weak(etag)
+
+    if if_modified_since is not None:
+        since = parse_date(if_modified_since)
+        return since is not None and \
+            int(last_modified) <= calendar.timegm(since.utctimetuple())
+
+    return False
+
+
 class LogResource(Resource):
     """Custom class to facilitate request logging and safe execution of server
     commands."""
@@ -78,9 +168,39 @@ class PeriodsResource(LogResource):
 
 class PeriodResource(LogResource):
     def get(self, period_name):
+        """Filters and format are given in the query string. Filters sent as
+        JSON-encoded body are supported for backwards compatibility.
+        Conditional requests are answered by 304 Not Modified.
+        """
         args = json.loads(flask.request.json or "{}")
-        return self.run_safely(
-            "print", error_code=400, period=period_name, **args)
+        try:
+            args.update(print_arguments(flask.request.args.items()))
+            check_filters(args.get("filters"))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            etag, last_modified = self.server.period_validators(period_name)
+            headers = validator_headers(etag, last_modified)
+
+            if is_not_modified(etag, last_modified,
+                               flask.request.headers.get("If-None-Match"),
+                               flask.request.headers.get("If-Modified-Since")):
+                return flask.Response(status=304, headers=headers)
+
+            # The response is pre-encoded by the server (see
+            # ``Server.run_serialized``), bypassing the JSON encoding of
+            # Flask-RESTful
+            body, error = self.server.run_serialized(
+                "print", period=period_name, **args)
+        except Exception:
+            logger.exception("Unexpected error")
+            return {"error": "unexpected error"}, 500
+
+        if error:
+            return flask.Response(body, status=400, mimetype="application/json")
+        return flask.Response(
+            body, status=200, mimetype="application/json", headers=headers)
 
     def post(self, period_name):
         args = put_parser.parse_args()
@@ -88,6 +208,24 @@ class PeriodResource(LogResource):
             "add", error_code=400, period=period_name, **args)
 
 
+class ExportResource(LogResource):
+    def get(self, period_name):
+        """Stream the entries of the period in the format given by the query
+        string (see ``export_arguments``).
+        """
+        try:
+            args = export_arguments(flask.request.args.items())
+            lines = self.server.export(period=period_name, **args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception:
+            logger.exception("Unexpected error")
+            return {"error": "unexpected error"}, 500
+
+        return flask.Response((line.encode() for line in lines),
+                              mimetype=MIMETYPES[args.get("format", "csv")])
+
+
 class EntryResource(LogResource):
     def get(self, period_name, table_name, eid):
         return self.run_safely(
@@ -120,3 +258,9 @@ class CopyResource(LogResource):
     def post(self):
         args = copy_parser.parse_args()
         return self.run_safely("copy", error_code=404, **args)
+
+
+class BatchResource(LogResource):
+    def post(self):
+        args = batch_parser.parse_args()
+        return self.run_safely("batch", error_code=400, **args)
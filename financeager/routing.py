@@ -0,0 +1,315 @@
+"""Front dispatcher routing requests to worker processes by period name. Each
+period is served by exactly one worker, hence its database and caches are held
+in the memory of a single process only.
+"""
+import http.client
+import json
+import select
+import threading
+from urllib.parse import quote
+import zlib
+
+from . import (PERIODS_TAIL, COPY_TAIL, BATCH_TAIL, DEFAULT_TABLE,
+               default_period_name, init_logger)
+
+logger = init_logger(__name__)
+
+# Headers that only apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host"
+}
+
+# Methods of requests that can be repeated without changing their effect
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class PeriodRouter:
+    """WSGI app forwarding requests to the worker that is responsible for the
+    requested period. Requests not specific to a single period are handled as
+    follows:
+    - listing periods is fanned out to all workers and the results are merged
+    - copying an entry between periods of different workers is performed by
+      getting the entry from the source worker and adding it via the
+      destination worker
+    - batches are split into one batch per worker
+    Compressed request bodies are not supported; the router is wrapped in a
+    ``compression.CompressionMiddleware`` when serving.
+    """
+
+    def __init__(self, worker_addresses, timeout=None):
+        """:param worker_addresses: list of (host, port) tuples of the workers
+        :param timeout: timeout in seconds for requests to the workers
+        """
+        self._worker_addresses = list(worker_addresses)
+        self._timeout = timeout
+        # Persistent connections to the workers, per thread
+        self._local = threading.local()
+
+    def worker_index(self, period_name):
+        """Return index of the worker responsible for the given period. A
+        stable hash function is used; Python's hash() of strings differs
+        between processes.
+        """
+        return zlib.crc32(str(period_name).encode()) % len(
+            self._worker_addresses)
+
+    def __call__(self, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        # PATH_INFO holds the unquoted bytes of the path decoded as latin-1
+        # (PEP 3333). Period names are UTF-8, as in the bodies of copy and
+        # batch requests
+        path = environ.get("PATH_INFO", "").encode("latin-1").decode(
+            "utf-8", "replace")
+        query = environ.get("QUERY_STRING")
+        body = environ["wsgi.input"].read(
+            int(environ.get("CONTENT_LENGTH") or 0))
+        headers = {
+            key[5:].replace("_", "-").title(): value
+            for key, value in environ.items() if key.startswith("HTTP_")
+        }
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        for key in list(headers):
+            if key.lower() in HOP_BY_HOP_HEADERS:
+                del headers[key]
+
+        url = quote(path) + ("?" + query if query else "")
+        # Responses of the workers that are processed by the router must not
+        # be compressed
+        identity_headers = {
+            k: v
+            for k, v in headers.items() if k.lower() != "accept-encoding"
+        }
+        try:
+            if path == PERIODS_TAIL:
+                status, response_headers, response_body = self._list(
+                    method, url, body, identity_headers)
+            elif path == COPY_TAIL:
+                status, response_headers, response_body = self._copy(
+                    method, url, body, identity_headers)
+            elif path == BATCH_TAIL:
+                status, response_headers, response_body = self._batch(
+                    method, url, body, identity_headers)
+            elif path.startswith(PERIODS_TAIL + "/"):
+                period_name = path[len(PERIODS_TAIL) + 1:].split("/")[0]
+                status, response_headers, response_body = self._forward(
+                    self.worker_index(period_name), method, url, body, headers)
+            else:
+                status, response_headers, response_body = _json_response(
+                    404, {"error": "Not found"})
+        except (OSError, http.client.HTTPException) as e:
+            logger.exception("Error forwarding request")
+            status, response_headers, response_body = _json_response(
+                502, {"error": "Worker not available: {}".format(e)})
+
+        start_response(
+            "{} {}".format(status, http.client.responses.get(status, "")),
+            response_headers)
+        return [response_body]
+
+    def _forward(self, index, method, url, body, headers):
+        """Send request to the worker of the given index. If the connection
+        fails, the request is retried once with a new connection, unless it
+        might have been processed already, i.e. it has been sent completely
+        and is not idempotent.
+
+        :return: tuple of status code, list of header tuples, and body
+        """
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        for attempt in range(2):
+            connection = connections.get(index)
+            if connection is not None and _is_closed(connection):
+                # The worker closed the idle persistent connection
+                connection.close()
+                connection = None
+            if connection is None:
+                connection = http.client.HTTPConnection(
+                    *self._worker_addresses[index], timeout=self._timeout)
+                connections[index] = connection
+            sent = False
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                response_body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                connection.close()
+                del connections[index]
+                # Repeating a modifying request might apply it twice
+                if attempt or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+
+        if response.will_close:
+            connection.close()
+            del connections[index]
+
+        response_headers = [(k, v) for k, v in response.getheaders()
+                            if k.lower() not in HOP_BY_HOP_HEADERS]
+        return response.status, response_headers, response_body
+
+    def _list(self, method, url, body, headers):
+        """Fan out request to all workers and merge the period names."""
+        period_names = []
+        for index in range(len(self._worker_addresses)):
+            status, response_headers, response_body = self._forward(
+                index, method, url, body, headers)
+            if status != 200:
+                return status, response_headers, response_body
+            period_names.extend(json.loads(response_body.decode())["periods"])
+
+        return _json_response(200, {"periods": sorted(period_names)})
+
+    def _copy(self, method, url, body, headers):
+        """Copy an entry between periods. If both periods are served by the
+        same worker, the request is forwarded. Otherwise the entry is fetched
+        from the source worker and added via the destination worker.
+        """
+        try:
+            data = json.loads(body.decode())
+            source_index = self.worker_index(data["source_period"])
+            destination_index = self.worker_index(data["destination_period"])
+            eid = int(data["eid"])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            # Let the worker respond with an appropriate error message
+            return self._forward(0, method, url, body, headers)
+
+        if source_index == destination_index:
+            return self._forward(source_index, method, url, body, headers)
+
+        table_name = data.get("table_name") or DEFAULT_TABLE
+        status, response_headers, response_body = self._forward(
+            source_index, "GET", "{}/{}/{}/{}".format(
+                PERIODS_TAIL, quote(str(data["source_period"])),
+                quote(str(table_name)), eid), None, {})
+        if status != 200:
+            return status, response_headers, response_body
+
+        element = json.loads(response_body.decode())["element"]
+        element["table_name"] = table_name
+        headers = dict(headers, **{"Content-Type": "application/json"})
+        return self._forward(
+            destination_index, "POST", "{}/{}".format(
+                PERIODS_TAIL, quote(str(data["destination_period"]))),
+            json.dumps(element).encode(), headers)
+
+    def _batch(self, method, url, body, headers):
+        """Split the batch into one batch per worker, according to the period
+        of each command. All commands of a period are sent to the same worker,
+        hence transactions per period are preserved. Commands of different
+        workers are not ordered relative to each other.
+        Listing periods is answered by fanning out after all other commands
+        have been run. Copying between periods of different workers is not
+        supported in a batch.
+        The results are merged in the order of the commands. If a worker
+        fails to run its batch, the results of its commands are replaced by
+        the error, and the results of the other workers are kept.
+        """
+        try:
+            commands = json.loads(body.decode())["commands"]
+            if not isinstance(commands, list):
+                raise TypeError
+        except (ValueError, TypeError, KeyError):
+            # Let the worker respond with an appropriate error message
+            return self._forward(0, method, url, body, headers)
+
+        results = [None] * len(commands)
+        # Command indices per worker index
+        worker_commands = {}
+        list_indices = []
+        for index, command in enumerate(commands):
+            if not isinstance(command, dict):
+                # Let the worker respond with an appropriate error
+                worker_commands.setdefault(0, []).append(index)
+                continue
+
+            if command.get("command") == "list":
+                # Answered after the other commands have been run
+                list_indices.append(index)
+                continue
+
+            if command.get("command") == "copy":
+                worker_index = self.worker_index(
+                    command.get("destination_period") or default_period_name())
+                if worker_index != self.worker_index(
+                        command.get("source_period") or default_period_name()):
+                    results[index] = {
+                        "error":
+                        "Copying between periods of different workers is "
+                        "not supported in a batch."
+                    }
+                    continue
+            else:
+                worker_index = self.worker_index(
+                    command.get("period") or default_period_name())
+            worker_commands.setdefault(worker_index, []).append(index)
+
+        headers = dict(headers, **{"Content-Type": "application/json"})
+        for worker_index, indices in sorted(worker_commands.items()):
+            body = json.dumps({
+                "commands": [commands[i] for i in indices]
+            }).encode()
+            try:
+                status, _, response_body = self._forward(
+                    worker_index, method, url, body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                logger.exception("Error forwarding batch")
+                result = {"error": "Worker not available: {}".format(e)}
+            else:
+                result = _worker_result(status, response_body)
+
+            worker_results = result["results"] if "results" in result else \
+                len(indices) * [result]
+            for index, worker_result in zip(indices, worker_results):
+                results[index] = worker_result
+
+        if list_indices:
+            try:
+                status, _, response_body = self._list("POST", PERIODS_TAIL,
+                                                      None, {})
+            except (OSError, http.client.HTTPException) as e:
+                logger.exception("Error listing periods")
+                result = {"error": "Worker not available: {}".format(e)}
+            else:
+                result = _worker_result(status, response_body)
+            for index in list_indices:
+                results[index] = result
+
+        return _json_response(200, {"results": results})
+
+
+def _json_response(status, content):
+    body = json.dumps(content).encode()
+    return status, [("Content-Type", "application/json"),
+                    ("Content-Length", str(len(body)))], body
+
+
+def _worker_result(status, body):
+    """Decode the JSON response body of a worker. An error response is turned
+    into an error result.
+    """
+    try:
+        content = json.loads(body.decode())
+    except ValueError:
+        content = None
+    if not isinstance(content, dict):
+        content = {}
+    if status == 200 or "error" in content:
+        return content
+    return {"error": "Worker responded with status {}".format(status)}
+
+
+def _is_closed(connection):
+    """Whether the peer closed the idle connection. An idle connection is only
+    readable at its end, or if the peer sent unexpected data; it can't be
+    reused in either case.
+    """
+    if connection.sock is None:
+        return False
+    readable, _, _ = select.select([connection.sock], [], [], 0)
+    return bool(readable)
@@ -0,0 +1,119 @@
+"""Rule-based categorization of entries by name patterns."""
+from collections import deque, namedtuple
+from configparser import ConfigParser, Error as ConfigParserError
+
+from .exceptions import PreprocessingError
+
+# A rule applies to entries whose name contains 'pattern', and assigns 'name'
+# and 'category' to them
+Rule = namedtuple("Rule", ["pattern", "name", "category"])
+
+
+class AhoCorasick:
+    """Automaton finding occurrences of several patterns in a text in a single
+    pass, independent of the number of patterns (Aho-Corasick algorithm).
+    """
+
+    def __init__(self, patterns):
+        """Build the automaton from the given sequence of strings."""
+        # Per state: transitions (dict character -> state), failure link, and
+        # the smallest index of the patterns ending in the state, including
+        # those reached via failure links (None if there is no such pattern)
+        self._goto = [{}]
+        self._fail = [0]
+        self._match = [None]
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for character in pattern:
+                next_state = self._goto[state].get(character)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(None)
+                    self._goto[state][character] = next_state
+                state = next_state
+            if self._match[state] is None:
+                self._match[state] = index
+
+        # Breadth-first traversal such that the failure links of shorter
+        # prefixes are known
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and character not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(character, 0)
+                self._fail[next_state] = fail
+
+                matches = [
+                    m for m in (self._match[next_state], self._match[fail])
+                    if m is not None
+                ]
+                self._match[next_state] = min(matches) if matches else None
+
+    def first_match(self, text):
+        """Return the smallest index of the patterns occurring in the text, or
+        None if no pattern occurs.
+        """
+        goto, fail, match = self._goto, self._fail, self._match
+        result = None
+        state = 0
+
+        for character in text:
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+
+            index = match[state]
+            if index is not None and (result is None or index < result):
+                result = index
+                if result == 0:
+                    break
+
+        return result
+
+
+class Categorizer:
+    """Assign name and category to entries according to a list of rules. If
+    the name of an entry matches several rules, the first one applies. Matching
+    is case-insensitive.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._automaton = AhoCorasick([r.pattern.lower() for r in self.rules])
+
+    @classmethod
+    def from_file(cls, filepath):
+        """Read the rules from an INI-style file. Every section name is a
+        category, and every line of the section is a pattern, optionally
+        followed by '=' and the name to assign (default: the pattern):
+
+            [groceries]
+            lidl
+            dm fil = dm
+
+        :raise: PreprocessingError if the file can not be read or parsed
+        """
+        parser = ConfigParser(allow_no_value=True, delimiters=("=",))
+        try:
+            with open(filepath) as file:
+                parser.read_file(file)
+        except (OSError, ConfigParserError) as e:
+            raise PreprocessingError("Invalid rules file: {}".format(e))
+
+        return cls(
+            Rule(pattern=pattern, name=name or pattern, category=category)
+            for category in parser.sections()
+            for pattern, name in parser.items(category))
+
+    def match(self, name):
+        """Return the first rule matching the name, or None."""
+        index = self._automaton.first_match(name.lower())
+        return None if index is None else self.rules[index]
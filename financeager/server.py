@@ -1,21 +1,89 @@
 """Top-level backend organization of databases."""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, ExitStack
+from datetime import date
+import json
+import multiprocessing
+import re
+import sys
+import threading
+import time
+import uuid
+
+from tinydb.database import Element
 
 from . import default_period_name, init_logger
+from .caching import ResultCache, SingleFlight
+from .exporting import check_format, export_lines
 from .period import TinyDbPeriod, PeriodException
 
 logger = init_logger(__name__)
 
+# Commands that don't modify the period database
+READ_COMMANDS = ("print", "get")
+
+# Commands that modify the period database. For 'copy', this is the destination
+# period
+WRITE_COMMANDS = ("add", "add_many", "rm", "update", "copy")
+
+# Default maximum number of cached 'print' results
+RESULT_CACHE_SIZE = 128
+
 
 class Server:
     """Server class holding the ``TinyDbPeriod`` databases.
 
     All database handling is taken care of in the underlying `TinyDbPeriod`.
     Kwargs (f.i. storage) are passed to the TinyDbPeriod member.
+
+    The server is thread-safe. Reading requests operate on a snapshot of the
+    period (see ``TinyDbPeriod``) and hence never block. Modifying requests are
+    serialized by a lock per period. Creating periods is serialized by another
+    lock.
+
+    The 'batch' command runs several commands in a single call. The commands
+    modifying a period are executed in a transaction: if one of them fails,
+    all modifications of the period are rolled back.
+
+    Results of the 'print' command are kept in an LRU cache, keyed by period
+    name, filters, and period version. The results of a period are invalidated
+    when it is modified. Cached results are shared between callers and must not
+    be modified.
+    Bulk writes ('add_many') are validated before the period's lock is
+    acquired. Large bulk writes can be validated in parallel by a pool of
+    worker processes, created on first use (see 'validation_workers').
+    Concurrent identical 'print' and 'get' requests for the same period version
+    are coalesced: one computation is run, and the other requests wait for it
+    and share its result.
+
+    ``run_serialized`` returns JSON-encoded responses for HTTP frontends. The
+    encoded 'print' results are cached as well, and assembled from JSON
+    fragments of the elements cached by the period.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self,
+                 result_cache_size=RESULT_CACHE_SIZE,
+                 validation_workers=None,
+                 **kwargs):
+        """:param result_cache_size: maximum number of cached 'print' results
+        :param validation_workers: number of processes validating bulk writes.
+            Validation is not parallelized if less than two (default), since
+            starting and feeding the processes outweighs the gain for typical
+            bulk sizes
+        """
         self._periods = {}
+        self._period_locks = {}
+        self._periods_lock = threading.Lock()
         self._period_kwargs = kwargs
+        # Distinguishes period versions of different Server instances (e.g.
+        # before and after a restart) in entity tags
+        self._instance_id = uuid.uuid4().hex[:12]
+        self._result_cache = ResultCache(maxsize=result_cache_size)
+        self._single_flight = SingleFlight()
+        self._validation_workers = validation_workers or 1
+        self._validation_executor = None
+        self._validation_executor_lock = threading.Lock()
 
     def run(self, command, **kwargs):
         """The requested period is created if not yet present. The method of
@@ -24,61 +92,246 @@ class Server:
 
         Wrap this in a 'broad' try-except block to catch any server-side errors.
         :return: dict
-            key is one of 'id', 'element', 'elements', 'error', 'periods'
+            key is one of 'id', 'ids', 'element', 'elements', 'error',
+            'periods', 'results'
         """
         logger.debug("Running '{}' with {}".format(command, kwargs))
 
         try:
             if command == "list":
-                return {"periods": [p._name for p in self._periods.values()]}
+                with self._periods_lock:
+                    period_names = list(self._periods)
+                return {"periods": period_names}
             elif command == "copy":
                 return {"id": self._copy_entry(**kwargs)}
+            elif command == "batch":
+                return {"results": self._run_batch(**kwargs)}
+            elif command == "add_many":
+                return {"ids": self._add_entries(**kwargs)}
             elif command == "stop":
                 # graceful shutdown, invoke closing of files
-                for period in self._periods.values():
-                    period.close()
+                with self._periods_lock:
+                    periods = list(self._periods.values())
+                for period in periods:
+                    with self._period_locks[period.name]:
+                        period.close()
+                with self._validation_executor_lock:
+                    if self._validation_executor is not None:
+                        self._validation_executor.shutdown()
+                        self._validation_executor = None
                 return {}
             else:
                 period_name = kwargs.pop("period", None)
-                period = self._get_period(period_name)
-
-                if command == "add":
-                    response = {"id": period.add_entry(**kwargs)}
-                elif command == "rm":
-                    response = {"id": period.remove_entry(**kwargs)}
-                elif command == "print":
-                    response = {"elements": period.get_entries(**kwargs)}
-                elif command == "get":
-                    response = {"element": period.get_entry(**kwargs)}
-                elif command == "update":
-                    response = {"id": period.update_entry(**kwargs)}
-                else:
-                    response = {
-                        "error": "Server: unknown command '{}'".format(command)
-                    }
+
+                with self._locked_period(
+                        period_name,
+                        write=command not in READ_COMMANDS) as period:
+                    if command == "add":
+                        response = {"id": period.add_entry(**kwargs)}
+                    elif command == "rm":
+                        response = {"id": period.remove_entry(**kwargs)}
+                    elif command == "print":
+                        response = {
+                            "elements": self._get_entries(period, **kwargs)
+                        }
+                    elif command == "get":
+                        response = {
+                            "element": self._get_entry(period, **kwargs)
+                        }
+                    elif command == "update":
+                        response = {"id": period.update_entry(**kwargs)}
+                    else:
+                        response = {
+                            "error":
+                            "Server: unknown command '{}'".format(command)
+                        }
                 return response
 
         except PeriodException as e:
             return {"error": str(e)}
 
+    def run_serialized(self, command, **kwargs):
+        """Like ``run()``, but return the response encoded as JSON. For the
+        'print' command (unless columnar), the encoded response is taken from
+        the result cache, or assembled by ``TinyDbPeriod.serialize_entries``.
+
+        :return: tuple(bytes, bool) of the encoded response and whether it
+            is an error response
+        """
+        if command != "print" or kwargs.get("columnar"):
+            response = self.run(command, **kwargs)
+            return json.dumps(response).encode(), "error" in response
+
+        logger.debug("Running '{}' with {}".format(command, kwargs))
+        kwargs = dict(kwargs)
+        kwargs.pop("columnar", None)
+        kwargs.pop("expand_recurrent", None)
+        try:
+            with self._locked_period(kwargs.pop("period", None)) as period:
+                return self._get_serialized_entries(period, **kwargs), False
+        except PeriodException as e:
+            return json.dumps({"error": str(e)}).encode(), True
+
+    def cache_info(self):
+        """Return metrics of the 'print' result cache (see
+        ``caching.ResultCache.info``), and of the coalescing of read requests
+        (see ``caching.SingleFlight.info``) under the key 'single_flight'."""
+        info = self._result_cache.info()
+        info["single_flight"] = self._single_flight.info()
+        return info
+
+    def export(self,
+               period=None,
+               format="csv",
+               filters=None,
+               expand_recurrent=True):
+        """Return an iterator over the lines (str) encoding the entries of the
+        period that match the filters, in CSV or JSON Lines format (see
+        ``exporting.export_lines``). The entries are encoded one by one while
+        iterating over a snapshot of the period, hence memory usage does not
+        grow with the number of entries, and the period can be modified
+        meanwhile.
+
+        :raise: ValueError if the format is unknown or a filter pattern is
+            invalid
+        """
+        check_format(format)
+        check_filters(filters)
+
+        with self._locked_period(period) as locked_period:
+            entries = locked_period.iter_entries(
+                filters=filters, expand_recurrent=expand_recurrent)
+        return export_lines(
+            entries, format=format, expand_recurrent=expand_recurrent)
+
+    def period_validators(self, name=None):
+        """Return entity tag and last modification time (seconds since the
+        epoch) of the entries of the given period, as returned by the 'print'
+        command. Used for answering conditional requests.
+        Since recurrent entries are expanded up to the current date, both
+        validators change at midnight as well.
+        The entity tag of a period stored in the data directory is derived from
+        the generation of its file lock, hence all processes sharing the data
+        directory (e.g. pre-forked workers) return the same tag for the same
+        content.
+
+        :return: tuple(str, float)
+        """
+        period = self._get_period(name)
+        period.refresh()
+        today = date.today()
+
+        generation = period.generation
+        if generation is None:
+            # The period is held in the memory of this process only
+            content_id = "{}-{}".format(self._instance_id, period.version)
+        else:
+            content_id = "g{}".format(generation)
+        etag = "{}-{}-{}".format(period.name, content_id, today.isoformat())
+        last_modified = max(period.modified, time.mktime(today.timetuple()))
+        return etag, last_modified
+
+    def _get_entries(self,
+                     period,
+                     filters=None,
+                     columnar=False,
+                     expand_recurrent=True):
+        """Return the result of ``period.get_entries`` from the cache, or
+        compute and cache it. Since recurrent entries are expanded up to the
+        current date, the date is part of the cache key.
+        """
+        period.refresh()
+        key = (period.name, _normalize_filters(filters), bool(columnar),
+               bool(expand_recurrent), period.version, date.today())
+
+        elements = self._result_cache.get(key)
+        if elements is None:
+
+            def compute():
+                result = period.get_entries(
+                    filters=filters,
+                    columnar=columnar,
+                    expand_recurrent=expand_recurrent)
+                self._result_cache.put(key, result)
+                return result
+
+            elements = self._single_flight.do(key, compute)
+        return elements
+
+    def _get_serialized_entries(self, period, filters=None):
+        """Return the JSON-encoded response of the 'print' command from the
+        cache, or assemble and cache it.
+        """
+        period.refresh()
+        key = (period.name, _normalize_filters(filters), "json", period.version,
+               date.today())
+
+        body = self._result_cache.get(key)
+        if body is None:
+
+            def compute():
+                elements = self._get_entries(period, filters=filters)
+                result = b'{"elements": %s}' % period.serialize_entries(
+                    elements)
+                self._result_cache.put(key, result)
+                return result
+
+            body = self._single_flight.do(key, compute)
+        return body
+
+    def _get_entry(self, period, eid, table_name=None):
+        """Return the result of ``period.get_entry``. Concurrent identical
+        requests share a single lookup; each caller receives its own copy of
+        the element.
+        """
+        period.refresh()
+        key = (period.name, "get", table_name, str(eid), period.version)
+        element = self._single_flight.do(
+            key, lambda: period.get_entry(eid=eid, table_name=table_name))
+        return Element(element, element.eid)
+
     def _get_period(self, name=None):
         """Get the Period identified by 'name' from the Periods dictionary. If
-        the Period does not exist, it is created and returned. If 'name' is
-        None, the default period name is used as defined in __init__.py
+        the Period does not exist, it is created (along with its lock) and
+        returned. If 'name' is None, the default period name is used as defined
+        in __init__.py
 
         :type name: str or None
         :return: Period object
         """
-        name = name or default_period_name()
-        try:
-            period = self._periods[name]
-        except KeyError:
-            logger.debug("Creating new Period '{}'".format(name))
-            period = TinyDbPeriod(name, **self._period_kwargs)
-            self._periods[period.name] = period
+        name = _period_name(name)
+
+        with self._periods_lock:
+            try:
+                period = self._periods[name]
+            except KeyError:
+                logger.debug("Creating new Period '{}'".format(name))
+                period = TinyDbPeriod(name, **self._period_kwargs)
+                # Reentrant since batches already hold the lock when running
+                # the individual commands
+                self._period_locks[period.name] = threading.RLock()
+                self._periods[period.name] = period
 
         return period
 
+    @contextmanager
+    def _locked_period(self, name=None, write=False):
+        """Context manager providing the Period identified by 'name'. If
+        'write' is set, the period's lock is held and the cached results of the
+        period are invalidated on exit. Otherwise no locking is required since
+        the period is read from a snapshot.
+        """
+        period = self._get_period(name)
+
+        if write:
+            with self._period_locks[period.name]:
+                try:
+                    yield period
+                finally:
+                    self._result_cache.invalidate(period.name)
+        else:
+            yield period
+
     def _copy_entry(self, source_period=None, destination_period=None,
                     **kwargs):
         """Copy an entry (specified by ID and table_name) from the source period
@@ -88,9 +341,209 @@ class Server:
         :return: ID of copied entry
         :raises: PeriodException if the source entry does not exist
         """
-        source_period = self._get_period(source_period)
-        entry_to_copy = source_period.get_entry(**kwargs)
+        with self._locked_period(source_period) as period:
+            entry_to_copy = period.get_entry(**kwargs)
+
+        with self._locked_period(destination_period, write=True) as period:
+            return period.add_entry(
+                table_name=kwargs.get("table_name"), **entry_to_copy)
+
+    def _add_entries(self, period=None, entries=(), table_name=None):
+        """Add entries to the period. They are validated before the period's
+        lock is acquired, hence other modifications of the period are not
+        blocked meanwhile.
+        """
+        converted_entries = self._convert_entries(entries, table_name)
+        return self._add_converted_entries(period, converted_entries,
+                                           table_name)
+
+    def _add_converted_entries(self, period, converted_entries,
+                               table_name=None):
+        """Add entries returned by ``_convert_entries`` to the period. If
+        'converted_entries' is the exception raised by the validation, it is
+        raised.
+        """
+        if isinstance(converted_entries, Exception):
+            raise converted_entries
+        with self._locked_period(period, write=True) as locked_period:
+            return locked_period.add_converted_entries(
+                converted_entries, table_name=table_name)
+
+    def _convert_entries(self, entries, table_name=None):
+        """Validate and convert entries (see ``TinyDbPeriod.convert_entries``),
+        in parallel if possible. If the process pool is broken (e.g. the worker
+        processes can not be started), parallel validation is disabled and the
+        entries are validated sequentially.
+        """
+        executor = self._get_validation_executor()
+        if executor is not None:
+            try:
+                return TinyDbPeriod.convert_entries(
+                    entries, table_name=table_name, executor=executor)
+            except BrokenProcessPool as e:
+                logger.warning("Disabling parallel validation: {}".format(e))
+                with self._validation_executor_lock:
+                    self._validation_workers = 1
+                    self._validation_executor = None
+        return TinyDbPeriod.convert_entries(entries, table_name=table_name)
+
+    def _get_validation_executor(self):
+        """Return the process pool for validating bulk writes, or None if
+        validation is not parallelized. The worker processes are spawned
+        instead of forked, since the server might run several threads.
+        """
+        if self._validation_workers < 2:
+            return None
+
+        with self._validation_executor_lock:
+            if self._validation_executor is None:
+                kwargs = {}
+                if sys.version_info >= (3, 7):
+                    kwargs["mp_context"] = multiprocessing.get_context("spawn")
+                self._validation_executor = ProcessPoolExecutor(
+                    max_workers=self._validation_workers, **kwargs)
+            return self._validation_executor
+
+    def _run_batch(self, commands):
+        """Run the given commands in order. Each command is a dict holding the
+        command name (key 'command') and its kwargs, as passed to ``run()``.
+
+        The locks of all periods modified by the batch are acquired (sorted by
+        name to avoid deadlocks) and a transaction is started per period. If a
+        command modifying a period fails, the transaction of the period is
+        aborted: its previous modifications are rolled back and its remaining
+        modifying commands are skipped. The results of all these commands are
+        replaced by an error. A command raising an exception (e.g. due to
+        missing or malformed arguments) fails with an error as well, without
+        affecting the commands of other periods.
+        The entries of bulk writes are validated before the locks are
+        acquired; validation errors are reported in the order of the commands.
+
+        :return: list of responses, in the order of the commands
+        """
+        results = [None] * len(commands)
+        # Modified period name per command index, and vice versa
+        write_periods = {}
+        write_indices = {}
+
+        for index, command in enumerate(commands):
+            if not isinstance(command, dict) or "command" not in command:
+                results[index] = {"error": "Invalid batch item."}
+            elif command["command"] in ("batch", "stop"):
+                results[index] = {
+                    "error":
+                    "Command '{}' not allowed in batch.".format(
+                        command["command"])
+                }
+            elif command["command"] in WRITE_COMMANDS:
+                period_name = _period_name(
+                    command.get("destination_period" if command["command"] ==
+                                "copy" else "period"))
+                write_periods[index] = period_name
+                write_indices.setdefault(period_name, []).append(index)
+
+        # Converted entries, or the validation error, per 'add_many' index
+        converted_entries = {}
+        for index in write_periods:
+            if commands[index]["command"] != "add_many":
+                continue
+            try:
+                converted_entries[index] = self._convert_entries(
+                    commands[index].get("entries", ()),
+                    commands[index].get("table_name"))
+            except Exception as e:
+                converted_entries[index] = e
+
+        with ExitStack() as stack:
+            transactions = {}
+            for period_name in sorted(write_indices):
+                period = stack.enter_context(
+                    self._locked_period(period_name, write=True))
+                transactions[period_name] = stack.enter_context(
+                    period.transaction())
+
+            for index, command in enumerate(commands):
+                if results[index] is not None:
+                    continue
+
+                period_name = write_periods.get(index)
+                if period_name is not None and \
+                        transactions[period_name].aborted:
+                    results[index] = _aborted_error(period_name)
+                    continue
+
+                kwargs = dict(command)
+                name = kwargs.pop("command")
+                try:
+                    if index in converted_entries:
+                        results[index] = {
+                            "ids":
+                            self._add_converted_entries(
+                                period_name, converted_entries[index],
+                                kwargs.get("table_name"))
+                        }
+                    else:
+                        # Bypass subclass implementations (e.g. raising on
+                        # errors)
+                        results[index] = Server.run(self, name, **kwargs)
+                except PeriodException as e:
+                    results[index] = {"error": str(e)}
+                except Exception as e:
+                    logger.exception(e)
+                    results[index] = {
+                        "error": "Command '{}' failed: {}".format(name, e)
+                    }
+
+                if period_name is not None and "error" in results[index]:
+                    transactions[period_name].abort()
+
+        # Replace results of rolled-back modifications
+        for period_name, transaction in transactions.items():
+            if not transaction.aborted:
+                continue
+            for index in write_indices[period_name]:
+                if "error" not in results[index]:
+                    results[index] = _aborted_error(period_name)
+
+        return results
+
+
+def check_filters(filters=None):
+    """Check that the patterns of the filters dict are valid regular
+    expressions (or None).
+
+    :raise: ValueError if a pattern is invalid
+    """
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("Invalid filters {!r}".format(filters))
+    for pattern in (filters or {}).values():
+        if pattern is None:
+            continue
+        if not isinstance(pattern, str):
+            raise ValueError("Invalid filter pattern {!r}".format(pattern))
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError("Invalid filter pattern '{}': {}".format(
+                pattern, e))
+
+
+def _period_name(name=None):
+    """Return the period name as string, or the default period name if 'name' is
+    None.
+    """
+    return "{}".format(name or default_period_name())
+
+
+def _normalize_filters(filters=None):
+    """Return hashable representation of the filters dict, independent of the
+    order of its items."""
+    return tuple(sorted((filters or {}).items()))
+
 
-        destination_period = self._get_period(destination_period)
-        return destination_period.add_entry(
-            table_name=kwargs.get("table_name"), **entry_to_copy)
+def _aborted_error(period_name):
+    return {
+        "error":
+        "Transaction of period '{}' aborted due to a failed command.".format(
+            period_name)
+    }
@@ -0,0 +1,275 @@
+"""Stdlib-based WSGI server to run the financeager flask app in production. The
+server is threaded, supports persistent (keep-alive) HTTP/1.1 connections, and
+optionally pre-forks several worker processes sharing the listening socket.
+"""
+import os
+import signal
+import socket
+import socketserver
+import threading
+from wsgiref import simple_server
+
+from werkzeug.wsgi import LimitedStream
+
+import financeager
+from . import (init_logger, DEFAULT_SERVE_HOST, DEFAULT_SERVE_PORT,
+               DEFAULT_BACKLOG, DEFAULT_KEEP_ALIVE, DEFAULT_THREADS,
+               DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE)
+from .fflask import create_app
+from . import aioserver
+from .compression import CompressionMiddleware
+from .routing import PeriodRouter
+
+logger = init_logger(__name__)
+
+
+class _ServerHandler(simple_server.ServerHandler):
+    http_version = "1.1"
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+
+        # The end of the response can't be detected by the client if its
+        # length is unknown, hence the connection has to be closed
+        if "Content-Length" not in self.headers:
+            self.request_handler.close_connection = True
+
+        if self.request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+
+class _RequestHandler(simple_server.WSGIRequestHandler):
+    """Request handler processing requests of a connection until the client
+    closes it or the server's keep-alive timeout expires."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # StreamRequestHandler applies the timeout to the connection socket
+        self.timeout = self.server.keep_alive or None
+        super().setup()
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = True
+            return
+
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+
+        if not self.parse_request():
+            # An error code has been sent
+            return
+
+        if not self.server.keep_alive:
+            self.close_connection = True
+
+        # Limit the request body stream such that the remainder of the body
+        # can be skipped if the app did not read it
+        stream = LimitedStream(self.rfile,
+                               int(self.headers.get("Content-Length") or 0))
+
+        handler = _ServerHandler(
+            stream,
+            self.wfile,
+            self.get_stderr(),
+            self.get_environ(),
+            multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+        stream.exhaust()
+
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn,
+                          simple_server.WSGIServer):
+    """WSGI server handling each connection in a separate thread."""
+
+    daemon_threads = True
+
+    def __init__(self,
+                 address,
+                 backlog=DEFAULT_BACKLOG,
+                 keep_alive=DEFAULT_KEEP_ALIVE):
+        """Bind the server to 'address' (tuple of host and port) and listen.
+
+        :param backlog: maximum number of pending connections
+        :param keep_alive: number of seconds to keep an idle connection open.
+            Persistent connections are disabled if zero
+        """
+        self.request_queue_size = backlog
+        self.keep_alive = keep_alive
+        super().__init__(address, _RequestHandler)
+
+
+def serve(host=DEFAULT_SERVE_HOST,
+          port=DEFAULT_SERVE_PORT,
+          workers=1,
+          backlog=DEFAULT_BACKLOG,
+          keep_alive=DEFAULT_KEEP_ALIVE,
+          data_dir=None,
+          affinity=False,
+          frontend="wsgi",
+          threads=DEFAULT_THREADS,
+          compression_level=DEFAULT_COMPRESSION_LEVEL,
+          compression_min_size=DEFAULT_COMPRESSION_MIN_SIZE):
+    """Serve the financeager flask app until SIGTERM or SIGINT is received.
+
+    The listening socket is opened in the current process. If 'workers' is
+    greater than one, as many worker processes are forked, each creating its own
+    app. By default, the workers accept connections from the shared socket.
+    If 'affinity' is set, each worker listens on a local socket instead, and the
+    current process dispatches requests to the workers by period name (see
+    ``routing.PeriodRouter``).
+    The workers run the flask app if 'frontend' is 'wsgi', or the asyncio app
+    (see ``aioserver``) with a pool of 'threads' threads if it is 'asyncio'.
+    Responses of at least 'compression_min_size' bytes are compressed with
+    'compression_level' if the client accepts it (see ``compression``).
+    Since the workers share the data directory, 'data_dir' defaults to the
+    environment variable FINANCEAGER_DATA_DIR or, if not set, the default data
+    directory.
+
+    :return: UNIX return code
+    """
+    data_dir = data_dir or os.environ.get("FINANCEAGER_DATA_DIR") or \
+        financeager.DATA_DIR
+
+    server = ThreadingWSGIServer((host, port),
+                                 backlog=backlog,
+                                 keep_alive=keep_alive)
+    logger.info("Serving on http://{}:{} with {} worker(s)".format(
+        *server.server_address[:2], workers))
+
+    compression = dict(level=compression_level, min_size=compression_min_size)
+
+    if workers <= 1:
+        _run_worker(server, data_dir, frontend, threads, compression)
+        server.server_close()
+        return 0
+
+    if affinity:
+        worker_servers = [
+            ThreadingWSGIServer(("127.0.0.1", 0),
+                                backlog=backlog,
+                                keep_alive=keep_alive) for _ in range(workers)
+        ]
+    else:
+        worker_servers = workers * [server]
+
+    pids = []
+    for worker_server in worker_servers:
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            exit_code = 1
+            try:
+                # Close sockets of the other workers and the router
+                for other_server in set(worker_servers + [server]):
+                    if other_server is not worker_server:
+                        other_server.server_close()
+                _run_worker(worker_server, data_dir, frontend, threads,
+                            compression)
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        pids.append(pid)
+
+    def terminate_workers(*args):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    if affinity:
+        router = PeriodRouter([s.server_address for s in worker_servers])
+        for worker_server in worker_servers:
+            worker_server.server_close()
+        server.set_app(CompressionMiddleware(router, **compression))
+        _serve_until_signal(server)
+        terminate_workers()
+    else:
+        signal.signal(signal.SIGTERM, terminate_workers)
+        signal.signal(signal.SIGINT, terminate_workers)
+
+    exit_code = 0
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if status:
+            exit_code = 1
+
+    server.server_close()
+    return exit_code
+
+
+def _serve_until_signal(server):
+    """Run the server until SIGTERM or SIGINT is received."""
+
+    def shutdown(signum, frame):
+        # shutdown() blocks until serve_forever() returns, hence it must not be
+        # called from the signal handler running in the serving thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    server.serve_forever()
+
+
+def _run_worker(server,
+                data_dir,
+                frontend="wsgi",
+                threads=None,
+                compression=None):
+    """Create the app and serve it on the given server until SIGTERM or SIGINT
+    is received. The periods are closed on shutdown.
+    'compression' is a dict holding compression 'level' and 'min_size'.
+    """
+    compression = compression or {}
+    level = compression.get("level", DEFAULT_COMPRESSION_LEVEL)
+    min_size = compression.get("min_size", DEFAULT_COMPRESSION_MIN_SIZE)
+
+    if frontend == "asyncio":
+        # The asyncio app serves the socket bound by the WSGI server
+        aioserver.serve_socket(
+            server.socket,
+            data_dir=data_dir,
+            threads=threads or DEFAULT_THREADS,
+            keep_alive=server.keep_alive,
+            compression_level=level,
+            compression_min_size=min_size)
+        logger.debug("Worker {} stopped".format(os.getpid()))
+        return
+
+    app = create_app(
+        data_dir=data_dir,
+        config={
+            "COMPRESSION_LEVEL": level,
+            "COMPRESSION_MIN_SIZE": min_size
+        })
+    server.set_app(app)
+
+    try:
+        _serve_until_signal(server)
+    finally:
+        app.extensions["financeager"].run("stop")
+        logger.debug("Worker {} stopped".format(os.getpid()))
@@ -0,0 +1,295 @@
+import asyncio
+import gzip
+import http.client
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from financeager.aioserver import create_app
+from financeager.httprequests import _Proxy
+from financeager.exceptions import InvalidRequest
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="financeager-")
+
+
+@mock.patch("financeager.DATA_DIR", TEST_DATA_DIR)
+class AsyncAppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.start_app(keep_alive=5)
+
+    def start_app(self, keep_alive):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(128)
+        self.address = self.sock.getsockname()
+
+        self.app = create_app(threads=2, keep_alive=keep_alive)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.stopped = asyncio.Event()
+            started.set()
+            self.loop.run_until_complete(
+                self.app.serve(self.sock, stopped=self.stopped))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        started.wait()
+
+        self.proxy = _Proxy(http_config={
+            "host": "http://{}:{}".format(*self.address),
+        })
+
+    def stop_app(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join()
+        self.app.close()
+
+    def request(self, connection, method, url, body=None):
+        connection.request(
+            method,
+            url,
+            body=body,
+            headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response, json.loads(response.read().decode())
+
+    def test_proxy_commands(self):
+        self.assertEqual(
+            self.proxy.run("add", name="rent", value=-500, period="1900"),
+            {"id": 1})
+        self.assertEqual(
+            self.proxy.run("add", name="bus", value=-2, period="1900"),
+            {"id": 2})
+        self.assertEqual(
+            self.proxy.run("update", eid=2, value=-3, period="1900"), {"id": 2})
+        self.assertEqual(
+            self.proxy.run("get", eid=2, period="1900")["element"]["value"], -3)
+        self.assertEqual(self.proxy.run("rm", eid=1, period="1900"), {"id": 1})
+        self.assertEqual(
+            self.proxy.run(
+                "copy", eid=2, source_period="1900", destination_period="1901"),
+            {"id": 1})
+        self.assertEqual(self.proxy.run("list"), {"periods": ["1900", "1901"]})
+
+        elements = self.proxy.run(
+            "print", filters={"name": "bus"}, period="1901")["elements"]
+        self.assertEqual(len(elements["standard"]), 1)
+        self.assertEqual(elements["recurrent"], {})
+
+    def test_export(self):
+        self.proxy.run("add", name="rent", value=-500, period="1902")
+        lines = "".join(self.proxy.export(period="1902")).splitlines()
+        self.assertEqual(lines[0], "table_name,eid,name,value,category,date")
+        self.assertTrue(lines[1].startswith("standard,1,rent,-500.0,,"))
+
+        connection = http.client.HTTPConnection(*self.address)
+        connection.request("GET", "/periods/1902/export?format=jsonl&name=x")
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(
+            response.getheader("Content-Type"), "application/x-ndjson")
+        self.assertEqual(response.read(), b"")
+
+        response, content = self.request(connection, "GET",
+                                         "/periods/1902/export?recurrent=all")
+        self.assertEqual(response.status, 400)
+        self.assertEqual(content["error"], "Unknown recurrent mode 'all'")
+
+        response, content = self.request(connection, "GET",
+                                         "/periods/1902?name=(")
+        self.assertEqual(response.status, 400)
+        self.assertTrue(
+            content["error"].startswith("Invalid filter pattern '('"))
+        connection.close()
+
+        self.assertRaises(InvalidRequest, self.proxy.export, format="xml")
+
+    def test_conditional_print(self):
+        self.proxy.run("add", name="rent", value=-500, period="1900")
+        self.proxy.run("add", name="bus", value=-2, period="1900")
+
+        response = self.proxy.run(
+            "print", filters={"category": None}, period="1900")
+        self.assertEqual(len(response["elements"]["standard"]), 2)
+        # Not modified; the cached response is returned
+        self.assertIs(
+            self.proxy.run("print", filters={"category": None}, period="1900"),
+            response)
+
+        connection = http.client.HTTPConnection(*self.address)
+        connection.request("GET", "/periods/1900?name=bus")
+        response = connection.getresponse()
+        content = json.loads(response.read().decode())
+        self.assertEqual(list(content["elements"]["standard"]), ["2"])
+        etag = response.getheader("ETag")
+
+        connection.request(
+            "GET", "/periods/1900?name=bus", headers={"If-None-Match": etag})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b"")
+        connection.close()
+
+    def test_compression(self):
+        commands = [{
+            "command": "add",
+            "name": "entry {}".format(i),
+            "value": -i,
+            "period": "1900"
+        } for i in range(30)]
+        connection = http.client.HTTPConnection(*self.address)
+        connection.request(
+            "POST",
+            "/periods/batch",
+            body=gzip.compress(json.dumps({
+                "commands": commands
+            }).encode()),
+            headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip"
+            })
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+
+        connection.request(
+            "GET", "/periods/1900", headers={"Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        content = json.loads(gzip.decompress(response.read()).decode())
+        self.assertEqual(len(content["elements"]["standard"]), 30)
+
+        # Corrupt body
+        connection.request(
+            "POST",
+            "/periods/batch",
+            body=b"{",
+            headers={"Content-Encoding": "gzip"})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertIn("Invalid gzip body",
+                      json.loads(response.read().decode())["error"])
+        connection.close()
+
+    def test_body_too_large(self):
+        self.app.max_body_size = 1000
+        connection = http.client.HTTPConnection(*self.address)
+        connection.request(
+            "POST",
+            "/periods/batch",
+            body=gzip.compress(1000000 * b" "),
+            headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip"
+            })
+        response = connection.getresponse()
+        self.assertEqual(response.status, 413)
+        self.assertIn("exceeds 1000 bytes",
+                      json.loads(response.read().decode())["error"])
+        connection.close()
+
+        # The body is rejected before being read
+        connection = http.client.HTTPConnection(*self.address)
+        connection.putrequest("POST", "/periods/batch")
+        connection.putheader("Content-Length", "1000000000")
+        connection.endheaders()
+        response = connection.getresponse()
+        self.assertEqual(response.status, 413)
+        response.read()
+        connection.close()
+
+    def test_run_many(self):
+        results = self.proxy.run_many([
+            {
+                "command": "add",
+                "name": "rent",
+                "value": -500,
+                "period": "1900"
+            },
+            {
+                "command": "rm",
+                "eid": 2,
+                "period": "1900"
+            },
+            {
+                "command": "list"
+            },
+        ])
+        self.assertEqual(results[1], {"error": "Element not found."})
+        self.assertEqual(results[2], {"periods": ["1900"]})
+
+    def test_invalid_requests(self):
+        with self.assertRaises(InvalidRequest) as cm:
+            self.proxy.run("get", eid=1, period="1900")
+        self.assertIn("Not Found (404): Element not found.",
+                      cm.exception.args[0])
+
+        with self.assertRaises(InvalidRequest) as cm:
+            self.proxy.run("add", name="beer", period="1900")
+        self.assertIn("Missing required parameter 'value'",
+                      cm.exception.args[0])
+
+        with self.assertRaises(InvalidRequest) as cm:
+            self.proxy.run("add", name="beer", value="x", period="1900")
+        self.assertIn("Invalid value for parameter 'value'",
+                      cm.exception.args[0])
+
+    def test_bad_requests(self):
+        connection = http.client.HTTPConnection(*self.address)
+        response, content = self.request(connection, "GET", "/periods")
+        self.assertEqual(response.status, 405)
+        response, content = self.request(connection, "GET", "/unknown")
+        self.assertEqual(response.status, 404)
+        response, content = self.request(connection, "POST", "/periods/1900",
+                                         "{")
+        self.assertEqual(response.status, 400)
+        self.assertEqual(content["error"], "Invalid JSON body")
+        connection.close()
+
+    def test_keep_alive(self):
+        connection = http.client.HTTPConnection(*self.address)
+        response, _ = self.request(connection, "POST", "/periods")
+        self.assertFalse(response.will_close)
+        sock = connection.sock
+        response, _ = self.request(connection, "POST", "/periods")
+        self.assertIs(connection.sock, sock)
+        connection.close()
+
+    def test_many_idle_connections(self):
+        idle_sockets = [
+            socket.create_connection(self.address) for _ in range(200)
+        ]
+        self.assertEqual(self.proxy.run("list"), {"periods": []})
+
+        # Idle connections are closed on shutdown
+        self.stop_app()
+        for sock in idle_sockets:
+            self.assertEqual(sock.recv(1), b"")
+            sock.close()
+
+    def test_no_keep_alive(self):
+        self.stop_app()
+        self.sock.close()
+        self.start_app(keep_alive=0)
+
+        connection = http.client.HTTPConnection(*self.address)
+        response, content = self.request(connection, "POST", "/periods")
+        self.assertEqual(content, {"periods": []})
+        self.assertTrue(response.will_close)
+        connection.close()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.stop_app()
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+
+from financeager.caching import ResultCache, SingleFlight
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        cache.put(("2000", 1), "a")
+        cache.put(("2000", 2), "b")
+        self.assertEqual(cache.get(("2000", 1)), "a")
+
+        # The least recently used item is evicted
+        cache.put(("2001", 1), "c")
+        self.assertIsNone(cache.get(("2000", 2)))
+        self.assertEqual(cache.get(("2000", 1)), "a")
+        self.assertEqual(cache.get(("2001", 1)), "c")
+
+        self.assertEqual(cache.info(), {
+            "hits": 3,
+            "misses": 1,
+            "evictions": 1,
+            "size": 2,
+            "maxsize": 2,
+        })
+
+    def test_invalidate(self):
+        cache = ResultCache()
+        cache.put(("2000", 1), "a")
+        cache.put(("2000", 2), "b")
+        cache.put(("2001", 1), "c")
+
+        cache.invalidate("2000")
+        self.assertIsNone(cache.get(("2000", 1)))
+        self.assertIsNone(cache.get(("2000", 2)))
+        self.assertEqual(cache.get(("2001", 1)), "c")
+
+        cache.clear()
+        self.assertEqual(cache.info()["size"], 0)
+
+    def test_disabled(self):
+        cache = ResultCache(maxsize=0)
+        cache.put(("2000", 1), "a")
+        self.assertIsNone(cache.get(("2000", 1)))
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def run_concurrently(self, single_flight, key, function, n=5):
+        results = [None] * n
+        errors = [None] * n
+
+        def call(i):
+            try:
+                results[i] = single_flight.do(key, function)
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_shared_result(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def function():
+            calls.append(None)
+            # Allow the other threads to join the computation
+            time.sleep(0.2)
+            return object()
+
+        results, errors = self.run_concurrently(single_flight, "key", function)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(errors, 5 * [None])
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(single_flight.info(), {"computed": 1, "shared": 4})
+
+        # Completed computations are not shared
+        self.assertIsNot(single_flight.do("key", function), results[0])
+        self.assertEqual(len(calls), 2)
+
+    def test_shared_error(self):
+        single_flight = SingleFlight()
+
+        def function():
+            time.sleep(0.2)
+            raise KeyError("x")
+
+        results, errors = self.run_concurrently(single_flight, "key", function)
+        self.assertTrue(all(isinstance(e, KeyError) for e in errors))
+        self.assertEqual(single_flight.info()["computed"], 1)
+
+    def test_different_keys(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do(1, lambda: "a"), "a")
+        self.assertEqual(single_flight.do(2, lambda: "b"), "b")
+        self.assertEqual(single_flight.info(), {"computed": 2, "shared": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
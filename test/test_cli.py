@@ -4,11 +4,16 @@ import os
 import time
 from threading import Thread
 import re
+import shutil
+import subprocess
+import sys
 import tempfile
 
 from requests import Response, RequestException
 from requests import get as requests_get
 
+import financeager.localserver
+from financeager.daemon import socket_path
 from financeager import DEFAULT_TABLE
 from financeager.fflask import create_app
 from financeager.cli import _parse_command, run, SUCCESS, FAILURE
@@ -86,6 +91,14 @@ class CliTestCase(unittest.TestCase):
         # Convert Exceptions to string
         return str(printed_content)
 
+    def temporary_filepath(self, suffix):
+        """Create a temporary file that is removed after the test, and return
+        its path."""
+        fd, filepath = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, filepath)
+        return filepath
+
     def tearDown(self):
         for p in [self.period, self.destination_period]:
             filepath = os.path.join(TEST_DATA_DIR, "{}.json".format(p))
@@ -201,6 +214,89 @@ default_category = no-category"""
         printed_content = self.cli_run("get 0", log_method="error")
         self.assertEqual(printed_content, "Invalid request: Element not found.")
 
+    def test_import(self):
+        filepath = self.temporary_filepath(".csv")
+        with open(filepath, "w") as file:
+            file.write("Date;Text;Amount\n"
+                       "12.31.;Beer;-2,50\n"
+                       "12.32.;Invalid;1\n")
+
+        printed_content = self.cli_run(
+            "import {} --delimiter ; --date-column Date --name-column Text "
+            "--value-column Amount --date-format %m.%d. --decimal-comma",
+            format_args=filepath)
+        self.assertTrue(
+            printed_content.startswith("Imported 1 of 2 rows (1 in 1900)"))
+        self.assertEqual(self.log_call_args_list["error"][0][0][0],
+                         "Skipped line 3: Invalid date '12.32.'")
+        self.assertIn("Beer", self.cli_run("print"))
+
+    def test_import_rules(self):
+        csv_filepath = self.temporary_filepath(".csv")
+        with open(csv_filepath, "w") as file:
+            file.write("name,value,date\nLIDL SAGT DANKE,-2,01-01\n")
+        rules_filepath = self.temporary_filepath(".ini")
+        with open(rules_filepath, "w") as file:
+            file.write("[groceries]\nlidl\n")
+
+        self.cli_run(
+            "import {} --rules {} --date-format %m-%d",
+            format_args=(csv_filepath, rules_filepath))
+        self.assertEqual(
+            self.cli_run("get 1").splitlines()[:2],
+            ["Name    : Lidl", "Value   : -2.0"])
+
+    def test_import_dry_run(self):
+        self.cli_run("add beer -2 -d 01-01")
+        filepath = self.temporary_filepath(".csv")
+        with open(filepath, "w") as file:
+            file.write("name,value,date\nBeer,-2,01-01\nBread,-3,01-01\n")
+
+        printed_content = self.cli_run(
+            "import {} --dry-run --date-format %m-%d", format_args=filepath)
+        self.assertEqual(printed_content,
+                         "Line 2: duplicate of element 1 (beer)")
+        self.assertEqual(
+            self.log_call_args_list["info"][1][0][0],
+            "Dry run: 1 new, 1 duplicate, 0 probable match of 2 rows.")
+
+        printed_content = self.cli_run(
+            "import {} --reconcile --date-format %m-%d", format_args=filepath)
+        self.assertTrue(printed_content.startswith("Imported 1 of 2 rows"))
+        self.assertEqual(self.log_call_args_list["info"][1][0][0],
+                         "Skipped 1 duplicate(s).")
+
+    def test_export(self):
+        self.cli_run("add beer -2 -d 01-01")
+        self.cli_run("add bread -3 -d 01-02")
+        filepath = self.temporary_filepath(".csv")
+
+        printed_content = self.cli_run(
+            "export -o {} -f name=beer", format_args=filepath)
+        self.assertEqual(printed_content, "Exported to {}.".format(filepath))
+        with open(filepath) as file:
+            self.assertEqual(
+                file.read(), "table_name,eid,name,value,category,date\n"
+                "standard,1,beer,-2.0,,01-01\n")
+
+        printed_content = self.cli_run(
+            "export -o {} --format jsonl -f name=(",
+            format_args=filepath,
+            log_method="error")
+        self.assertTrue(
+            printed_content.startswith(
+                "Invalid request: Invalid filter pattern '('"))
+
+    def test_import_missing_column(self):
+        filepath = self.temporary_filepath(".csv")
+        with open(filepath, "w") as file:
+            file.write("name,value\n")
+
+        printed_content = self.cli_run(
+            "import {}", format_args=filepath, log_method="error")
+        self.assertEqual(printed_content,
+                         "Column(s) not found in CSV header: date")
+
 
 @mock.patch("financeager.DATA_DIR", TEST_DATA_DIR)
 class CliFlaskTestCase(CliTestCase):
@@ -268,6 +364,20 @@ host = http://{}
         printed_content = self.cli_run("list")
         self.assertIn(self.period, printed_content)
 
+    def test_import(self):
+        filepath = self.temporary_filepath(".csv")
+        with open(filepath, "w") as file:
+            file.write("name,value,date\n"
+                       "cookies,-100,1910-01-01\n"
+                       "donuts,-50,1911-01-01\n")
+
+        # Entries are split by the year of their date. The periods are not
+        # used by other tests which share the server
+        printed_content = self.cli_run("import {}", format_args=filepath)
+        self.assertTrue(
+            printed_content.startswith(
+                "Imported 2 of 2 rows (1 in 1910, 1 in 1911)"))
+
     def test_add_get_rm_via_eid(self):
         entry_id = self.cli_run("add donuts -50 -c sweets")
 
@@ -389,7 +499,7 @@ host = http://{}
         self.cli_run("rm {}", format_args=entry_id)
 
     def test_communication_error(self):
-        with mock.patch("requests.get") as mocked_get:
+        with mock.patch("requests.Session.get") as mocked_get:
             response = Response()
             response.status_code = 500
             mocked_get.return_value = response
@@ -399,7 +509,7 @@ host = http://{}
     @mock.patch("financeager.offline.OFFLINE_FILEPATH",
                 "/tmp/financeager-test-offline.json")
     def test_offline_feature(self):
-        with mock.patch("requests.post") as mocked_post:
+        with mock.patch("requests.Session.post") as mocked_post:
             # Try do add an item but provoke CommunicationError
             mocked_post.side_effect = RequestException("did not work")
 
@@ -470,5 +580,119 @@ class CliNoConfigTestCase(CliTestCase):
         CategoryEntry.DEFAULT_NAME = "unspecified"
 
 
+class CliDaemonTestCase(CliTestCase):
+
+    CONFIG_FILE_CONTENT = """\
+[SERVICE:NONE]
+daemon = true
+idle_timeout = 0.5"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.data_dir = tempfile.mkdtemp(prefix="financeager-daemon-")
+        cls.data_dir_patch = mock.patch("financeager.DATA_DIR", cls.data_dir)
+        cls.data_dir_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.data_dir_patch.stop()
+
+        # Wait for the daemon to exit when idle, removing its socket
+        path = socket_path(cls.data_dir)
+        for _ in range(50):
+            if not os.path.exists(path):
+                break
+            time.sleep(0.1)
+        shutil.rmtree(cls.data_dir)
+
+    def test_add_print_rm(self):
+        entry_id = self.cli_run("add beer -2 -c groceries")
+        # The entry is held in memory by the daemon
+        self.assertIn("Beer", self.cli_run("print"))
+        self.assertEqual(self.cli_run("rm {}", format_args=entry_id), entry_id)
+
+
+@mock.patch("financeager.DATA_DIR", TEST_DATA_DIR)
+class CliShellTestCase(CliTestCase):
+
+    CONFIG_FILE_CONTENT = ""
+
+    def shell_run(self, *lines):
+        """Run the shell with the given input lines, and return the exit code
+        and the messages logged on info and error level.
+        """
+        args = ["shell", "--config", TEST_CONFIG_FILEPATH]
+        with mock.patch("financeager.cli.logger") as mocked_logger, \
+                mock.patch("builtins.input",
+                           side_effect=list(lines) + [EOFError]):
+            exit_code = run(**_parse_command(args))
+
+        messages = {}
+        for method in ["info", "error"]:
+            messages[method] = [
+                str(c[0][0])
+                for c in getattr(mocked_logger, method).call_args_list
+            ]
+        return exit_code, messages
+
+    def test_session(self):
+        with mock.patch(
+                "financeager.localserver.proxy",
+                wraps=financeager.localserver.proxy) as proxy:
+            exit_code, messages = self.shell_run(
+                "add beer -2 -p {}".format(self.period),
+                "",
+                "print -p {}".format(self.period),
+                "exit",
+                "list",
+            )
+        self.assertEqual(exit_code, SUCCESS)
+        # Single proxy for all commands
+        self.assertEqual(proxy.call_count, 1)
+
+        info = messages["info"]
+        self.assertTrue(info[0].startswith("Added element"))
+        self.assertRegex(info[1], r"^\(\d+\.\d ms\)$")
+        self.assertIn("Beer", info[2])
+        # Commands after 'exit' are not run
+        self.assertEqual(len(info), 4)
+
+    def test_invalid_commands(self):
+        exit_code, messages = self.shell_run(
+            "add",
+            "serve",
+            "rm 42 -p {}".format(self.period),
+            'add "unterminated',
+        )
+        self.assertEqual(exit_code, FAILURE)
+        self.assertEqual(len(messages["error"]), 3)
+        self.assertEqual(messages["error"][0],
+                         "Command 'serve' not available in shell.")
+
+
+class CliStartupTestCase(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        # Run in a fresh interpreter since the test process has imported
+        # everything already
+        code = """
+import sys
+from financeager.cli import _parse_command
+_parse_command(["add", "beer", "-1"])
+print(" ".join(sorted(m for m in sys.modules if m.split(".")[0] in
+      ("requests", "tinydb", "schematics", "dateutil", "flask"))))
+"""
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.decode().strip(), "")
+
+    def test_subparser_arguments(self):
+        self.assertEqual(
+            _parse_command(["update", "1", "-n", "beer"])["name"], "beer")
+        self.assertEqual(_parse_command(["list"])["command"], "list")
+        with self.assertRaises(SystemExit):
+            _parse_command(["print", "--entry-sort", "nothing"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import financeager
+from financeager import Client, DEFAULT_TABLE
+from financeager.config import Configuration
+from financeager.exceptions import InvalidRequest
+from financeager.localserver import LocalServer
+
+
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = Client(data_dir=tempfile.mkdtemp(prefix="financeager-"))
+        self.period = "2000"
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_proxy_reused(self):
+        self.assertIsInstance(self.client.proxy, LocalServer)
+        with mock.patch("financeager.localserver.proxy") as proxy:
+            self.client.add("beer", -2, period=self.period)
+            self.client.periods()
+        proxy.assert_not_called()
+
+    def test_entry_lifecycle(self):
+        eid = self.client.add(
+            "beer", -2, category="groceries", date="01-01", period=self.period)
+        self.assertEqual(
+            self.client.get(eid, period=self.period), {
+                "name": "beer",
+                "value": -2.0,
+                "category": "groceries",
+                "date": "01-01"
+            })
+
+        self.assertEqual(
+            self.client.update(eid, value=-3, period=self.period), eid)
+        self.assertEqual(self.client.get(eid, period=self.period)["value"], -3)
+
+        copied_eid = self.client.copy(
+            eid, source_period=self.period, destination_period="2001")
+        self.assertEqual(
+            self.client.get(copied_eid, period="2001")["name"], "beer")
+        self.assertCountEqual(self.client.periods(), [self.period, "2001"])
+
+        self.assertEqual(self.client.rm(eid, period=self.period), eid)
+        with self.assertRaises(InvalidRequest):
+            self.client.get(eid, period=self.period)
+
+    def test_entries_and_totals(self):
+        self.client.add("salary", 1000, date="01-01", period=self.period)
+        self.client.add("beer", -2, category="groceries", period=self.period)
+        rent_eid = self.client.add(
+            "rent",
+            -500,
+            period=self.period,
+            table_name="recurrent",
+            frequency="monthly",
+            start="01-01",
+            end="02-28")
+
+        entries = self.client.entries(period=self.period)
+        self.assertEqual(len(entries), 4)
+        recurrent = [e for e in entries if e["table_name"] == "recurrent"]
+        self.assertEqual([e["eid"] for e in recurrent], [rent_eid, rent_eid])
+        self.assertEqual([e["date"] for e in recurrent], ["01-01", "02-01"])
+
+        self.assertEqual(
+            self.client.totals(period=self.period), {
+                "earnings": 1000.0,
+                "expenses": -1002.0,
+                "balance": -2.0,
+                "categories": {
+                    "unspecified": 0.0,
+                    "groceries": -2.0
+                },
+            })
+
+        entries = self.client.entries(
+            period=self.period, filters={"category": "groceries"})
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["table_name"], DEFAULT_TABLE)
+
+    def test_run_many(self):
+        responses = self.client.run_many([{
+            "command": "add",
+            "name": "beer",
+            "value": -2,
+            "period": self.period,
+        }, {
+            "command": "get",
+            "eid": 42,
+            "period": self.period,
+        }])
+        self.assertEqual(responses[0], {"id": 1})
+        self.assertIn("error", responses[1])
+
+
+class ClientConfigurationTestCase(unittest.TestCase):
+    def test_flask_backend(self):
+        config_filepath = tempfile.mkstemp()[1]
+        with open(config_filepath, "w") as file:
+            file.write("[SERVICE]\nname = flask\n")
+
+        client = Client(Configuration(filepath=config_filepath))
+        self.assertEqual(client.backend_name, "flask")
+        self.assertIsInstance(client.proxy, financeager.httprequests._Proxy)
+        # No-op
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import unittest
+
+from financeager import DEFAULT_TABLE
+from unittest import mock
+
+from financeager.columnar import decode, is_columnar, iter_elements
+from financeager.listing import prettify
+from financeager.period import TinyDbPeriod, expand_recurrent_element
+
+
+class ColumnarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.period = TinyDbPeriod(name=2000)
+        for i in range(20):
+            self.period.add_entry(
+                name="groceries",
+                value=-i - 1,
+                category="food" if i % 2 else None,
+                date="{:02d}-15".format(i % 12 + 1))
+        self.period.add_entry(name="salary", value=1000, date="01-31")
+        for frequency in ("monthly", "weekly", "daily", "quarter-yearly"):
+            self.period.add_entry(
+                table_name="recurrent",
+                name=frequency,
+                value=-10,
+                category="bills",
+                frequency=frequency,
+                start="01-01",
+                end="02-28")
+
+    def assertEqualAfterJson(self, filters=None):
+        elements = json.loads(
+            json.dumps(self.period.get_entries(filters=filters)))
+        payload = json.loads(
+            json.dumps(self.period.get_entries(filters=filters, columnar=True)))
+
+        self.assertTrue(is_columnar(payload))
+        self.assertFalse(is_columnar(elements))
+        self.assertEqual(decode(payload), elements)
+        return elements, payload
+
+    def test_round_trip(self):
+        elements, payload = self.assertEqualAfterJson()
+        self.assertEqual(len(elements[DEFAULT_TABLE]), 21)
+        self.assertEqual(len(elements["recurrent"]), 4)
+        # Recurrent elements are sent once
+        self.assertEqual(payload["strings"].count("bills"), 1)
+        self.assertEqual(len(payload["recurrent"]["eid"]), 4)
+
+        self.assertLess(len(json.dumps(payload)), len(json.dumps(elements)) / 2)
+
+    def test_filters(self):
+        self.assertEqualAfterJson(filters={"name": "week"})
+        self.assertEqualAfterJson(filters={"category": None})
+        elements, payload = self.assertEqualAfterJson(filters={"name": "xyz"})
+        self.assertEqual(payload["strings"], [])
+
+    def test_templates(self):
+        for filters in [
+                None, {
+                    "name": "week"
+                }, {
+                    "category": None
+                }, {
+                    "date": "02-"
+                }, {
+                    "name": "xyz"
+                }
+        ]:
+            payload = json.loads(
+                json.dumps(
+                    self.period.get_entries(
+                        filters=filters, columnar=True,
+                        expand_recurrent=False)))
+            self.assertNotIn("dates", payload["recurrent"])
+            self.assertEqual(len(payload["recurrent"]["eid"]), 4)
+            self.assertEqual(
+                decode(payload),
+                json.loads(
+                    json.dumps(self.period.get_entries(filters=filters))))
+
+        # Templates are smaller than the expanded recurrent entries
+        self.assertLess(
+            len(json.dumps(payload)),
+            len(json.dumps(self.period.get_entries(columnar=True))))
+
+        # The recurrent entries are not expanded on the server
+        with mock.patch(
+                "financeager.period.expand_recurrent_element") as expand:
+            self.period.get_entries(columnar=True, expand_recurrent=False)
+            expand.assert_not_called()
+
+    def test_templates_lazily_expanded(self):
+        payload = self.period.get_entries(columnar=True, expand_recurrent=False)
+        elements = iter_elements(payload)
+        for _ in range(len(payload["standard"]["eid"]) + 1):
+            next(elements)
+
+        # Only the first recurrent element has been generated
+        with mock.patch(
+                "financeager.period.expand_recurrent_element",
+                wraps=expand_recurrent_element) as expand:
+            table_name, eid, element = next(elements)
+            self.assertEqual(table_name, "recurrent")
+            expand.assert_not_called()
+            for _ in elements:
+                pass
+            self.assertEqual(expand.call_count, 3)
+
+    def test_prettify(self):
+        elements = self.period.get_entries()
+        payload = self.period.get_entries(columnar=True)
+        self.assertEqual(prettify(payload), prettify(elements))
+        payload = self.period.get_entries(columnar=True, expand_recurrent=False)
+        self.assertEqual(prettify(payload), prettify(elements))
+        self.assertEqual(
+            prettify(payload, stacked_layout=True),
+            prettify(elements, stacked_layout=True))
+
+    def tearDown(self):
+        self.period.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 from datetime import date
 
-from financeager import default_period_name
+from financeager import default_period_name, Client
 from financeager.entries import BaseEntry
 from financeager import communication, localserver, httprequests
 
@@ -67,6 +70,55 @@ Category: Clothes""".format(today()))
         response = self.run_command("print", filters=["date=12-"])
         self.assertEqual("", response)
 
+    def test_print_identical_response_formatted_once(self):
+        data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.addCleanup(shutil.rmtree, data_dir)
+        client = Client(data_dir=data_dir)
+        self.proxy = client
+        response = client.run("print")
+        with mock.patch.object(client, "run", return_value=response), \
+                mock.patch("financeager.communication.prettify",
+                           return_value="") as prettify:
+            self.run_command("print")
+            self.run_command("print")
+            self.assertEqual(prettify.call_count, 1)
+
+            self.run_command("print", stacked_layout=True)
+            self.assertEqual(prettify.call_count, 2)
+
+            # The memo is held by the client
+            communication.run(localserver.LocalServer(), "print")
+            self.assertEqual(prettify.call_count, 3)
+            self.run_command("print", stacked_layout=True)
+            self.assertEqual(prettify.call_count, 3)
+        client.close()
+
+    def test_run_many(self):
+        responses = communication.run_many(
+            self.proxy, [
+                {
+                    "command": "update",
+                    "eid": 1,
+                    "date": "01-01"
+                },
+                {
+                    "command": "get",
+                    "eid": 1
+                },
+                {
+                    "command": "get",
+                    "eid": 2
+                },
+            ],
+            date_format=BaseEntry.DATE_FORMAT)
+        self.assertEqual(responses, [
+            "Updated element 1.", """\
+Name    : Pants
+Value   : -99.0
+Date    : 01-01
+Category: Clothes""", "Invalid request: Element not found."
+        ])
+
     def test_stop(self):
         # For completeness, directly shutdown the localserver
         self.assertEqual(self.run_command("stop"), "")
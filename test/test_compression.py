@@ -0,0 +1,179 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from financeager.compression import (
+    negotiate, compress, compress_stream, decompress, compress_response,
+    DecompressionError, BodyTooLargeError, CompressionMiddleware)
+
+
+class NegotiateTestCase(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate("deflate"), "deflate")
+        self.assertEqual(negotiate("gzip;q=0.5, deflate"), "deflate")
+        self.assertEqual(negotiate("*"), "gzip")
+        self.assertEqual(negotiate("*, gzip;q=0"), "deflate")
+        self.assertIsNone(negotiate("br"))
+        self.assertIsNone(negotiate("gzip;q=0"))
+        self.assertIsNone(negotiate(""))
+        self.assertIsNone(negotiate(None))
+
+
+class CompressTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        body = 100 * b"financeager"
+        for encoding in ("gzip", "deflate"):
+            compressed = compress(body, encoding)
+            self.assertLess(len(compressed), len(body))
+            self.assertEqual(decompress(compressed, encoding), body)
+
+        self.assertEqual(decompress(body, None), body)
+        self.assertEqual(decompress(body, "identity"), body)
+        self.assertEqual(gzip.decompress(compress(body, "gzip")), body)
+        self.assertRaises(ValueError, compress, body, "br")
+
+    def test_compress_stream(self):
+        chunks = [b"financeager", b"", 100 * b"x"]
+        for encoding in ["gzip", "deflate"]:
+            compressed = b"".join(compress_stream(chunks, encoding))
+            self.assertEqual(decompress(compressed, encoding), b"".join(chunks))
+        self.assertRaises(ValueError, list, compress_stream(chunks, "br"))
+
+    def test_raw_deflate(self):
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw = compressor.compress(b"financeager") + compressor.flush()
+        self.assertEqual(decompress(raw, "deflate"), b"financeager")
+
+    def test_invalid(self):
+        self.assertRaises(DecompressionError, decompress, b"foo", "gzip")
+        self.assertRaises(DecompressionError, decompress, b"foo", "deflate")
+        self.assertRaises(DecompressionError, decompress, b"foo", "br")
+
+        compressed = compress(b"financeager", "gzip")
+        self.assertRaises(DecompressionError, decompress, compressed[:-4],
+                          "gzip")
+        self.assertRaises(DecompressionError, decompress, compressed + b"foo",
+                          "gzip")
+
+    def test_max_size(self):
+        body = 1000000 * b"\0"
+        for encoding in ("gzip", "deflate"):
+            compressed = compress(body, encoding)
+            self.assertEqual(
+                decompress(compressed, encoding, max_size=len(body)), body)
+            self.assertRaises(
+                BodyTooLargeError,
+                decompress,
+                compressed,
+                encoding,
+                max_size=len(body) - 1)
+
+    def test_compress_response(self):
+        body = 100 * b"financeager"
+        compressed, encoding = compress_response(body, "gzip", min_size=10)
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(decompress(compressed, "gzip"), body)
+
+        self.assertEqual(
+            compress_response(body, "gzip", min_size=2000), (body, None))
+        self.assertEqual(
+            compress_response(body, "gzip", level=0, min_size=10), (body, None))
+        self.assertEqual(
+            compress_response(body, "identity", min_size=10), (body, None))
+
+
+class CompressionMiddlewareTestCase(unittest.TestCase):
+    def setUp(self):
+        def app(environ, start_response):
+            # Echo the request body
+            body = environ["wsgi.input"].read(
+                int(environ.get("CONTENT_LENGTH") or 0))
+            headers = [("Content-Type", "application/json"),
+                       ("Content-Length", str(len(body)))]
+            if environ["PATH_INFO"] == "/encoded":
+                headers.append(("Content-Encoding", "gzip"))
+            start_response("200 OK", headers)
+            return [body]
+
+        self.client = Client(
+            CompressionMiddleware(app, min_size=100), BaseResponse)
+        self.body = json.dumps(50 * ["financeager"]).encode()
+
+    def test_response(self):
+        response = self.client.post(
+            "/", data=self.body, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(
+            int(response.headers["Content-Length"]), len(response.data))
+        self.assertEqual(gzip.decompress(response.data), self.body)
+
+        # Not accepted
+        response = self.client.post("/", data=self.body)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.data, self.body)
+
+        # Too small
+        response = self.client.post(
+            "/", data=b"[]", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+        # Already encoded
+        response = self.client.post(
+            "/encoded", data=self.body, headers={"Accept-Encoding": "deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.data, self.body)
+
+    def test_streamed_response(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/csv")])
+            return (line for line in 50 * [b"financeager\n"])
+
+        client = Client(CompressionMiddleware(app, min_size=100), BaseResponse)
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(gzip.decompress(response.data), 50 * b"financeager\n")
+
+        response = client.get("/")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.data, 50 * b"financeager\n")
+
+    def test_request(self):
+        response = self.client.post(
+            "/",
+            data=compress(self.body, "deflate"),
+            headers={"Content-Encoding": "deflate"})
+        self.assertEqual(response.data, self.body)
+
+        response = self.client.post(
+            "/", data=b"foo", headers={"Content-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid gzip body", json.loads(response.data)["error"])
+
+    def test_request_too_large(self):
+        def app(environ, start_response):  # pragma: no cover
+            raise AssertionError("Request passed on")
+
+        client = Client(
+            CompressionMiddleware(app, max_body_size=1000), BaseResponse)
+
+        # Highly compressible body
+        response = client.post(
+            "/",
+            data=compress(1000000 * b" ", "gzip"),
+            headers={"Content-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("exceeds 1000 bytes", json.loads(response.data)["error"])
+
+        response = client.post("/", data=1001 * b" ")
+        self.assertEqual(response.status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
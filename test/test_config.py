@@ -8,7 +8,8 @@ class ConfigTestCase(unittest.TestCase):
     def test_sections(self):
         config = Configuration()
         self.assertSetEqual(
-            set(config.sections()), {"SERVICE", "FRONTEND", "SERVICE:FLASK"})
+            set(config.sections()),
+            {"SERVICE", "FRONTEND", "SERVICE:FLASK", "SERVICE:NONE"})
 
     def test_load_custom_config_file(self):
         # create custom config file, modify service name
@@ -32,6 +33,14 @@ class ConfigTestCase(unittest.TestCase):
                 "[FRONTEND]\ndefault_category = ",
                 "[SERVICE:FLASK]\ntimeout = foo",
                 "[SERVICE:FLASK]\nhost = ",
+                "[SERVICE:FLASK]\npool_size = 0",
+                "[SERVICE:FLASK]\nkeep_alive = maybe",
+                "[SERVICE:FLASK]\ncompress_requests = maybe",
+                "[SERVICE:FLASK]\ncolumnar = maybe",
+                "[SERVICE:FLASK]\nrecurrent_templates = maybe",
+                "[SERVICE:NONE]\ndaemon = maybe",
+                "[SERVICE:NONE]\nidle_timeout = 0",
+                "[SERVICE:NONE]\nidle_timeout = never",
         ):
             with open(filepath, "w") as file:
                 file.write(content)
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from financeager import DEFAULT_TABLE
+from financeager.daemon import DaemonProxy, serve, socket_path
+from financeager.exceptions import InvalidRequest
+
+
+class DaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.thread = threading.Thread(
+            target=serve, args=(self.data_dir,), kwargs={"idle_timeout": 0.5})
+        self.thread.start()
+        while not os.path.exists(socket_path(self.data_dir)):
+            time.sleep(0.01)
+        self.proxy = DaemonProxy(self.data_dir)
+
+    def tearDown(self):
+        self.proxy.close()
+        self.thread.join()
+
+    def test_commands(self):
+        eid = self.proxy.run("add", name="beer", value=-2, period="2000")["id"]
+        self.assertEqual(
+            self.proxy.run("get", eid=eid, period="2000")["element"]["name"],
+            "beer")
+
+        elements = self.proxy.run("print", period="2000")["elements"]
+        self.assertEqual(elements[DEFAULT_TABLE][str(eid)]["value"], -2)
+
+        results = self.proxy.run_many([{
+            "command": "rm",
+            "eid": eid,
+            "period": "2000"
+        }])
+        self.assertEqual(results, [{"id": eid}])
+
+    def test_export(self):
+        self.proxy.run_many([{
+            "command": "add",
+            "name": "entry {}".format(i),
+            "value": -i,
+            "period": "2000"
+        } for i in range(1, 4)])
+
+        with mock.patch("financeager.daemon.EXPORT_CHUNK_SIZE", 1):
+            chunks = list(self.proxy.export(period="2000", format="jsonl"))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(json.loads(chunks[2])["name"], "entry 3")
+
+        # The connection is discarded if the export is not consumed entirely
+        with mock.patch("financeager.daemon.EXPORT_CHUNK_SIZE", 1):
+            chunks = self.proxy.export(period="2000")
+            self.assertTrue(next(chunks).startswith("table_name,"))
+            chunks.close()
+        self.assertEqual(self.proxy.run("list"), {"periods": ["2000"]})
+
+        with self.assertRaises(InvalidRequest):
+            self.proxy.export(format="xml")
+
+    def test_invalid_request(self):
+        with self.assertRaises(InvalidRequest):
+            self.proxy.run("get", eid=1, period="2000")
+
+    def test_state_shared_between_clients(self):
+        self.proxy.run("add", name="beer", value=-2, period="2000")
+        self.proxy.run("stop")
+
+        proxy = DaemonProxy(self.data_dir)
+        elements = proxy.run("print", period="2000")["elements"]
+        proxy.close()
+        self.assertEqual(len(elements[DEFAULT_TABLE]), 1)
+
+    def test_idle_timeout(self):
+        self.proxy.run("list")
+        self.proxy.close()
+        self.thread.join(timeout=3)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(socket_path(self.data_dir)))
+
+    def test_second_daemon_exits(self):
+        # Returns immediately since the socket is served already
+        serve(self.data_dir)
+        self.assertEqual(self.proxy.run("list"), {"periods": []})
+
+
+class DaemonStartOnDemandTestCase(unittest.TestCase):
+    def test_start(self):
+        data_dir = tempfile.mkdtemp(prefix="financeager-")
+        proxy = DaemonProxy(data_dir, idle_timeout=0.5)
+        proxy.run("add", name="beer", value=-2, period="2000")
+        self.assertTrue(os.path.exists(socket_path(data_dir)))
+        proxy.run("stop")
+
+        # The daemon exits after the idle timeout, and the period file is
+        # persisted
+        for _ in range(500):
+            if not os.path.exists(socket_path(data_dir)):
+                break
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(socket_path(data_dir)))
+        self.assertTrue(os.path.exists(os.path.join(data_dir, "2000.json")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import unittest
+
+from financeager import DEFAULT_TABLE
+from financeager.exporting import export_lines, FIELDS, RECURRENT_FIELDS
+
+
+class ExportLinesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.entries = [
+            (DEFAULT_TABLE, 1, {
+                "name": "beer, cold",
+                "value": -2.5,
+                "category": None,
+                "date": "01-02"
+            }),
+            ("recurrent", 1, {
+                "name": "rent",
+                "value": -500.0,
+                "category": "housing",
+                "frequency": "monthly",
+                "start": "01-01",
+                "end": None
+            }),
+        ]
+
+    def test_csv(self):
+        lines = list(export_lines(self.entries[:1]))
+        self.assertEqual(lines, [
+            "table_name,eid,name,value,category,date\n",
+            'standard,1,"beer, cold",-2.5,,01-02\n',
+        ])
+
+        rows = list(csv.reader(io.StringIO("".join(lines))))
+        self.assertEqual(rows[1][2], "beer, cold")
+
+    def test_csv_recurrent_templates(self):
+        lines = list(export_lines(self.entries, expand_recurrent=False))
+        self.assertEqual(lines[0], ",".join(RECURRENT_FIELDS) + "\n")
+        self.assertEqual(lines[2],
+                         "recurrent,1,rent,-500.0,housing,,monthly,01-01,\n")
+
+    def test_jsonl(self):
+        lines = list(export_lines(self.entries[:1], format="jsonl"))
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(list(record), list(FIELDS))
+        self.assertEqual(record["name"], "beer, cold")
+
+        lines = export_lines(
+            self.entries, format="jsonl", expand_recurrent=False)
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(records[1]["frequency"], "monthly")
+        self.assertNotIn("date", records[1])
+
+    def test_lazy(self):
+        def entries():
+            yield self.entries[0]
+            raise AssertionError("consumed too far")
+
+        lines = export_lines(entries(), format="jsonl")
+        self.assertEqual(json.loads(next(lines))["eid"], 1)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError) as context:
+            next(export_lines(self.entries, format="xml"))
+        self.assertEqual(str(context.exception), "Unknown export format 'xml'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
 from os import environ
+import gzip
+import json
+import os
+import shutil
 import tempfile
 import unittest
 from unittest import mock
@@ -45,6 +49,160 @@ class CreateAppNoDataDirTestCase(unittest.TestCase):
         # Expect Bad Request due to missing data (name and value)
         self.assertEqual(response.status_code, 400)
 
+    def test_conditional_print(self):
+        app = create_app()
+        app.testing = True
+        with app.test_client() as client:
+            client.post("/periods/2000", json={"name": "rent", "value": -500})
+
+            response = client.get("/periods/2000")
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            last_modified = response.headers["Last-Modified"]
+
+            response = client.get(
+                "/periods/2000", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+
+            response = client.get(
+                "/periods/2000", headers={"If-Modified-Since": last_modified})
+            self.assertEqual(response.status_code, 304)
+
+            client.post("/periods/2000", json={"name": "bus", "value": -2})
+            response = client.get(
+                "/periods/2000", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+            self.assertEqual(
+                len(response.get_json()["elements"]["standard"]), 2)
+
+    def test_print_corrupt_database(self):
+        data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.addCleanup(shutil.rmtree, data_dir)
+        with open(os.path.join(data_dir, "2020.json"), "w") as file:
+            file.write("{corrupt")
+
+        app = create_app(data_dir=data_dir)
+        app.testing = True
+        with app.test_client() as client:
+            response = client.get("/periods/2020")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {"error": "unexpected error"})
+
+    def test_print_query_filters(self):
+        app = create_app()
+        app.testing = True
+        with app.test_client() as client:
+            client.post("/periods/2000", json={"name": "rent", "value": -500})
+            client.post(
+                "/periods/2000",
+                json={
+                    "name": "bus",
+                    "value": -2,
+                    "category": "transport"
+                })
+
+            response = client.get("/periods/2000?name=bus")
+            elements = response.get_json()["elements"]["standard"]
+            self.assertEqual(list(elements), ["2"])
+
+            # Empty pattern filters for the default category
+            response = client.get("/periods/2000?category=")
+            elements = response.get_json()["elements"]["standard"]
+            self.assertEqual(list(elements), ["1"])
+
+            response = client.get("/periods/2000?format=columnar&name=bus")
+            payload = response.get_json()["elements"]
+            self.assertEqual(payload["format"], "columnar")
+            self.assertEqual(payload["standard"]["eid"], [2])
+
+            response = client.get("/periods/2000?format=templates")
+            payload = response.get_json()["elements"]
+            self.assertEqual(payload["format"], "columnar")
+            self.assertIn("until", payload)
+
+            response = client.get("/periods/2000?format=xml")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()["error"],
+                             "Unknown format 'xml'")
+
+            response = client.get("/periods/2000?name=(")
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response.get_json()["error"].startswith(
+                "Invalid filter pattern '('"))
+
+            response = client.get(
+                "/periods/2000", json=json.dumps({"filters": {
+                    "name": 1
+                }}))
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch(self):
+        app = create_app()
+        app.testing = True
+        with app.test_client() as client:
+            response = client.post(
+                "/periods/batch",
+                json={
+                    "commands": [{
+                        "command": "add",
+                        "name": "rent",
+                        "value": -500,
+                        "period": "2000"
+                    }, {
+                        "command": "list"
+                    }]
+                })
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["results"], [{
+                "id": 1
+            }, {
+                "periods": ["2000"]
+            }])
+
+            # Expect Bad Request due to missing commands
+            response = client.post("/periods/batch", json={})
+            self.assertEqual(response.status_code, 400)
+
+    def test_compression(self):
+        app = create_app(config={"COMPRESSION_MIN_SIZE": 100})
+        app.testing = True
+        with app.test_client() as client:
+            commands = [{
+                "command": "add",
+                "name": "entry {}".format(i),
+                "value": -i,
+                "period": "2000"
+            } for i in range(10)]
+            response = client.post(
+                "/periods/batch",
+                data=gzip.compress(json.dumps({
+                    "commands": commands
+                }).encode()),
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip"
+                })
+            self.assertEqual(response.status_code, 200)
+
+            response = client.get(
+                "/periods/2000", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            elements = json.loads(gzip.decompress(
+                response.data))["elements"]["standard"]
+            self.assertEqual(len(elements), 10)
+
+            response = client.get("/periods/2000")
+            self.assertNotIn("Content-Encoding", response.headers)
+
+        app = create_app(config={"COMPRESSION_LEVEL": 0})
+        with app.test_client() as client:
+            response = client.post(
+                "/periods", headers={"Accept-Encoding": "gzip"})
+            self.assertNotIn("Content-Encoding", response.headers)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,19 @@
+import json
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 
 from financeager.httprequests import _Proxy
-from financeager.exceptions import CommunicationError
+from financeager.columnar import decode
+from financeager import communication
+from financeager.exceptions import CommunicationError, InvalidRequest
+from financeager.fflask import create_app
+from financeager.serving import ThreadingWSGIServer
 from financeager import PERIODS_TAIL, DEFAULT_HOST, DEFAULT_TIMEOUT
 
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="financeager-")
+
 
 class HttpRequestProxyTestCase(unittest.TestCase):
     def mock_post(*args, **kwargs):
@@ -24,7 +33,7 @@ class HttpRequestProxyTestCase(unittest.TestCase):
         proxy = _Proxy(http_config={"username": username, "password": password})
 
         with patch(
-                "financeager.httprequests.requests.post",
+                "financeager.httprequests.requests.Session.post",
                 side_effect=self.mock_post) as post_patch:
 
             proxy.run("list")
@@ -51,5 +60,120 @@ class HttpRequestProxyTestCase(unittest.TestCase):
         self.assertIn("Name or service not known", error_message)
 
 
+class _CountingWSGIServer(ThreadingWSGIServer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_count = 0
+
+    def process_request(self, request, client_address):
+        self.connection_count += 1
+        super().process_request(request, client_address)
+
+
+@patch("financeager.DATA_DIR", TEST_DATA_DIR)
+class HttpRequestProxySessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _CountingWSGIServer(("127.0.0.1", 0))
+        self.server.set_app(create_app())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.http_config = {
+            "host": "http://{}:{}".format(*self.server.server_address)
+        }
+
+    def test_session_shared(self):
+        self.assertIs(_Proxy()._session, _Proxy()._session)
+        self.assertIsNot(_Proxy()._session,
+                         _Proxy(http_config={
+                             "pool_size": "2"
+                         })._session)
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            self.assertEqual(
+                _Proxy(http_config=self.http_config).run("list"),
+                {"periods": []})
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_no_keep_alive(self):
+        self.http_config["keep_alive"] = "false"
+        for _ in range(3):
+            _Proxy(http_config=self.http_config).run("list")
+        self.assertEqual(self.server.connection_count, 3)
+
+    def test_compressed_batch(self):
+        self.http_config["compress_requests"] = "true"
+        commands = [{
+            "command": "add",
+            "name": "entry {}".format(i),
+            "value": -i,
+            "period": "2000"
+        } for i in range(50)]
+
+        with patch(
+                "financeager.httprequests.requests.Session.post",
+                wraps=_Proxy(
+                    http_config=self.http_config)._session.post) as post_patch:
+            results = _Proxy(http_config=self.http_config).run_many(commands)
+
+        self.assertEqual(results[-1], {"id": 50})
+        kwargs = post_patch.call_args[1]
+        self.assertEqual(kwargs["headers"]["Content-Encoding"], "gzip")
+
+        elements = _Proxy(http_config=self.http_config).run(
+            "print", period="2000")["elements"]
+        self.assertEqual(len(elements["standard"]), 50)
+
+    def test_columnar(self):
+        proxy = _Proxy(http_config=self.http_config)
+        proxy.run("add", name="rent", value=-500, period="2000")
+        elements = proxy.run("print", period="2000")["elements"]
+
+        self.http_config["columnar"] = "true"
+        proxy = _Proxy(http_config=self.http_config)
+        payload = proxy.run("print", period="2000")["elements"]
+        self.assertEqual(payload["format"], "columnar")
+        self.assertEqual(decode(payload), elements)
+
+        self.http_config["recurrent_templates"] = "true"
+        proxy = _Proxy(http_config=self.http_config)
+        payload = proxy.run("print", period="2000")["elements"]
+        self.assertIn("until", payload)
+        self.assertEqual(decode(payload), elements)
+        self.assertEqual(
+            communication.run(proxy, "print", period="2000"),
+            communication.run(
+                _Proxy(http_config={"host": self.http_config["host"]}),
+                "print",
+                period="2000"))
+
+    def test_export(self):
+        proxy = _Proxy(http_config=self.http_config)
+        proxy.run_many([{
+            "command": "add",
+            "name": "entry {}".format(i),
+            "value": -i,
+            "date": "01-01",
+            "period": "2002"
+        } for i in range(1, 201)])
+
+        lines = "".join(proxy.export(period="2002")).splitlines()
+        self.assertEqual(len(lines), 201)
+        self.assertEqual(lines[1], "standard,1,entry 1,-1.0,,01-01")
+
+        chunks = proxy.export(
+            period="2002", format="jsonl", filters={"name": "entry 20"})
+        records = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual([r["eid"] for r in records], [20, 200])
+
+        with self.assertRaises(InvalidRequest):
+            proxy.export(period="2002", format="xml")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,260 @@
+import io
+import tempfile
+import unittest
+
+from financeager import DEFAULT_TABLE
+from financeager.exceptions import PreprocessingError
+from financeager.importing import (_parse_row, import_csv, normalize_name,
+                                   EntryIndex, NEW, DUPLICATE, PROBABLE)
+from financeager.localserver import LocalServer
+from financeager.rules import Categorizer, Rule
+
+
+class ParseRowTestCase(unittest.TestCase):
+    def test_default_format(self):
+        self.assertEqual(
+            _parse_row({
+                "name": " Beer ",
+                "value": "-2.5",
+                "date": "2019-12-31"
+            }), ("2019", {
+                "name": "Beer",
+                "value": -2.5,
+                "date": "12-31"
+            }))
+
+    def test_date_without_year(self):
+        row = {"name": "beer", "value": "-2", "date": "31.12."}
+        period, entry = _parse_row(row, date_format="%d.%m.", period="2000")
+        self.assertEqual(period, "2000")
+        self.assertEqual(entry["date"], "12-31")
+
+    def test_decimal_comma(self):
+        row = {"name": "rent", "value": "-1.234,56", "date": "2000-01-01"}
+        _, entry = _parse_row(row, decimal_comma=True)
+        self.assertEqual(entry["value"], -1234.56)
+
+    def test_category(self):
+        row = {"name": "beer", "value": "-2", "date": "2000-01-01", "cat": ""}
+        _, entry = _parse_row(row, category_column="cat")
+        self.assertIsNone(entry["category"])
+
+        row["cat"] = "groceries"
+        _, entry = _parse_row(row, category_column="cat")
+        self.assertEqual(entry["category"], "groceries")
+
+    def test_categorizer(self):
+        categorizer = Categorizer(
+            [Rule(pattern="lidl", name="lidl", category="groceries")])
+        row = {"name": "LIDL SAGT DANKE", "value": "-2", "date": "2000-01-01"}
+        _, entry = _parse_row(row, categorizer=categorizer)
+        self.assertEqual(entry["name"], "lidl")
+        self.assertEqual(entry["category"], "groceries")
+
+        # An explicit category takes precedence
+        row["cat"] = "snacks"
+        _, entry = _parse_row(
+            row, category_column="cat", categorizer=categorizer)
+        self.assertEqual(entry["category"], "snacks")
+
+        row["name"] = "Cinema"
+        _, entry = _parse_row(row, categorizer=categorizer)
+        self.assertEqual(entry["name"], "Cinema")
+        self.assertNotIn("category", entry)
+
+    def test_invalid_fields(self):
+        row = {"name": "beer", "value": "-2", "date": "2000-01-01"}
+        for field, value, message in [
+            ("name", "", "Empty name"),
+            ("value", "a lot", "Invalid value 'a lot'"),
+            ("date", "01/01/2000", "Invalid date '01/01/2000'"),
+            ("date", "2000-02-29", "Invalid date '2000-02-29'"),
+            ("date", None, "Invalid date ''"),
+        ]:
+            with self.assertRaises(ValueError) as context:
+                _parse_row(dict(row, **{field: value}))
+            self.assertEqual(str(context.exception), message)
+
+
+class EntryIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = EntryIndex([
+            (DEFAULT_TABLE, "1", {
+                "name": "lidl fil. 12",
+                "value": -2.5,
+                "date": "01-01"
+            }),
+            ("recurrent", "1", {
+                "name": "rent, january",
+                "value": -500.0,
+                "date": "01-01"
+            }),
+        ])
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(" LIDL  Fil.12 "), "lidl fil 12")
+
+    def test_classify(self):
+        entry = {"name": "LIDL FIL 12", "value": -2.50001, "date": "01-01"}
+        self.assertEqual(
+            self.index.classify(entry), (DUPLICATE,
+                                         (DEFAULT_TABLE, 1, "lidl fil. 12")))
+        # The existing entry is matched only once
+        self.assertEqual(self.index.classify(entry), (NEW, None))
+
+        entry = {"name": "Miete", "value": -500, "date": "01-01"}
+        self.assertEqual(
+            self.index.classify(entry), (PROBABLE,
+                                         ("recurrent", 1, "rent, january")))
+        self.assertEqual(self.index.classify(entry), (NEW, None))
+
+    def test_probable_match_consumes_exact_key(self):
+        entry = {"name": "Lidl", "value": -2.5, "date": "01-01"}
+        self.assertEqual(self.index.classify(entry)[0], PROBABLE)
+        entry["name"] = "lidl fil 12"
+        self.assertEqual(self.index.classify(entry), (NEW, None))
+
+    def test_different_date_or_value(self):
+        entry = {"name": "lidl fil 12", "value": -2.5, "date": "01-02"}
+        self.assertEqual(self.index.classify(entry), (NEW, None))
+        entry = {"name": "lidl fil 12", "value": -2.49, "date": "01-01"}
+        self.assertEqual(self.index.classify(entry), (NEW, None))
+
+
+class ImportCsvTestCase(unittest.TestCase):
+    def setUp(self):
+        self.proxy = LocalServer(data_dir=self.temporary_directory())
+
+    def tearDown(self):
+        self.proxy.run("stop")
+
+    def temporary_directory(self):
+        """Create a temporary directory that is removed after the test (and
+        after stopping the proxy), and return its path."""
+        directory = tempfile.TemporaryDirectory(prefix="financeager-")
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def elements(self, period):
+        return self.proxy.run("print", period=period)["elements"][DEFAULT_TABLE]
+
+    def test_split_by_period(self):
+        file = io.StringIO("""\
+Day;Text;Amount;Comment
+30.12.2019;Beer;-2,50;
+02.01.2020;Rent;-1.000,00;
+xx;Invalid;1;
+03.01.2020;Salary;2000;
+""")
+        stats = import_csv(
+            self.proxy,
+            file,
+            delimiter=";",
+            batch_size=2,
+            name_column="Text",
+            value_column="Amount",
+            date_column="Day",
+            date_format="%d.%m.%Y",
+            decimal_comma=True)
+
+        self.assertEqual(stats["rows"], 4)
+        self.assertEqual(stats["imported"], 3)
+        self.assertEqual(stats["periods"], {"2019": 1, "2020": 2})
+        self.assertEqual(stats["skipped"], [(4, "Invalid date 'xx'")])
+        self.assertEqual(stats["failed"], [])
+        self.assertGreater(stats["rows_per_second"], 0)
+
+        self.assertEqual([e["name"] for e in self.elements("2019").values()],
+                         ["beer"])
+        self.assertEqual(
+            sorted(e["value"] for e in self.elements("2020").values()),
+            [-1000.0, 2000.0])
+
+    def test_default_period(self):
+        file = io.StringIO("name,value,date\nbeer,-2,01-01\n")
+        stats = import_csv(self.proxy, file, date_format="%m-%d", period="2000")
+        self.assertEqual(stats["periods"], {"2000": 1})
+
+    def test_rule_category_precedes_previous_entries(self):
+        self.proxy.run(
+            "add", name="lidl", value=-1, category="snacks", period="2000")
+
+        categorizer = Categorizer(
+            [Rule(pattern="lidl", name="lidl", category="groceries")])
+        file = io.StringIO("name,value,date\nLidl Fil.1,-2,2000-01-01\n")
+        import_csv(self.proxy, file, categorizer=categorizer)
+
+        categories = sorted(
+            e["category"] for e in self.elements("2000").values())
+        self.assertEqual(categories, ["groceries", "snacks"])
+
+    def test_reconcile(self):
+        self.proxy.run(
+            "add", name="beer", value=-2, date="01-01", period="2000")
+        self.proxy.run(
+            "add", name="rent", value=-500, date="01-02", period="2000")
+        content = """\
+name,value,date
+Beer,-2,2000-01-01
+beer,-2,2000-01-01
+Miete,-500,2000-01-02
+salary,1000,2001-01-01
+"""
+        stats = import_csv(
+            self.proxy, io.StringIO(content), reconcile=True, dry_run=True)
+        self.assertEqual(stats["new"], 2)
+        self.assertEqual(stats["duplicates"], [(2, DEFAULT_TABLE, 1, "beer")])
+        self.assertEqual(stats["probable"], [(4, DEFAULT_TABLE, 2, "rent")])
+        self.assertEqual(stats["imported"], 0)
+        self.assertEqual(len(self.elements("2000")), 2)
+        self.assertEqual(self.elements("2001"), {})
+
+        stats = import_csv(self.proxy, io.StringIO(content), reconcile=True)
+        self.assertEqual(stats["imported"], 3)
+        self.assertEqual(stats["periods"], {"2000": 2, "2001": 1})
+        self.assertEqual(len(self.elements("2000")), 4)
+
+        # All rows are known now
+        stats = import_csv(self.proxy, io.StringIO(content), dry_run=True)
+        self.assertEqual(stats["new"], 0)
+        self.assertEqual(len(stats["duplicates"]), 4)
+
+    def test_missing_column(self):
+        file = io.StringIO("name,amount,date\nbeer,-2,2000-01-01\n")
+        with self.assertRaises(PreprocessingError) as context:
+            import_csv(self.proxy, file, category_column="category")
+        self.assertEqual(
+            str(context.exception),
+            "Column(s) not found in CSV header: value, category")
+
+    def test_failed_batch(self):
+        class Proxy(LocalServer):
+            def run_many(self, commands):
+                # Simulate an invalid entry in period 2000
+                results = super().run_many(
+                    [c for c in commands if c["period"] != "2000"])
+                error = {"error": "Entry 1: invalid"}
+                return [
+                    error if c["period"] == "2000" else results.pop(0)
+                    for c in commands
+                ]
+
+        self.proxy.run("stop")
+        self.proxy = Proxy(data_dir=self.temporary_directory())
+        file = io.StringIO("""\
+name,value,date
+beer,-2,2000-01-01
+rent,-500,2000-01-02
+salary,1000,2001-01-01
+""")
+        stats = import_csv(self.proxy, file)
+
+        self.assertEqual(stats["imported"], 1)
+        self.assertEqual(stats["periods"], {"2001": 1})
+        self.assertEqual(stats["failed_rows"], 2)
+        self.assertEqual(stats["failed"],
+                         ["Period 2000, lines 2-3: Entry 1: invalid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
+import json
 import unittest
 from unittest import mock
 import os.path
 
-from financeager.offline import add, _load, recover, OfflineRecoveryError
+from financeager.offline import (add, _load, recover, OfflineRecoveryError,
+                                 CURSOR_SUFFIX, LOCK_SUFFIX)
 from financeager.localserver import proxy as local_proxy
 
 
@@ -10,7 +12,7 @@ class AddTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.filepath = os.path.join(
-            os.path.expanduser("~"), "offline_test.json")
+            os.path.expanduser("~"), "offline_test.jsonl")
 
     def test_add_recover(self):
         period_name = "123"
@@ -60,9 +62,110 @@ class AddTestCase(unittest.TestCase):
         self.assertDictEqual(content[0], kwargs)
         self.assertDictEqual(content[1], kwargs)
 
+    def test_append_only(self):
+        add("add", offline_filepath=self.filepath, name="money", value=111)
+        with open(self.filepath) as file:
+            first_line = file.read()
+
+        add("rm", offline_filepath=self.filepath, eid=1)
+        with open(self.filepath) as file:
+            content = file.read()
+        self.assertTrue(content.startswith(first_line))
+        self.assertEqual(
+            json.loads(content[len(first_line):]), {
+                "eid": 1,
+                "command": "rm"
+            })
+
+    def test_recover_in_order(self):
+        period_name = "124"
+        add("add",
+            offline_filepath=self.filepath,
+            name="money",
+            value=111,
+            period=period_name)
+        add("update",
+            offline_filepath=self.filepath,
+            eid=1,
+            name="gold",
+            period=period_name)
+
+        proxy = local_proxy()
+        self.assertTrue(recover(proxy, offline_filepath=self.filepath))
+        element = proxy.run("get", eid=1, period=period_name)["element"]
+        self.assertEqual(element["name"], "gold")
+        self.assertFalse(os.path.exists(self.filepath))
+        self.assertFalse(os.path.exists(self.filepath + CURSOR_SUFFIX))
+
+    @mock.patch('financeager.offline.run')
+    def test_resume_recover(self, run_mock):
+        for value in [1, 2, 3]:
+            add("add",
+                offline_filepath=self.filepath,
+                name="money",
+                value=value)
+
+        # The second request fails
+        run_mock.side_effect = [None, Exception()]
+        self.assertRaises(
+            OfflineRecoveryError, recover, None, offline_filepath=self.filepath)
+        self.assertEqual([d["value"] for d in _load(self.filepath)], [2, 3])
+
+        # Requests stored meanwhile are recovered after the pending ones
+        add("add", offline_filepath=self.filepath, name="money", value=4)
+        run_mock.side_effect = None
+        run_mock.reset_mock()
+        self.assertTrue(recover(None, offline_filepath=self.filepath))
+        self.assertEqual([c[1]["value"] for c in run_mock.call_args_list],
+                         [2, 3, 4])
+        self.assertFalse(recover(None, offline_filepath=self.filepath))
+
+    @mock.patch('financeager.offline.run')
+    def test_truncated_last_line(self, run_mock):
+        for value in [1, 2]:
+            add("add",
+                offline_filepath=self.filepath,
+                name="money",
+                value=value)
+        # Simulate an interrupted append of the second request
+        with open(self.filepath, "r+") as file:
+            file.truncate(os.path.getsize(self.filepath) - 5)
+
+        # The next request starts a new line
+        add("add", offline_filepath=self.filepath, name="money", value=3)
+        self.assertEqual([d["value"] for d in _load(self.filepath)], [1, 3])
+
+        with mock.patch("financeager.offline.logger.error") as error_mock:
+            self.assertTrue(recover(None, offline_filepath=self.filepath))
+        self.assertIn("Skipping invalid line", error_mock.call_args[0][0])
+        self.assertEqual([c[1]["value"] for c in run_mock.call_args_list],
+                         [1, 3])
+        self.assertFalse(os.path.exists(self.filepath))
+
+    def test_migrate_legacy_file(self):
+        legacy_filepath = self.filepath[:-1]
+        with open(legacy_filepath, "w") as file:
+            json.dump([
+                {
+                    "command": "add",
+                    "name": "money",
+                    "value": 1
+                },
+                {
+                    "command": "rm",
+                    "eid": 1
+                },
+            ], file)
+
+        add("add", offline_filepath=self.filepath, name="money", value=2)
+        self.assertFalse(os.path.exists(legacy_filepath))
+        self.assertEqual([d["command"] for d in _load(self.filepath)],
+                         ["add", "rm", "add"])
+
     def tearDown(self):
-        if os.path.exists(self.filepath):
-            os.remove(self.filepath)
+        for suffix in ["", CURSOR_SUFFIX, LOCK_SUFFIX]:
+            if os.path.exists(self.filepath + suffix):
+                os.remove(self.filepath + suffix)
 
 
 if __name__ == "__main__":
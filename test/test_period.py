@@ -4,12 +4,15 @@ from collections import Counter
 import os.path
 import json
 import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
 from schematics.exceptions import DataError
 
 from financeager.period import Period, TinyDbPeriod, PeriodException,\
     BaseValidationModel, StandardEntryValidationModel,\
-    RecurrentEntryValidationModel, _DEFAULT_CATEGORY
+    RecurrentEntryValidationModel, _DEFAULT_CATEGORY, expand_recurrent_element
 from financeager import PERIOD_DATE_FORMAT, DEFAULT_TABLE
 
 
@@ -201,6 +204,26 @@ class TinyDbPeriodRecurrentEntryNowTestCase(unittest.TestCase):
         elements = period.get_entries()
         self.assertEqual(len(elements["recurrent"][entry_id]), day_nr)
 
+    def test_expand_recurrent_element_until(self):
+        element = dict(
+            name="lunch",
+            value=-5,
+            category=None,
+            frequency="weekly",
+            start="01-01",
+            end="12-31")
+        elements = list(
+            expand_recurrent_element(
+                element, 2001, until=dt.datetime(2001, 1, 31)))
+        self.assertEqual([e["date"] for e in elements],
+                         ["01-01", "01-08", "01-15", "01-22", "01-29"])
+        self.assertEqual(elements[0]["name"], "lunch, week 01")
+
+        # Leap day as start date
+        element.update(frequency="yearly", start="02-29")
+        elements = list(expand_recurrent_element(element, 2000))
+        self.assertEqual([e["date"] for e in elements], ["02-29"])
+
 
 class TinyDbPeriodRecurrentEntryTestCase(unittest.TestCase):
     def setUp(self):
@@ -339,6 +362,271 @@ class TinyDbPeriodRecurrentEntryTestCase(unittest.TestCase):
         self.period.close()
 
 
+class TinyDbPeriodSnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.period = TinyDbPeriod(name=1901)
+        self.eid = self.period.add_entry(
+            name="Bicycle", value=-999.99, date="01-01")
+
+    def test_version(self):
+        version = self.period.version
+        self.period.update_entry(eid=self.eid, value=-99)
+        self.assertEqual(self.period.version, version + 1)
+        self.period.remove_entry(eid=self.eid)
+        self.assertEqual(self.period.version, version + 2)
+
+    def test_snapshot_isolation(self):
+        entries = self.period.get_entries()
+
+        self.period.update_entry(eid=self.eid, name="Trekking bike")
+        self.period.add_entry(name="Bell", value=-9.99, date="01-02")
+
+        # Previously returned entries are not affected by modifications
+        self.assertEqual(len(entries[DEFAULT_TABLE]), 1)
+        self.assertEqual(entries[DEFAULT_TABLE][self.eid]["name"], "bicycle")
+
+        entries = self.period.get_entries()
+        self.assertEqual(len(entries[DEFAULT_TABLE]), 2)
+        self.assertEqual(entries[DEFAULT_TABLE][self.eid]["name"],
+                         "trekking bike")
+
+    def test_add_entries(self):
+        version = self.period.version
+        eids = self.period.add_entries([
+            {
+                "name": "Bell",
+                "value": -9.99,
+                "date": "01-02",
+                "category": "tinkering"
+            },
+            {
+                "name": "Lights",
+                "value": -19.99
+            },
+        ])
+        self.assertEqual(eids, [self.eid + 1, self.eid + 2])
+        self.assertEqual(self.period.version, version + 1)
+        self.assertEqual(self.period.get_entry(eid=eids[1])["name"], "lights")
+        self.assertEqual(self.period._category_cache["bell"], {"tinkering": 1})
+
+    def test_add_entries_invalid(self):
+        version = self.period.version
+        with self.assertRaises(PeriodException) as context:
+            self.period.add_entries([
+                {
+                    "name": "Bell",
+                    "value": -9.99,
+                    "category": "tinkering"
+                },
+                {
+                    "name": "Lights",
+                    "value": "a lot"
+                },
+            ])
+        self.assertTrue(str(context.exception).startswith("Entry 1: "))
+        # No entry is added
+        self.assertEqual(self.period.version, version)
+        self.assertEqual(len(self.period.get_entries()[DEFAULT_TABLE]), 1)
+        self.assertFalse(+self.period._category_cache["bell"])
+
+    def test_iter_entries(self):
+        self.period.add_entry(
+            table_name="recurrent",
+            name="Rent",
+            value=-500,
+            frequency="monthly",
+            start="01-01",
+            end="02-01")
+        entries = self.period.iter_entries()
+
+        # The iteration is not affected by modifications
+        self.period.remove_entry(eid=self.eid)
+        self.assertEqual([(t, e["name"]) for t, _, e in entries],
+                         [(DEFAULT_TABLE, "bicycle"),
+                          ("recurrent", "rent, january"),
+                          ("recurrent", "rent, february")])
+
+        entries = list(
+            self.period.iter_entries(
+                filters={"name": "rent"}, expand_recurrent=False))
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0][2]["frequency"], "monthly")
+
+    def test_get_entry_returns_copy(self):
+        element = self.period.get_entry(eid=self.eid)
+        element["category"] = "tinkering"
+        self.assertIsNone(self.period.get_entry(eid=self.eid)["category"])
+        self.assertEqual(element.eid, self.eid)
+
+    def test_get_entry_unknown_table(self):
+        self.assertRaises(
+            PeriodException, self.period.get_entry, eid=1, table_name="foo")
+
+
+@mock.patch("financeager.period.PARALLEL_VALIDATION_CHUNK_SIZE", 2)
+@mock.patch("financeager.period.PARALLEL_VALIDATION_MIN_ENTRIES", 3)
+class TinyDbPeriodParallelValidationTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(
+            max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        self.period = TinyDbPeriod(name=1901)
+        self.entries = [{
+            "name": "Entry {}".format(i),
+            "value": i,
+            "date": "01-{:02d}".format(i + 1)
+        } for i in range(7)]
+
+    def test_add_entries(self):
+        self.period.add_entry(name="Entry 1", value=-1, category="numbers")
+        eids = self.period.add_entries(self.entries, executor=self.executor)
+        self.assertEqual(eids, list(range(2, 9)))
+
+        entries = self.period.get_entries()[DEFAULT_TABLE]
+        self.assertEqual([entries[eid]["name"] for eid in eids],
+                         ["entry {}".format(i) for i in range(7)])
+        # Categories are derived in order, as for sequential validation
+        self.assertEqual(entries[eids[1]]["category"], "numbers")
+
+    def test_deterministic_errors(self):
+        self.entries[5]["value"] = "five"
+        self.entries[3]["date"] = "13-01"
+
+        messages = []
+        for executor in [None, self.executor]:
+            with self.assertRaises(PeriodException) as context:
+                self.period.add_entries(self.entries, executor=executor)
+            messages.append(str(context.exception))
+
+        self.assertTrue(messages[0].startswith("Entry 3: "))
+        self.assertEqual(messages[0], messages[1])
+        self.assertEqual(len(self.period.get_entries()[DEFAULT_TABLE]), 0)
+
+
+class TinyDbPeriodSerializationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.period = TinyDbPeriod(name=1901)
+        self.eid = self.period.add_entry(
+            name="Bicycle", value=-999.99, date="01-01")
+        self.period.add_entry(name="Bell", value=-9.99, date="01-02")
+        self.period.add_entry(
+            table_name="recurrent",
+            name="Rent",
+            value=-500,
+            frequency="monthly",
+            start="01-01",
+            end="03-31")
+
+    def _assert_serialized(self, filters=None):
+        elements = self.period.get_entries(filters=filters)
+        self.assertEqual(
+            json.loads(self.period.serialize_entries(elements).decode()),
+            json.loads(json.dumps(elements)))
+
+    def test_serialize_entries(self):
+        self._assert_serialized()
+        self._assert_serialized(filters={"name": "bell"})
+        self._assert_serialized(filters={"name": "nothing"})
+
+    def test_fragments_cached(self):
+        elements = self.period.get_entries()
+        self.period.serialize_entries(elements)
+
+        with mock.patch(
+                "financeager.period.json.dumps", wraps=json.dumps) as dumps:
+            self.period.serialize_entries(elements)
+        # Only the recurrent occurrences are encoded
+        self.assertEqual(dumps.call_count, 1)
+
+    def test_fragment_invalidated_on_modification(self):
+        self.period.serialize_entries(self.period.get_entries())
+
+        self.period.update_entry(eid=self.eid, name="Trekking bike")
+        self._assert_serialized()
+
+        self.period.remove_entry(eid=self.eid)
+        self._assert_serialized()
+        self.assertNotIn(self.eid, self.period._fragments)
+
+    def test_previous_snapshot(self):
+        elements = self.period.get_entries()
+        self.period.update_entry(eid=self.eid, value=-99)
+
+        body = json.loads(self.period.serialize_entries(elements).decode())
+        self.assertEqual(body[DEFAULT_TABLE][str(self.eid)]["value"], -999.99)
+        self._assert_serialized()
+
+
+class TinyDbPeriodTransactionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.period = TinyDbPeriod(name=1901)
+        self.eid = self.period.add_entry(
+            name="Bicycle", value=-999.99, category="sports", date="01-01")
+
+    def test_commit(self):
+        with self.period.transaction():
+            self.period.add_entry(name="Bell", value=-9.99)
+            self.period.remove_entry(eid=self.eid)
+
+        entries = self.period.get_entries()[DEFAULT_TABLE]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[2]["name"], "bell")
+
+    def assert_rolled_back(self, version):
+        entries = self.period.get_entries()[DEFAULT_TABLE]
+        self.assertEqual(list(entries), [self.eid])
+        self.assertEqual(entries[self.eid]["name"], "bicycle")
+        self.assertGreater(self.period.version, version)
+        self.assertEqual(self.period._category_cache["bicycle"],
+                         Counter({"sports": 1}))
+        self.assertFalse(+self.period._category_cache["bell"])
+
+        # The element ID counter has been reset as well
+        self.assertEqual(self.period.add_entry(name="Bell", value=-9.99), 2)
+
+    def test_abort(self):
+        version = self.period.version
+        with self.period.transaction() as transaction:
+            self.period.add_entry(name="Bell", value=-9.99, category="sports")
+            self.period.update_entry(eid=self.eid, name="Trekking bike")
+            transaction.abort()
+
+        self.assert_rolled_back(version)
+
+    def test_exception(self):
+        version = self.period.version
+        with self.assertRaises(PeriodException):
+            with self.period.transaction():
+                self.period.add_entry(name="Bell", value=-9.99)
+                self.period.remove_entry(eid=self.eid)
+                self.period.remove_entry(eid=self.eid)
+
+        self.assert_rolled_back(version)
+
+    def test_json_storage(self):
+        data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.period = TinyDbPeriod(name=1901, data_dir=data_dir)
+        self.eid = self.period.add_entry(
+            name="Bicycle", value=-999.99, category="sports", date="01-01")
+        version = self.period.version
+
+        with self.period.transaction() as transaction:
+            self.period.add_entry(name="Bell", value=-9.99)
+            transaction.abort()
+
+        self.assert_rolled_back(version)
+        self.period.close()
+
+        with open(os.path.join(data_dir, "1901.json")) as file:
+            self.assertEqual(len(json.load(file)[DEFAULT_TABLE]), 2)
+
+
 class ValidationModelTestCase(unittest.TestCase):
     def test_valid_base_entry(self):
         entry = BaseValidationModel({"name": "entry", "value": "5"})
@@ -516,5 +804,70 @@ class JsonTinyDbPeriodTestCase(unittest.TestCase):
         cls.period.close()
 
 
+def _add_entries(data_dir, name, nr_entries):
+    period = TinyDbPeriod(name=1999, data_dir=data_dir)
+    for i in range(nr_entries):
+        period.add_entry(name=name, value=i, category="process")
+    period.close()
+
+
+class SharedDataDirTinyDbPeriodTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.period = TinyDbPeriod(name=1999, data_dir=self.data_dir)
+        # Mimic a period of another process using the same data directory
+        self.other_period = TinyDbPeriod(name=1999, data_dir=self.data_dir)
+
+    def test_add_entries(self):
+        eid = self.period.add_entry(name="pineapple", value=-5)
+        other_eid = self.other_period.add_entry(name="banana", value=-2)
+        self.assertEqual(other_eid, eid + 1)
+
+        for period in (self.period, self.other_period):
+            entries = period.get_entries()[DEFAULT_TABLE]
+            self.assertSetEqual({eid, other_eid}, set(entries))
+
+    def test_update_entry(self):
+        eid = self.period.add_entry(name="pineapple", value=-5, category="a")
+        version = self.other_period.version
+
+        self.other_period.update_entry(eid=eid, category="fruit")
+        self.assertEqual(self.other_period.version, version + 2)
+
+        element = self.period.get_entry(eid=eid)
+        self.assertEqual(element["category"], "fruit")
+        self.assertEqual(self.period._category_cache["pineapple"],
+                         Counter(["fruit"]))
+
+    def test_no_reload_if_unmodified(self):
+        self.period.add_entry(name="pineapple", value=-5)
+        snapshot = self.period._snapshot
+        self.period.get_entries()
+        self.assertIs(self.period._snapshot, snapshot)
+
+    def test_concurrent_processes(self):
+        nr_processes = 4
+        nr_entries = 10
+        processes = [
+            multiprocessing.Process(
+                target=_add_entries,
+                args=(self.data_dir, "process {}".format(i), nr_entries))
+            for i in range(nr_processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        entries = self.period.get_entries()[DEFAULT_TABLE]
+        self.assertEqual(len(entries), nr_processes * nr_entries)
+        self.assertSetEqual(
+            set(entries), set(range(1, nr_processes * nr_entries + 1)))
+
+    def tearDown(self):
+        self.period.close()
+        self.other_period.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,425 @@
+import gzip
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from financeager.fflask import create_app
+from financeager.routing import PeriodRouter
+from financeager.serving import ThreadingWSGIServer
+
+
+class PeriodRouterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        self.threads = []
+
+        worker_addresses = []
+        for _ in range(2):
+            # Compress all responses if accepted by the client
+            server = self.start_server(
+                create_app(
+                    data_dir=tempfile.mkdtemp(prefix="financeager-"),
+                    config={"COMPRESSION_MIN_SIZE": 0}))
+            worker_addresses.append(server.server_address)
+
+        self.router = PeriodRouter(worker_addresses)
+        self.start_server(self.router)
+        self.connection = http.client.HTTPConnection(
+            *self.servers[-1].server_address)
+
+        # Two periods served by different workers
+        self.periods = ["1900", "1904"]
+        self.assertNotEqual(
+            self.router.worker_index("1900"), self.router.worker_index("1904"))
+
+    def start_server(self, app):
+        server = ThreadingWSGIServer(("127.0.0.1", 0))
+        server.set_app(app)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.servers.append(server)
+        self.threads.append(thread)
+        return server
+
+    def request(self, method, url, data=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers["Content-Type"] = "application/json"
+        self.connection.request(method, url, body=body, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read().decode())
+
+    def test_worker_index_stable(self):
+        router = PeriodRouter(3 * [("127.0.0.1", 0)])
+        self.assertEqual(router.worker_index("2000"), 0)
+        self.assertEqual(router.worker_index(2000), 0)
+
+    def test_affinity(self):
+        for period in self.periods:
+            for _ in range(2):
+                status, content = self.request("POST", "/periods/" + period, {
+                    "name": "beer",
+                    "value": -1
+                })
+                self.assertEqual(status, 200)
+            # Entries of one period were added by the same worker
+            self.assertEqual(content["id"], 2)
+
+        status, content = self.request("GET", "/periods/1904/standard/2")
+        self.assertEqual(status, 200)
+        self.assertEqual(content["element"]["name"], "beer")
+
+    def test_list_periods(self):
+        for period in reversed(self.periods):
+            self.request("POST", "/periods/" + period, {
+                "name": "a",
+                "value": 1
+            })
+
+        status, content = self.request("POST", "/periods")
+        self.assertEqual(status, 200)
+        self.assertListEqual(content["periods"], self.periods)
+
+    def test_copy_across_workers(self):
+        self.request("POST", "/periods/1900", {
+            "name": "rent",
+            "value": -500,
+            "category": "housing",
+        })
+
+        status, content = self.request("POST", "/periods/copy", {
+            "source_period": "1900",
+            "destination_period": "1904",
+            "eid": 1,
+        })
+        self.assertEqual(status, 200)
+        self.assertEqual(content["id"], 1)
+
+        status, content = self.request("GET", "/periods/1904/standard/1")
+        self.assertEqual(content["element"]["name"], "rent")
+        self.assertEqual(content["element"]["value"], -500)
+        self.assertEqual(content["element"]["category"], "housing")
+
+    def test_period_names_requiring_quoting(self):
+        # Served by different workers
+        self.assertNotEqual(
+            self.router.worker_index("my period"),
+            self.router.worker_index("bücher"))
+
+        status, content = self.request("POST", "/periods/my%20period", {
+            "name": "rent",
+            "value": -500
+        })
+        self.assertEqual(status, 200)
+
+        status, content = self.request("POST", "/periods/copy", {
+            "source_period": "my period",
+            "destination_period": "bücher",
+            "eid": 1,
+        })
+        self.assertEqual(status, 200)
+
+        # Adding via batch uses the same worker as requests to the period URL
+        status, content = self.request(
+            "POST", "/periods/batch", {
+                "commands": [{
+                    "command": "add",
+                    "name": "book",
+                    "value": -10,
+                    "period": "bücher"
+                }]
+            })
+        self.assertEqual(content["results"], [{"id": 2}])
+
+        status, content = self.request("GET", "/periods/b%C3%BCcher")
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            sorted(e["name"] for e in content["elements"]["standard"].values()),
+            ["book", "rent"])
+
+        status, content = self.request("POST", "/periods")
+        self.assertListEqual(content["periods"], ["bücher", "my period"])
+
+    def test_copy_nonexisting_entry(self):
+        status, content = self.request("POST", "/periods/copy", {
+            "source_period": "1900",
+            "destination_period": "1904",
+            "eid": 1,
+        })
+        self.assertEqual(status, 404)
+        self.assertEqual(content["error"], "Element not found.")
+
+    def test_batch(self):
+        self.request("POST", "/periods/1900", {"name": "rent", "value": -500})
+
+        status, content = self.request(
+            "POST", "/periods/batch", {
+                "commands": [
+                    {
+                        "command": "add",
+                        "name": "bus",
+                        "value": -2,
+                        "period": "1904"
+                    },
+                    {
+                        "command": "copy",
+                        "eid": 1,
+                        "source_period": "1900",
+                        "destination_period": "1904"
+                    },
+                    {
+                        "command": "get",
+                        "eid": 1,
+                        "period": "1900"
+                    },
+                    {
+                        "command": "list"
+                    },
+                    {
+                        "command": "add",
+                        "name": "bus",
+                        "value": -2,
+                        "period": "1904"
+                    },
+                ]
+            })
+        self.assertEqual(status, 200)
+        results = content["results"]
+        self.assertEqual(results[0], {"id": 1})
+        self.assertIn("not supported", results[1]["error"])
+        self.assertEqual(results[2]["element"]["name"], "rent")
+        self.assertEqual(results[3], {"periods": self.periods})
+        self.assertEqual(results[4], {"id": 2})
+
+    def test_accept_encoding(self):
+        headers = {"Accept-Encoding": "gzip"}
+        for period in self.periods:
+            self.request("POST", "/periods/" + period, {
+                "name": "a",
+                "value": 1
+            })
+
+        # Responses processed by the router are not compressed
+        status, content = self.request("POST", "/periods", headers=headers)
+        self.assertListEqual(content["periods"], self.periods)
+        status, content = self.request(
+            "POST",
+            "/periods/batch",
+            {"commands": [{
+                "command": "get",
+                "eid": 1,
+                "period": "1904"
+            }]},
+            headers=headers)
+        self.assertEqual(content["results"][0]["element"]["name"], "a")
+
+        # Responses of the workers are forwarded compressed
+        self.connection.request("GET", "/periods/1900", headers=headers)
+        response = self.connection.getresponse()
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        content = json.loads(gzip.decompress(response.read()).decode())
+        self.assertEqual(len(content["elements"]["standard"]), 1)
+
+    def test_unknown_path(self):
+        status, content = self.request("GET", "/unknown")
+        self.assertEqual(status, 404)
+
+    def test_worker_not_available(self):
+        self.servers[0].shutdown()
+        self.servers[0].server_close()
+        self.threads[0].join()
+
+        # Period served by the first worker
+        status, content = self.request("GET", "/periods/1900")
+        self.assertEqual(status, 502)
+
+    def test_batch_worker_failure(self):
+        commands = [
+            {
+                "command": "add",
+                "name": "bus",
+                "value": -2,
+                "period": "1904"
+            },
+            {
+                "command": "add",
+                "name": "rent",
+                "value": -500,
+                "period": "1900"
+            },
+            {
+                "command": "list"
+            },
+        ]
+
+        # Worker serving period 1900 is not available
+        self.servers[0].shutdown()
+        self.servers[0].server_close()
+        self.threads[0].join()
+        status, content = self.request("POST", "/periods/batch",
+                                       {"commands": commands})
+        self.assertEqual(status, 200)
+        results = content["results"]
+        self.assertEqual(results[0], {"id": 1})
+        self.assertIn("Worker not available", results[1]["error"])
+        self.assertIn("Worker not available", results[2]["error"])
+
+        # The results of the available worker have been committed
+        status, content = self.request("GET", "/periods/1904")
+        self.assertEqual(len(content["elements"]["standard"]), 1)
+
+        # Worker serving period 1904 responds with an error
+        def failing_app(environ, start_response):
+            start_response("500 Internal Server Error",
+                           [("Content-Type", "application/json")])
+            return [b'{"error": "unexpected error"}']
+
+        self.servers[1].set_app(failing_app)
+        status, content = self.request("POST", "/periods/batch",
+                                       {"commands": commands[:1]})
+        self.assertEqual(status, 200)
+        self.assertEqual(content["results"], [{"error": "unexpected error"}])
+
+    def test_modifying_request_not_repeated(self):
+        address, requests = start_disconnecting_worker(respond=False)
+        router = PeriodRouter([address], timeout=5)
+
+        def forward(method):
+            return router._forward(0, method, "/periods/1900", b"{}",
+                                   {"Content-Type": "application/json"})
+
+        self.assertRaises(http.client.RemoteDisconnected, forward, "POST")
+        self.assertEqual(len(requests), 1)
+
+        # Idempotent requests are retried
+        self.assertRaises(http.client.RemoteDisconnected, forward, "GET")
+        self.assertEqual(len(requests), 3)
+
+    def test_idle_connection_closed_by_worker(self):
+        address, requests = start_disconnecting_worker(respond=True)
+        router = PeriodRouter([address], timeout=5)
+
+        for _ in range(2):
+            status, _, body = router._forward(
+                0, "DELETE", "/periods/1900/standard/1", None, {})
+            self.assertEqual(status, 200)
+            # Wait for the worker to close the connection
+            time.sleep(0.1)
+        self.assertEqual(len(requests), 2)
+
+    def tearDown(self):
+        self.connection.close()
+        for server, thread in zip(self.servers, self.threads):
+            if thread.is_alive():
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+
+def start_disconnecting_worker(respond):
+    """Start a worker that closes each connection after receiving a request.
+    If 'respond' is set, it sends an empty response first, without announcing
+    that the connection is closed.
+
+    :return: tuple of the worker address and the list of received requests
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+    requests = []
+
+    def run():
+        with sock:
+            while True:
+                connection, _ = sock.accept()
+                with connection:
+                    requests.append(connection.recv(65536))
+                    if respond:
+                        connection.sendall(
+                            b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+
+    threading.Thread(target=run, daemon=True).start()
+    return sock.getsockname(), requests
+
+
+class ServeAffinityTestCase(unittest.TestCase):
+    def setUp(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+
+        self.data_dir = tempfile.mkdtemp(prefix="financeager-")
+        env = dict(os.environ, HOME=self.data_dir)
+        command = [
+            sys.executable, "-m", "financeager.cli", "serve", "--port",
+            str(self.port), "--workers", "2", "--affinity", "--data-dir",
+            self.data_dir
+        ]
+        self.process = subprocess.Popen(
+            command, env=env, stderr=subprocess.DEVNULL)
+
+    def request(self, method, url, data=None):
+        for _ in range(50):
+            connection = http.client.HTTPConnection("127.0.0.1", self.port)
+            try:
+                connection.request(
+                    method,
+                    url,
+                    body=json.dumps(data),
+                    headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                if response.status != 502:
+                    return json.loads(response.read().decode())
+            except ConnectionRefusedError:
+                pass
+            finally:
+                connection.close()
+            # Router or workers not started yet
+            time.sleep(0.1)
+        self.fail("Server did not start")
+
+    def test_serve(self):
+        for period in ["1900", "1904"]:
+            for i in range(2):
+                content = self.request("POST", "/periods/" + period, {
+                    "name": "beer",
+                    "value": -i
+                })
+                self.assertEqual(content["id"], i + 1)
+
+        content = self.request("POST", "/periods")
+        self.assertListEqual(content["periods"], ["1900", "1904"])
+
+        # Period names requiring quoting are forwarded
+        for url in ["/periods/my%20period", "/periods/b%C3%BCcher"]:
+            content = self.request("POST", url, {"name": "book", "value": -10})
+            self.assertEqual(content["id"], 1)
+            content = self.request("GET", url + "/standard/1")
+            self.assertEqual(content["element"]["name"], "book")
+
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=10), 0)
+
+        for period in ["1900", "1904"]:
+            with open(os.path.join(self.data_dir, period + ".json")) as file:
+                self.assertEqual(len(json.load(file)["standard"]), 2)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+if __name__ == "__main__":
+    unittest.main()
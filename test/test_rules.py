@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+
+from financeager.exceptions import PreprocessingError
+from financeager.rules import AhoCorasick, Categorizer, Rule
+
+
+class AhoCorasickTestCase(unittest.TestCase):
+    def test_first_match(self):
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(automaton.first_match("ushers"), 0)
+        self.assertEqual(automaton.first_match("this"), 2)
+        self.assertEqual(automaton.first_match("shh"), None)
+        self.assertEqual(automaton.first_match(""), None)
+
+    def test_match_via_failure_link(self):
+        # 'bc' is only found after following the failure link of 'ab'
+        automaton = AhoCorasick(["abd", "bc"])
+        self.assertEqual(automaton.first_match("abc"), 1)
+        self.assertEqual(automaton.first_match("xabdx"), 0)
+
+    def test_first_pattern_precedes(self):
+        automaton = AhoCorasick(["rewe", "we"])
+        # 'we' ends before 'rewe' but comes later in the list
+        self.assertEqual(automaton.first_match("rewe city"), 0)
+        self.assertEqual(automaton.first_match("wewe"), 1)
+
+    def test_compare_with_naive_search(self):
+        patterns = ["caa", "bca", "bab", "ab", "bc", "a", "c"]
+        automaton = AhoCorasick(patterns)
+        for text in ["abccab", "bbbb", "xyz", "cbabc", "aacaa", "bcbc"]:
+            expected = next((i for i, p in enumerate(patterns) if p in text),
+                            None)
+            self.assertEqual(automaton.first_match(text), expected)
+
+    def test_no_patterns(self):
+        self.assertIsNone(AhoCorasick([]).first_match("text"))
+
+
+class CategorizerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.categorizer = Categorizer([
+            Rule(pattern="lidl", name="lidl", category="groceries"),
+            Rule(pattern="DM Fil", name="dm", category="groceries"),
+            Rule(pattern="miete", name="rent", category="rent"),
+        ])
+
+    def test_match(self):
+        self.assertEqual(
+            self.categorizer.match("LIDL DIENSTL SAGT DANKE").category,
+            "groceries")
+        self.assertEqual(self.categorizer.match("dm fil.2345").name, "dm")
+        self.assertIsNone(self.categorizer.match("cinema"))
+
+    def test_from_file(self):
+        filepath = tempfile.mkstemp()[1]
+        with open(filepath, "w") as file:
+            file.write("[groceries]\nlidl\ndm fil = dm\n[rent]\nMiete=rent\n")
+
+        categorizer = Categorizer.from_file(filepath)
+        self.assertEqual(categorizer.rules, [
+            Rule(pattern="lidl", name="lidl", category="groceries"),
+            Rule(pattern="dm fil", name="dm", category="groceries"),
+            Rule(pattern="miete", name="rent", category="rent"),
+        ])
+
+    def test_from_invalid_file(self):
+        filepath = tempfile.mkstemp()[1]
+        with open(filepath, "w") as file:
+            file.write("lidl\n")
+        self.assertRaises(PreprocessingError, Categorizer.from_file, filepath)
+
+        self.assertRaises(PreprocessingError, Categorizer.from_file,
+                          "/nonexisting/rules")
+
+
+if __name__ == "__main__":
+    unittest.main()
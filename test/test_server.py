@@ -1,9 +1,17 @@
+from concurrent.futures.process import BrokenProcessPool
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 from financeager import default_period_name, DEFAULT_TABLE
+from financeager.columnar import decode
 from financeager.entries import CategoryEntry
 from financeager.server import Server
-from financeager.period import PeriodException
+from financeager.period import PeriodException, TinyDbPeriod
 
 
 class AddEntryToServerTestCase(unittest.TestCase):
@@ -157,5 +165,612 @@ class FindEntryServerTestCase(unittest.TestCase):
             eid=42)
 
 
+class ConcurrentServerTestCase(unittest.TestCase):
+    NR_THREADS = 8
+    NR_ITERATIONS = 20
+
+    def run_threads(self, target):
+        """Run 'target' in several threads that are released simultaneously.
+        Any exceptions are collected and returned."""
+        barrier = threading.Barrier(self.NR_THREADS)
+        errors = []
+
+        def run(index):
+            barrier.wait()
+            try:
+                target(index)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=run, args=(i,))
+            for i in range(self.NR_THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return errors
+
+    def test_period_creation(self):
+        server = Server()
+        periods = []
+
+        errors = self.run_threads(lambda _: periods.append(
+            server._get_period("2000")))
+
+        self.assertListEqual(errors, [])
+        self.assertEqual(len(set(id(p) for p in periods)), 1)
+        self.assertListEqual(server.run("list")["periods"], ["2000"])
+
+    def assert_consistent_mixed_traffic(self, server):
+        def mixed_traffic(index):
+            for i in range(self.NR_ITERATIONS):
+                eid = server.run(
+                    "add",
+                    name="item {}".format(index),
+                    value=-i,
+                    category="category {}".format(i % 2),
+                    period="2000")["id"]
+                response = server.run("update", eid=eid, period="2000", value=i)
+                self.assertEqual(response["id"], eid)
+                element = server.run("get", eid=eid, period="2000")["element"]
+                self.assertEqual(element["value"], i)
+                response = server.run("print", period="2000")
+                self.assertIn(eid, response["elements"][DEFAULT_TABLE])
+
+        errors = self.run_threads(mixed_traffic)
+        self.assertListEqual(errors, [])
+
+        elements = server.run("print", period="2000")["elements"]
+        self.assertEqual(
+            len(elements[DEFAULT_TABLE]), self.NR_THREADS * self.NR_ITERATIONS)
+
+        category_cache = server._get_period("2000")._category_cache
+        self.assertEqual(
+            sum(sum(c.values()) for c in category_cache.values()),
+            self.NR_THREADS * self.NR_ITERATIONS)
+        for index in range(self.NR_THREADS):
+            self.assertEqual(
+                category_cache["item {}".format(index)]["category 0"],
+                self.NR_ITERATIONS // 2)
+
+    def test_mixed_traffic_memory(self):
+        self.assert_consistent_mixed_traffic(Server())
+
+    def test_mixed_traffic_json(self):
+        with tempfile.TemporaryDirectory(prefix="financeager-") as data_dir:
+            server = Server(data_dir=data_dir)
+            self.assert_consistent_mixed_traffic(server)
+            server.run("stop")
+
+
+class PeriodValidatorsServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.server.run("add", name="rent", value=-500, period="2000")
+
+    def test_validators(self):
+        etag, last_modified = self.server.period_validators("2000")
+        self.assertEqual(
+            self.server.period_validators("2000"), (etag, last_modified))
+        self.assertNotEqual(self.server.period_validators("2001")[0], etag)
+        self.assertNotEqual(Server().period_validators("2000")[0], etag)
+
+        self.server.run("print", period="2000")
+        self.assertEqual(self.server.period_validators("2000")[0], etag)
+
+        self.server.run("add", name="bus", value=-2, period="2000")
+        new_etag, new_last_modified = self.server.period_validators("2000")
+        self.assertNotEqual(new_etag, etag)
+        self.assertGreaterEqual(new_last_modified, last_modified)
+
+    def test_validators_shared_data_dir(self):
+        # E.g. pre-forked workers
+        data_dir = tempfile.mkdtemp(prefix="financeager-")
+        self.addCleanup(shutil.rmtree, data_dir)
+        server = Server(data_dir=data_dir)
+        other_server = Server(data_dir=data_dir)
+        server.run("add", name="rent", value=-500, period="2000")
+
+        etag = server.period_validators("2000")[0]
+        self.assertEqual(other_server.period_validators("2000")[0], etag)
+
+        other_server.run("add", name="bus", value=-2, period="2000")
+        new_etag = other_server.period_validators("2000")[0]
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(server.period_validators("2000")[0], new_etag)
+
+        server.run("stop")
+        other_server.run("stop")
+
+
+class ExportServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.server.run(
+            "add", name="rent", value=-500, date="01-01", period="2000")
+        self.server.run(
+            "add", name="bus", value=-2, date="01-02", period="2000")
+
+    def test_export(self):
+        lines = self.server.export(period="2000", filters={"name": "bu"})
+        # Modifications after the call do not affect the exported entries
+        self.server.run("rm", eid=2, period="2000")
+        self.assertEqual(
+            list(lines), [
+                "table_name,eid,name,value,category,date\n",
+                "standard,2,bus,-2.0,,01-02\n",
+            ])
+
+        lines = self.server.export(period="2000", format="jsonl")
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["rent"])
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, self.server.export, format="xml")
+        with self.assertRaises(ValueError) as context:
+            self.server.export(filters={"name": "("})
+        self.assertIn("Invalid filter pattern '('", str(context.exception))
+
+
+class ResultCacheServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(result_cache_size=4)
+        self.server.run("add", name="rent", value=-500, period="2000")
+        self.server.run("add", name="bus", value=-2, period="2001")
+
+    def test_hit(self):
+        response = self.server.run(
+            "print", filters={
+                "name": "rent",
+                "category": None
+            }, period="2000")
+        self.assertEqual(len(response["elements"][DEFAULT_TABLE]), 1)
+
+        # Identical filters in different order
+        self.assertIs(
+            self.server.run(
+                "print",
+                filters={
+                    "category": None,
+                    "name": "rent"
+                },
+                period="2000")["elements"], response["elements"])
+        info = self.server.cache_info()
+        self.assertEqual(info["hits"], 1)
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["size"], 1)
+
+    def test_invalidation(self):
+        elements_2000 = self.server.run("print", period="2000")["elements"]
+        elements_2001 = self.server.run("print", period="2001")["elements"]
+
+        for command, kwargs in [
+            ("add", dict(name="beer", value=-1, period="2000")),
+            ("update", dict(eid=2, value=-2, period="2000")),
+            ("rm", dict(eid=2, period="2000")),
+            ("copy", dict(
+                eid=1, source_period="2001", destination_period="2000")),
+        ]:
+            self.server.run(command, **kwargs)
+            elements = self.server.run("print", period="2000")["elements"]
+            self.assertIsNot(elements, elements_2000)
+            elements_2000 = elements
+
+            # Other periods are not affected
+            self.assertIs(
+                self.server.run("print", period="2001")["elements"],
+                elements_2001)
+
+        self.assertEqual(len(elements_2000[DEFAULT_TABLE]), 2)
+        self.assertEqual(self.server.cache_info()["misses"], 6)
+
+    def test_invalidation_by_batch(self):
+        elements = self.server.run("print", period="2000")["elements"]
+        self.server.run(
+            "batch", commands=[{
+                "command": "rm",
+                "eid": 1,
+                "period": "2000"
+            }])
+        self.assertEqual(
+            self.server.run("print", period="2000")["elements"][DEFAULT_TABLE],
+            {})
+        self.assertEqual(len(elements[DEFAULT_TABLE]), 1)
+
+    def test_columnar(self):
+        elements = self.server.run("print", period="2000")["elements"]
+        payload = self.server.run(
+            "print", columnar=True, period="2000")["elements"]
+        self.assertEqual(payload["format"], "columnar")
+        self.assertIs(
+            self.server.run("print", columnar=True, period="2000")["elements"],
+            payload)
+        self.assertIs(
+            self.server.run("print", period="2000")["elements"], elements)
+
+    def test_columnar_non_numeric_period_name(self):
+        self.server.run("add", name="rent", value=-500, period="abc")
+        elements = json.loads(
+            json.dumps(self.server.run("print", period="abc")["elements"]))
+
+        for expand_recurrent in [True, False]:
+            payload = self.server.run(
+                "print",
+                columnar=True,
+                expand_recurrent=expand_recurrent,
+                period="abc")["elements"]
+            self.assertIsNone(payload["year"])
+            self.assertEqual(decode(payload), elements)
+
+    def test_run_serialized(self):
+        body, error = self.server.run_serialized(
+            "print", filters={"name": "rent"}, period="2000")
+        self.assertFalse(error)
+        self.assertEqual(
+            json.loads(body.decode()),
+            json.loads(
+                json.dumps(
+                    self.server.run(
+                        "print", filters={"name": "rent"}, period="2000"))))
+
+        # The encoded response is cached
+        self.assertIs(
+            self.server.run_serialized(
+                "print", filters={"name": "rent"}, period="2000")[0], body)
+
+        self.server.run("add", name="bike", value=-99, period="2000")
+        body = self.server.run_serialized("print", period="2000")[0]
+        self.assertEqual(
+            len(json.loads(body.decode())["elements"][DEFAULT_TABLE]), 2)
+
+    def test_run_serialized_other_commands(self):
+        body, error = self.server.run_serialized(
+            "print", columnar=True, period="2000")
+        self.assertFalse(error)
+        self.assertEqual(
+            json.loads(body.decode())["elements"]["format"], "columnar")
+
+        body, error = self.server.run_serialized("get", eid=42, period="2000")
+        self.assertTrue(error)
+        self.assertIn("error", json.loads(body.decode()))
+
+    def test_disabled(self):
+        server = Server(result_cache_size=0)
+        server.run("print", period="2000")
+        server.run("print", period="2000")
+        self.assertEqual(server.cache_info()["size"], 0)
+        self.assertEqual(server.cache_info()["misses"], 2)
+
+
+class SingleFlightServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.server.run("add", name="rent", value=-500, period="2000")
+
+    def run_concurrently(self, command, n=8, **kwargs):
+        responses = [None] * n
+
+        def run(i):
+            responses[i] = self.server.run(command, period="2000", **kwargs)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_print(self):
+        get_entries = TinyDbPeriod.get_entries
+        calls = []
+
+        def slow_get_entries(period, *args, **kwargs):
+            calls.append(None)
+            time.sleep(0.2)
+            return get_entries(period, *args, **kwargs)
+
+        with mock.patch.object(TinyDbPeriod, "get_entries", slow_get_entries):
+            responses = self.run_concurrently("print")
+
+        # Requests arriving after the computation are answered from the cache
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(
+            all(r["elements"] is responses[0]["elements"] for r in responses))
+
+    def test_get(self):
+        get_entry = TinyDbPeriod.get_entry
+
+        def slow_get_entry(period, *args, **kwargs):
+            time.sleep(0.2)
+            return get_entry(period, *args, **kwargs)
+
+        with mock.patch.object(TinyDbPeriod, "get_entry", slow_get_entry):
+            responses = self.run_concurrently("get", eid=1)
+            errors = self.run_concurrently("get", eid=2)
+
+        self.assertTrue(all(r["element"]["name"] == "rent" for r in responses))
+        # Every caller receives a copy
+        self.assertIsNot(responses[0]["element"], responses[1]["element"])
+        self.assertEqual(errors, 8 * [{"error": "Element not found."}])
+        self.assertGreater(self.server.cache_info()["single_flight"]["shared"],
+                           0)
+
+
+class BatchServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+
+    def test_batch(self):
+        response = self.server.run(
+            "batch",
+            commands=[
+                {
+                    "command": "add",
+                    "name": "rent",
+                    "value": -500,
+                    "period": "2000"
+                },
+                {
+                    "command": "copy",
+                    "eid": 1,
+                    "source_period": "2000",
+                    "destination_period": "2001"
+                },
+                {
+                    "command": "update",
+                    "eid": 1,
+                    "value": -600,
+                    "period": "2001"
+                },
+                {
+                    "command": "get",
+                    "eid": 1,
+                    "period": "2001"
+                },
+                {
+                    "command": "list"
+                },
+            ])
+        results = response["results"]
+        self.assertEqual(results[:3], [{"id": 1}, {"id": 1}, {"id": 1}])
+        self.assertEqual(results[3]["element"]["value"], -600)
+        self.assertEqual(results[4], {"periods": ["2000", "2001"]})
+
+    def test_add_many(self):
+        response = self.server.run(
+            "batch",
+            commands=[
+                {
+                    "command":
+                    "add_many",
+                    "entries": [{
+                        "name": "rent",
+                        "value": -500
+                    }, {
+                        "name": "salary",
+                        "value": 1000
+                    }],
+                    "period":
+                    "2000"
+                },
+                {
+                    "command": "add_many",
+                    "entries": [{
+                        "name": "rent"
+                    }],
+                    "period": "2001"
+                },
+            ])
+        results = response["results"]
+        self.assertEqual(results[0], {"ids": [1, 2]})
+        self.assertTrue(results[1]["error"].startswith("Entry 0: "))
+        self.assertEqual(
+            self.server.run("get", eid=2, period="2000")["element"]["name"],
+            "salary")
+
+    @mock.patch("financeager.period.PARALLEL_VALIDATION_MIN_ENTRIES", 2)
+    def test_add_many_parallel_validation(self):
+        server = Server(validation_workers=2)
+        entries = [{"name": "entry", "value": i} for i in range(3)]
+        response = server.run("add_many", entries=entries, period="2000")
+        self.assertEqual(response, {"ids": [1, 2, 3]})
+
+        entries[1]["value"] = "one"
+        response = server.run("add_many", entries=entries, period="2000")
+        self.assertTrue(response["error"].startswith("Entry 1: "))
+
+        self.assertIsNotNone(server._validation_executor)
+        server.run("stop")
+        self.assertIsNone(server._validation_executor)
+
+    @mock.patch("financeager.period.PARALLEL_VALIDATION_MIN_ENTRIES", 1)
+    def test_broken_validation_pool(self):
+        server = Server(validation_workers=2)
+        server._validation_executor = mock.Mock()
+        server._validation_executor.map.side_effect = BrokenProcessPool()
+
+        response = server.run("add_many", entries=[{"name": "a", "value": 1}])
+        self.assertEqual(response, {"ids": [1]})
+        # Validation is not attempted in parallel anymore
+        self.assertIsNone(server._get_validation_executor())
+
+    def test_no_parallel_validation(self):
+        server = Server(validation_workers=1)
+        server.run("add_many", entries=[{"name": "a", "value": 1}])
+        self.assertIsNone(server._get_validation_executor())
+
+        # Opt-in
+        self.assertIsNone(Server()._get_validation_executor())
+
+    def test_add_many_validation_not_locked(self):
+        self.server.run("add", name="rent", value=-500, period="2000")
+        convert_entries = TinyDbPeriod.convert_entries
+        responses = []
+
+        def convert_entries_concurrently(*args, **kwargs):
+            # Another modification of the period is not blocked
+            thread = threading.Thread(target=lambda: responses.append(
+                self.server.run("rm", eid=1, period="2000")))
+            thread.start()
+            thread.join(timeout=5)
+            return convert_entries(*args, **kwargs)
+
+        with mock.patch.object(TinyDbPeriod, "convert_entries",
+                               convert_entries_concurrently):
+            response = self.server.run(
+                "add_many", entries=[{
+                    "name": "a",
+                    "value": 1
+                }], period="2000")
+            self.assertEqual(response, {"ids": [2]})
+            self.assertEqual(responses, [{"id": 1}])
+
+            commands = [
+                {
+                    "command": "add_many",
+                    "entries": [{
+                        "name": "b",
+                        "value": 2
+                    }],
+                    "period": "2000"
+                },
+                {
+                    "command": "add",
+                    "name": "bus",
+                    "value": -2,
+                    "period": "2000"
+                },
+            ]
+            response = self.server.run("batch", commands=commands)
+            self.assertEqual(response["results"], [{"ids": [3]}, {"id": 4}])
+            self.assertEqual(responses[1], {"error": "Element not found."})
+
+    def test_rollback_per_period(self):
+        self.server.run("add", name="rent", value=-500, period="2000")
+
+        response = self.server.run(
+            "batch",
+            commands=[
+                {
+                    "command": "add",
+                    "name": "bus",
+                    "value": -2,
+                    "period": "2000"
+                },
+                {
+                    "command": "add",
+                    "name": "salary",
+                    "value": 1000,
+                    "period": "2001"
+                },
+                {
+                    "command": "rm",
+                    "eid": 42,
+                    "period": "2000"
+                },
+                {
+                    "command": "rm",
+                    "eid": 1,
+                    "period": "2000"
+                },
+            ])
+        aborted_error = {
+            "error":
+            "Transaction of period '2000' aborted due to a failed command."
+        }
+        self.assertEqual(response["results"], [
+            aborted_error, {
+                "id": 1
+            }, {
+                "error": "Element not found."
+            }, aborted_error
+        ])
+
+        elements = self.server.run("print", period="2000")["elements"]
+        self.assertEqual(len(elements[DEFAULT_TABLE]), 1)
+        self.assertEqual(elements[DEFAULT_TABLE][1]["name"], "rent")
+        elements = self.server.run("print", period="2001")["elements"]
+        self.assertEqual(len(elements[DEFAULT_TABLE]), 1)
+
+    def test_invalid_items(self):
+        response = self.server.run(
+            "batch", commands=[None, {
+                "name": "rent"
+            }, {
+                "command": "stop"
+            }])
+        self.assertEqual(response["results"], [
+            {
+                "error": "Invalid batch item."
+            },
+            {
+                "error": "Invalid batch item."
+            },
+            {
+                "error": "Command 'stop' not allowed in batch."
+            },
+        ])
+
+    def test_unexpected_error(self):
+        self.server.run("add", name="rent", value=-500, period="2000")
+
+        response = self.server.run(
+            "batch",
+            commands=[
+                {
+                    "command": "print",
+                    "filters": {
+                        "name": "("
+                    },
+                    "period": "2000"
+                },
+                {
+                    "command": "rm",
+                    "eid": 1,
+                    "period": "2000"
+                },
+                {
+                    "command": "add",
+                    "name": "salary",
+                    "value": 1000,
+                    "period": "2001"
+                },
+                {
+                    "command": "get",
+                    "period": "2000"
+                },
+                {
+                    "command": "add_many",
+                    "entries": ["oops"],
+                    "period": "2002"
+                },
+                {
+                    "command": "rm",
+                    "eid": "x",
+                    "period": "2000"
+                },
+            ])
+        results = response["results"]
+        self.assertEqual(
+            results[1], {
+                "error":
+                "Transaction of period '2000' aborted due to a failed command."
+            })
+        self.assertEqual(results[2], {"id": 1})
+        for result, command in zip(results[:1] + results[3:],
+                                   ["print", "get", "add_many", "rm"]):
+            self.assertTrue(result["error"].startswith(
+                "Command '{}' failed: ".format(command)))
+
+        # The removal has been rolled back, and the lock has been released
+        response = self.server.run("get", eid=1, period="2000")
+        self.assertEqual(response["element"]["name"], "rent")
+        self.assertEqual(self.server.run("rm", eid=1, period="2000"), {"id": 1})
+        response = self.server.run("print", period="2001")
+        self.assertEqual(len(response["elements"][DEFAULT_TABLE]), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
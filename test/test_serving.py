@@ -0,0 +1,139 @@
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from financeager.fflask import create_app
+from financeager.serving import ThreadingWSGIServer
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="financeager-")
+
+
+@mock.patch("financeager.DATA_DIR", TEST_DATA_DIR)
+class ThreadingWSGIServerTestCase(unittest.TestCase):
+    def start_server(self, keep_alive):
+        self.server = ThreadingWSGIServer(("127.0.0.1", 0),
+                                          keep_alive=keep_alive)
+        self.server.set_app(create_app())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        return http.client.HTTPConnection(*self.server.server_address)
+
+    def request(self, connection, method, url, data=None):
+        headers = {}
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers["Content-Type"] = "application/json"
+        connection.request(method, url, body=body, headers=headers)
+        response = connection.getresponse()
+        return response, json.loads(response.read().decode())
+
+    def test_keep_alive(self):
+        connection = self.start_server(keep_alive=5)
+
+        response, content = self.request(connection, "POST", "/periods/1900", {
+            "name": "beer",
+            "value": -3
+        })
+        self.assertEqual(response.status, 200)
+        self.assertFalse(response.will_close)
+        sock = connection.sock
+
+        # Request with body that is not read by the app
+        response, content = self.request(connection, "POST", "/periods",
+                                         {"unused": "x" * 1000})
+        self.assertListEqual(content["periods"], ["1900"])
+
+        response, content = self.request(connection, "GET",
+                                         "/periods/1900/standard/1")
+        self.assertEqual(content["element"]["name"], "beer")
+        # All requests were sent via the same connection
+        self.assertIs(connection.sock, sock)
+        connection.close()
+
+    def test_no_keep_alive(self):
+        connection = self.start_server(keep_alive=0)
+
+        response, content = self.request(connection, "POST", "/periods")
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.will_close)
+        connection.close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class ServeCommandTestCase(unittest.TestCase):
+    # Additional options for the serve command
+    OPTIONS = []
+
+    def setUp(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+
+        self.data_dir = tempfile.mkdtemp(prefix="financeager-")
+        env = dict(os.environ, HOME=self.data_dir)
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "financeager.cli", "serve", "--port",
+                str(self.port), "--workers", "2", "--data-dir", self.data_dir
+            ] + self.OPTIONS,
+            env=env,
+            stderr=subprocess.DEVNULL)
+
+    def connect(self):
+        for _ in range(50):
+            try:
+                return socket.create_connection(("127.0.0.1", self.port))
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        self.fail("Server did not start")
+
+    def test_serve(self):
+        self.connect().close()
+
+        for i in range(4):
+            connection = http.client.HTTPConnection("127.0.0.1", self.port)
+            connection.request(
+                "POST",
+                "/periods/1900",
+                body=json.dumps({
+                    "name": "beer",
+                    "value": -i
+                }),
+                headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            self.assertEqual(json.loads(response.read().decode())["id"], i + 1)
+            connection.close()
+
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=10), 0)
+
+        with open(os.path.join(self.data_dir, "1900.json")) as file:
+            self.assertEqual(len(json.load(file)["standard"]), 4)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class AsyncioServeCommandTestCase(ServeCommandTestCase):
+    OPTIONS = ["--frontend", "asyncio", "--threads", "2"]
+
+
+if __name__ == "__main__":
+    unittest.main()